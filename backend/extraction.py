@@ -0,0 +1,99 @@
+"""Document text extraction (PDF pages, DOCX, image OCR).
+
+These functions run in the backend's extraction worker processes (see
+DOCUMENT EXTRACTION in server.py), so this module must stay importable on its
+own: only the parsers, no FastAPI, database or configuration imports.
+A document (`source`) is either its bytes or the path of a file holding it;
+paths are what the server passes, so only a short string is pickled to the
+worker and the file is read (PDFs: memory-mapped) where it is parsed.
+"""
+
+import io
+import mmap
+from contextlib import contextmanager
+from typing import List, Optional, Tuple, Union
+
+import PyPDF2
+
+Source = Union[bytes, str]
+
+
+@contextmanager
+def _pdf_stream(source: Source):
+    if isinstance(source, (bytes, bytearray)):
+        yield io.BytesIO(source)
+        return
+    with open(source, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
+
+
+def extract_pdf_pages(source: Source, start: int = 0, stop: Optional[int] = None) -> Tuple[str, int]:
+    """Text of pages [start, stop) one per line, and the document's page count.
+
+    Pages that fail to extract are left empty instead of failing the file.
+    """
+    with _pdf_stream(source) as stream:
+        reader = PyPDF2.PdfReader(stream)
+        total = len(reader.pages)
+        parts: List[str] = []
+        for index in range(start, total if stop is None else min(stop, total)):
+            try:
+                parts.append(reader.pages[index].extract_text() or "")
+            except Exception:
+                parts.append("")
+    return "\n".join(parts), total
+
+
+def extract_docx(source: Source) -> str:
+    try:
+        from docx import Document  # python-docx
+    except Exception:
+        raise RuntimeError("DOCX support requires 'python-docx' package")
+
+    doc = Document(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    parts: List[str] = []
+    for p in doc.paragraphs:
+        t = (p.text or "").strip()
+        if t:
+            parts.append(t)
+    return "\n".join(parts).strip()
+
+
+def extract_image_text(source: Source, tesseract_cmd: str = "", lang: str = "eng") -> str:
+    """Best-effort OCR.
+
+    - Uses pytesseract (requires system Tesseract + Pillow).
+    - If the packages are not installed, returns an empty string (caller can decide fallback).
+    - Raises RuntimeError when Tesseract itself is missing.
+    """
+    try:
+        from PIL import Image
+        import pytesseract
+        from pytesseract import TesseractNotFoundError
+    except Exception:
+        return ""
+
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    # Detect missing system Tesseract early for a clearer error.
+    try:
+        _ = pytesseract.get_tesseract_version()
+    except TesseractNotFoundError:
+        raise RuntimeError(
+            "OCR is not configured (Tesseract not found). Install Tesseract OCR and add it to PATH, "
+            "or set TESSERACT_CMD to the full path of tesseract.exe (e.g. C:/Program Files/Tesseract-OCR/tesseract.exe)."
+        )
+    except Exception:
+        # If version check fails for some other reason, keep best-effort behavior.
+        pass
+
+    try:
+        img = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+        # Ensure a common color mode for OCR
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        text = pytesseract.image_to_string(img, lang=lang)
+        return (text or "").strip()
+    except Exception:
+        return ""
@@ -223,3 +223,223 @@ CREATE TABLE IF NOT EXISTS personal_goals (
     created_at TEXT NOT NULL,
     updated_at TEXT NOT NULL
 );
+
+-- Versioned migrations (see SQLITE_MIGRATIONS in server.py)
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TEXT NOT NULL
+);
+
+-- Migration 1: per-user history ordered by time
+CREATE INDEX IF NOT EXISTS idx_learning_history_user_created ON learning_history(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_code_evaluations_user_created ON code_evaluations(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_resume_analyses_user_created ON resume_analyses(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_interview_evaluations_user_created ON interview_evaluations(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_activity_events_user_created ON activity_events(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_users_role_created ON users(role, created_at);
+
+-- Migration 2: activity analytics by event type
+CREATE INDEX IF NOT EXISTS idx_activity_events_user_type_created ON activity_events(user_id, event_type, created_at);
+
+-- Migration 4: per-user rollup maintained by the insert helpers
+-- (rebuild/verify with: python tools/user_stats.py rebuild|check)
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id TEXT PRIMARY KEY,
+    code_count INTEGER NOT NULL DEFAULT 0,
+    code_passed INTEGER NOT NULL DEFAULT 0,
+    code_score_sum REAL NOT NULL DEFAULT 0,
+    code_score_count INTEGER NOT NULL DEFAULT 0,
+    resume_count INTEGER NOT NULL DEFAULT 0,
+    resume_score_sum REAL NOT NULL DEFAULT 0,
+    resume_score_count INTEGER NOT NULL DEFAULT 0,
+    interview_count INTEGER NOT NULL DEFAULT 0,
+    interview_score_sum REAL NOT NULL DEFAULT 0,
+    interview_score_count INTEGER NOT NULL DEFAULT 0,
+    learning_count INTEGER NOT NULL DEFAULT 0,
+    last_activity_at TEXT,
+    updated_at TEXT NOT NULL
+);
+
+-- Migration 5: daily activity counters behind the analytics trend series
+-- (scope is "role:<role>" or "company:<id>"; rebuild with:
+-- python tools/user_stats.py rebuild-activity)
+CREATE TABLE IF NOT EXISTS activity_daily (
+    scope TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    day TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, metric, day)
+);
+
+-- Migration 6: AI token usage per user, endpoint and UTC day
+CREATE TABLE IF NOT EXISTS ai_usage_daily (
+    user_id TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    day TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, endpoint, day)
+);
+
+-- Migration 7: sliding-window quota counters (QUOTA_BACKEND=sqlite)
+-- key is "<action>:<user_id>", bucket is an hourly slot number
+CREATE TABLE IF NOT EXISTS quota_counters (
+    key TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (key, bucket)
+);
+
+-- Migration 8: background job queue (code/resume/interview evaluations)
+-- status: queued | running | succeeded | failed; a running job holds a
+-- lease (unix time) and is picked up again if it expires
+CREATE TABLE IF NOT EXISTS background_jobs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    error_status INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_background_jobs_status_created ON background_jobs(status, created_at);
+CREATE INDEX IF NOT EXISTS idx_background_jobs_user_created ON background_jobs(user_id, created_at);
+
+-- Migration 9: tutor context chunks for retrieval (rebuilt from tutor_contexts
+-- by the migration). The FTS5 index is only created when SQLite has FTS5.
+CREATE TABLE IF NOT EXISTS tutor_context_chunks (
+    id INTEGER PRIMARY KEY,
+    context_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    tokens INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tutor_context_chunks_context ON tutor_context_chunks(context_id, position);
+CREATE VIRTUAL TABLE IF NOT EXISTS tutor_context_chunks_fts USING fts5(
+    content, content='tutor_context_chunks', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS tutor_context_chunks_ai AFTER INSERT ON tutor_context_chunks BEGIN
+    INSERT INTO tutor_context_chunks_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS tutor_context_chunks_ad AFTER DELETE ON tutor_context_chunks BEGIN
+    INSERT INTO tutor_context_chunks_fts(tutor_context_chunks_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+
+-- Migration 10: full-text search over learning history, tutor contexts and
+-- resume analyses (/api/search). search_docs maps search_fts rowids to source
+-- rows; triggers on the source tables keep both in sync (see _SEARCH_SOURCES
+-- in server.py). The view, FTS5 table and triggers are only created with FTS5.
+-- Migration 13 made search_fts external-content over the search_content view,
+-- so the text is only stored in the source tables.
+CREATE TABLE IF NOT EXISTS search_docs (
+    rowid INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    created_at TEXT,
+    UNIQUE (kind, doc_id)
+);
+CREATE VIEW IF NOT EXISTS search_content AS
+SELECT d.rowid AS doc_rowid, replace(d.user_id, '-', '') AS user_key,
+       COALESCE(t.topic, '') AS title,
+       COALESCE(t.question, '') || char(10) || COALESCE(t.response, '') AS body
+FROM search_docs d JOIN learning_history t ON t.id = d.doc_id WHERE d.kind = 'learning'
+UNION ALL
+SELECT d.rowid, replace(d.user_id, '-', ''),
+       COALESCE(t.source_name, t.source_url, ''),
+       t.text_content
+FROM search_docs d JOIN tutor_contexts t ON t.id = d.doc_id WHERE d.kind = 'context'
+UNION ALL
+SELECT d.rowid, replace(d.user_id, '-', ''),
+       COALESCE(t.filename, ''),
+       COALESCE(t.text_content, '') || char(10) || COALESCE(t.analysis, '')
+FROM search_docs d JOIN resume_analyses t ON t.id = d.doc_id WHERE d.kind = 'resume';
+CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+    user_key, title, body, content='search_content', content_rowid='doc_rowid', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS learning_history_search_ai AFTER INSERT ON learning_history BEGIN
+    INSERT INTO search_docs (kind, doc_id, user_id, created_at) VALUES ('learning', new.id, new.user_id, new.created_at);
+    INSERT INTO search_fts (rowid, user_key, title, body) VALUES (
+        (SELECT rowid FROM search_docs WHERE kind = 'learning' AND doc_id = new.id),
+        replace(new.user_id, '-', ''),
+        COALESCE(new.topic, ''),
+        COALESCE(new.question, '') || char(10) || COALESCE(new.response, '')
+    );
+END;
+CREATE TRIGGER IF NOT EXISTS learning_history_search_ad AFTER DELETE ON learning_history BEGIN
+    INSERT INTO search_fts (search_fts, rowid, user_key, title, body) VALUES (
+        'delete',
+        (SELECT rowid FROM search_docs WHERE kind = 'learning' AND doc_id = old.id),
+        replace(old.user_id, '-', ''),
+        COALESCE(old.topic, ''),
+        COALESCE(old.question, '') || char(10) || COALESCE(old.response, '')
+    );
+    DELETE FROM search_docs WHERE kind = 'learning' AND doc_id = old.id;
+END;
+-- ... plus an AFTER UPDATE trigger ('delete' of the old text, then insert of
+-- the new), and the same three for tutor_contexts ('context') and
+-- resume_analyses ('resume').
+
+-- Migration 11: uploads deduplicated by SHA-256. extraction_cache keeps the
+-- text extracted from an upload per extractor (pdf, docx, ocr, resume_pdf);
+-- upload_blobs has one stored file per hash, refs counting the rows using it.
+CREATE TABLE IF NOT EXISTS upload_blobs (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    refs INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    last_used_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_upload_blobs_orphans ON upload_blobs(refs, last_used_at);
+CREATE TABLE IF NOT EXISTS extraction_cache (
+    sha256 TEXT NOT NULL,
+    extractor TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    last_used_at TEXT NOT NULL,
+    PRIMARY KEY (sha256, extractor)
+);
+CREATE INDEX IF NOT EXISTS idx_extraction_cache_last_used ON extraction_cache(last_used_at);
+ALTER TABLE resume_analyses ADD COLUMN file_sha256 TEXT;
+CREATE TRIGGER IF NOT EXISTS resume_analyses_blob_ai AFTER INSERT ON resume_analyses
+WHEN new.file_sha256 IS NOT NULL BEGIN
+    UPDATE upload_blobs SET refs = refs + 1 WHERE sha256 = new.file_sha256;
+END;
+CREATE TRIGGER IF NOT EXISTS resume_analyses_blob_ad AFTER DELETE ON resume_analyses
+WHEN old.file_sha256 IS NOT NULL BEGIN
+    UPDATE upload_blobs SET refs = refs - 1 WHERE sha256 = old.file_sha256;
+END;
+CREATE TRIGGER IF NOT EXISTS users_role_activity_au AFTER UPDATE OF role ON users
+WHEN old.role IS NOT new.role BEGIN
+    UPDATE activity_daily SET count = count - 1
+    WHERE scope = 'role:' || old.role AND metric = 'signups' AND day = substr(new.created_at, 1, 10);
+    INSERT INTO activity_daily (scope, metric, day, count)
+    VALUES ('role:' || new.role, 'signups', substr(new.created_at, 1, 10), 1)
+    ON CONFLICT(scope, metric, day) DO UPDATE SET count = count + 1;
+    UPDATE activity_daily SET count = count - (
+        SELECT COUNT(*) FROM learning_history t WHERE t.user_id = new.id AND substr(t.created_at, 1, 10) = activity_daily.day
+    ) WHERE scope = 'role:' || old.role AND metric = 'learning_sessions'
+      AND day IN (SELECT substr(created_at, 1, 10) FROM learning_history WHERE user_id = new.id);
+    INSERT INTO activity_daily (scope, metric, day, count)
+    SELECT 'role:' || new.role, 'learning_sessions', substr(t.created_at, 1, 10), COUNT(*)
+    FROM learning_history t WHERE t.user_id = new.id GROUP BY 3
+    ON CONFLICT(scope, metric, day) DO UPDATE SET count = count + excluded.count;
+    UPDATE activity_daily SET count = count - (
+        SELECT COUNT(*) FROM code_evaluations t WHERE t.user_id = new.id AND substr(t.created_at, 1, 10) = activity_daily.day
+    ) WHERE scope = 'role:' || old.role AND metric = 'code_submissions'
+      AND day IN (SELECT substr(created_at, 1, 10) FROM code_evaluations WHERE user_id = new.id);
+    INSERT INTO activity_daily (scope, metric, day, count)
+    SELECT 'role:' || new.role, 'code_submissions', substr(t.created_at, 1, 10), COUNT(*)
+    FROM code_evaluations t WHERE t.user_id = new.id GROUP BY 3
+    ON CONFLICT(scope, metric, day) DO UPDATE SET count = count + excluded.count;
+END;
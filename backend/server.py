@@ -1,6 +1,6 @@
 # ==================== IMPORTS ====================
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, Query
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
@@ -9,13 +9,12 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 import uuid
 from datetime import datetime, timezone, timedelta, date
 import jwt
 import bcrypt
 import asyncio
-import PyPDF2
 import io
 import sqlite3
 import json
@@ -24,13 +23,32 @@ import secrets
 import smtplib
 from email.message import EmailMessage
 import hashlib
+import base64
 import re
 import shutil
-
-# OpenAI SDK
-# - AzureOpenAI: for Azure OpenAI resources (requires endpoint + deployment)
-# - OpenAI: for OpenAI Platform (openai.com) API keys
-from openai import AzureOpenAI, OpenAI
+import threading
+import time
+import bisect
+import copy
+import math
+import random
+import importlib.util
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager, suppress
+from abc import ABC, abstractmethod
+import anyio
+
+import extraction
+
+# OpenAI SDK (async clients, shared per provider - see AI PROVIDER CLIENTS)
+# - AsyncAzureOpenAI: for Azure OpenAI resources (requires endpoint + deployment)
+# - AsyncOpenAI: for OpenAI Platform (openai.com) API keys
+import openai
+from openai import AsyncAzureOpenAI, AsyncOpenAI
 
 
 from fastapi import FastAPI
@@ -72,6 +90,24 @@ class AchievementCategory(BaseModel):
     items: List[AchievementItem]
 
 
+class LeaderboardEntry(BaseModel):
+    rank: int
+    id: str
+    name: str
+    email: str
+    avg_code_score: float
+    code_submissions: int
+    total_points: float
+    role: str
+    created_at: str
+
+
+class LeaderboardRank(BaseModel):
+    rank: Optional[int] = None
+    total: int
+    entry: Optional[LeaderboardEntry] = None
+
+
 class AssistantChatRequest(BaseModel):
     message: str
     context_path: Optional[str] = None
@@ -157,7 +193,29 @@ load_dotenv(ROOT_DIR / ".env", override=dotenv_override)
 
 # Database Configuration
 DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///./learnovatex.db')
-SQLITE_DB_PATH = ROOT_DIR / 'learnovatex.db'
+SQLITE_DB_PATH = Path(os.environ.get('SQLITE_DB_PATH') or (ROOT_DIR / 'learnovatex.db'))
+
+# SQLite connection pool
+# - Readers: one long-lived connection per worker thread (asyncio.to_thread pool)
+# - Writer: a single shared connection; writes are serialized behind a lock
+SQLITE_POOL_MAX_READERS = int(os.environ.get('SQLITE_POOL_MAX_READERS', 32))
+SQLITE_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('SQLITE_CONNECT_TIMEOUT_SECONDS', 5))
+SQLITE_WRITER_WAIT_TIMEOUT_SECONDS = float(os.environ.get('SQLITE_WRITER_WAIT_TIMEOUT_SECONDS', 30))
+
+# SQLite storage engine settings (applied to every pooled connection)
+# WAL lets dashboard reads proceed while activity/history inserts are committing.
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL').strip().upper()
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').strip().upper()
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 16384))
+SQLITE_MMAP_SIZE_MB = int(os.environ.get('SQLITE_MMAP_SIZE_MB', 256))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or SQLITE_CONNECT_TIMEOUT_SECONDS * 1000)
+
+# Group commit: queued writes are applied by one background task, many per transaction
+SQLITE_WRITE_BATCH_MAX = int(os.environ.get('SQLITE_WRITE_BATCH_MAX', 64))
+SQLITE_WRITE_BATCH_WINDOW_MS = float(os.environ.get('SQLITE_WRITE_BATCH_WINDOW_MS', 2))
+
+# Leaderboard: full ranking cached in memory, re-ranked per user on code submission
+LEADERBOARD_CACHE_TTL_SECONDS = float(os.environ.get('LEADERBOARD_CACHE_TTL_SECONDS', 300))
 
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'learnovatex_super_secure_jwt_key_2026')
@@ -165,25 +223,112 @@ JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
 JWT_EXPIRATION_DAYS = int(os.environ.get('JWT_EXPIRATION_DAYS', 7))
 JWT_EXPIRATION_DELTA = timedelta(days=JWT_EXPIRATION_DAYS)
 
-# AI Mode Configuration: 'demo', 'azure', 'openai'
+# AI Mode Configuration: 'demo', 'azure', 'openai', 'fake' (offline load testing)
 AI_MODE = os.environ.get('AI_MODE', 'demo')
+# Backends the AI router spreads requests over and fails over between, e.g.
+# "azure,openai" (defaults to AI_MODE alone; unconfigured ones are skipped).
+# AI_MODE=demo still disables real AI.
+AI_PROVIDERS = [name.strip() for name in os.environ.get('AI_PROVIDERS', '').split(',') if name.strip()]
 
 # Azure OpenAI Configuration (for future use)
 AZURE_OPENAI_API_KEY = os.environ.get('AZURE_OPENAI_API_KEY', '')
 AZURE_OPENAI_ENDPOINT = os.environ.get('AZURE_OPENAI_ENDPOINT', '')
 AZURE_OPENAI_DEPLOYMENT = os.environ.get('AZURE_OPENAI_DEPLOYMENT', '')
+AZURE_OPENAI_API_VERSION = os.environ.get('AZURE_OPENAI_API_VERSION', '2024-02-01')
 
 # OpenAI (non-Azure) Configuration
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
 # Model name for OpenAI Platform (examples: gpt-4o-mini, gpt-4.1-mini)
 OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-4o-mini')
 
+# AI provider clients: one shared async client (HTTP connection pool) per
+# provider. Each limit can be overridden per provider, e.g.
+# AI_OPENAI_MAX_CONCURRENCY or AI_AZURE_REQUEST_TIMEOUT_SECONDS.
+AI_MAX_CONCURRENCY = int(os.environ.get('AI_MAX_CONCURRENCY', 16))
+AI_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('AI_QUEUE_TIMEOUT_SECONDS', 30))
+AI_REQUEST_TIMEOUT_SECONDS = float(os.environ.get('AI_REQUEST_TIMEOUT_SECONDS', 60))
+AI_CONNECT_TIMEOUT_SECONDS = float(os.environ.get('AI_CONNECT_TIMEOUT_SECONDS', 10))
+AI_MAX_CONNECTIONS = int(os.environ.get('AI_MAX_CONNECTIONS', 64))
+AI_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('AI_MAX_KEEPALIVE_CONNECTIONS', 16))
+AI_KEEPALIVE_EXPIRY_SECONDS = float(os.environ.get('AI_KEEPALIVE_EXPIRY_SECONDS', 60))
+# HTTP/2 needs the optional "h2" package (pip install "httpx[http2]").
+AI_HTTP2 = os.environ.get('AI_HTTP2', 'true').lower() == 'true'
+# Fake provider (AI_MODE=fake): canned completions after a simulated delay.
+AI_FAKE_LATENCY_MS = float(os.environ.get('AI_FAKE_LATENCY_MS', 300))
+AI_FAKE_JITTER_MS = float(os.environ.get('AI_FAKE_JITTER_MS', 100))
+AI_FAKE_ERROR_RATE = float(os.environ.get('AI_FAKE_ERROR_RATE', 0))
+# Provider health monitor: background reachability probe plus the outcome of
+# real calls; get_ai_response serves demo replies while a provider is unhealthy.
+AI_HEALTH_PROBE_INTERVAL_SECONDS = float(os.environ.get('AI_HEALTH_PROBE_INTERVAL_SECONDS', 30))
+AI_HEALTH_PROBE_TIMEOUT_SECONDS = float(os.environ.get('AI_HEALTH_PROBE_TIMEOUT_SECONDS', 3))
+AI_HEALTH_FAILURE_THRESHOLD = int(os.environ.get('AI_HEALTH_FAILURE_THRESHOLD', 3))
+# Tutor/assistant response cache (in-process). Exact hits match the
+# normalized prompt, system instruction and model; set a similarity threshold
+# (e.g. 0.85) to also reuse answers to near-identical questions (MinHash).
+AI_CACHE_ENABLED = os.environ.get('AI_CACHE_ENABLED', 'true').lower() == 'true'
+AI_CACHE_TTL_SECONDS = float(os.environ.get('AI_CACHE_TTL_SECONDS', 86400))
+AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', 2000))
+AI_CACHE_MAX_MB = float(os.environ.get('AI_CACHE_MAX_MB', 32))
+AI_CACHE_SIMILARITY_THRESHOLD = float(os.environ.get('AI_CACHE_SIMILARITY_THRESHOLD', 0))
+# Resilience: attempts with full-jitter exponential backoff, a global retry
+# budget (retries + hedges may add at most RATIO of recent requests, or
+# MIN_PER_SECOND when traffic is low), a circuit breaker per provider, and
+# optional hedging (second request once the first is slower than the given
+# latency percentile of recent calls; 0 disables).
+AI_MAX_ATTEMPTS = int(os.environ.get('AI_MAX_ATTEMPTS', 3))
+AI_RETRY_BASE_DELAY_MS = float(os.environ.get('AI_RETRY_BASE_DELAY_MS', 250))
+AI_RETRY_MAX_DELAY_MS = float(os.environ.get('AI_RETRY_MAX_DELAY_MS', 4000))
+AI_RETRY_BUDGET_RATIO = float(os.environ.get('AI_RETRY_BUDGET_RATIO', 0.2))
+AI_RETRY_BUDGET_MIN_PER_SECOND = float(os.environ.get('AI_RETRY_BUDGET_MIN_PER_SECOND', 1))
+AI_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('AI_BREAKER_FAILURE_THRESHOLD', 5))
+AI_BREAKER_RESET_SECONDS = float(os.environ.get('AI_BREAKER_RESET_SECONDS', 30))
+AI_HEDGE_PERCENTILE = float(os.environ.get('AI_HEDGE_PERCENTILE', 0))
+AI_HEDGE_MIN_SAMPLES = int(os.environ.get('AI_HEDGE_MIN_SAMPLES', 20))
+# Client-side rate limits per provider (0 = unlimited), normally set per
+# provider to match the account's quota, e.g. AI_AZURE_RPM / AI_AZURE_TPM.
+# Token reservations use the prompt estimate + max_tokens and are settled
+# with the usage the provider reports.
+AI_RPM = int(os.environ.get('AI_RPM', 0))
+AI_TPM = int(os.environ.get('AI_TPM', 0))
+# Router: a backend's score is its latency EWMA * (1 + PENALTY * error rate);
+# requests go to backends with probability proportional to 1 / score^2.
+AI_ROUTER_ERROR_PENALTY = float(os.environ.get('AI_ROUTER_ERROR_PENALTY', 4))
+# Prompt budgets (see PROMPT BUDGETS): tokens are counted with tiktoken when
+# it is installed, else estimated. Each endpoint's prompt budget and reply
+# cap can be overridden as AI_<ENDPOINT>_PROMPT_TOKENS / AI_<ENDPOINT>_MAX_TOKENS,
+# e.g. AI_TUTOR_PROMPT_TOKENS=3000.
+AI_TOKENIZER_ENCODING = os.environ.get('AI_TOKENIZER_ENCODING', 'o200k_base')
+AI_CONTEXT_WINDOW_TOKENS = int(os.environ.get('AI_CONTEXT_WINDOW_TOKENS', 128000))
+AI_MIN_COMPLETION_TOKENS = int(os.environ.get('AI_MIN_COMPLETION_TOKENS', 256))
+# Fault injection for testing, e.g. "timeout=0.1,unavailable=0.05,latency_ms=200"
+AI_FAULT_INJECTION = os.environ.get('AI_FAULT_INJECTION', '')
+
 # File Storage Configuration
 UPLOAD_DIR = os.environ.get('UPLOAD_DIR', 'uploads')
 RESUME_UPLOAD_DIR = os.environ.get('RESUME_UPLOAD_DIR', 'uploads/resumes')
 CODE_UPLOAD_DIR = os.environ.get('CODE_UPLOAD_DIR', 'uploads/code_submissions')
 MAX_FILE_SIZE_MB = int(os.environ.get('MAX_FILE_SIZE_MB', 5))
 TUTOR_CONTEXT_MAX_FILE_SIZE_MB = int(os.environ.get('TUTOR_CONTEXT_MAX_FILE_SIZE_MB', 20))
+# Tutor contexts are split into overlapping chunks at upload; a chat includes
+# the chunks that best match the question (FTS5/BM25) within its token budget.
+TUTOR_CONTEXT_CHUNK_CHARS = int(os.environ.get('TUTOR_CONTEXT_CHUNK_CHARS', 1500))
+TUTOR_CONTEXT_CHUNK_OVERLAP = int(os.environ.get('TUTOR_CONTEXT_CHUNK_OVERLAP', 150))
+# Uploads are hashed (SHA-256) on arrival: extracted text is cached per hash
+# and stored resume files are shared by hash with a reference count. Cached
+# text unused for UPLOAD_CACHE_DAYS and files nothing has referenced for
+# UPLOAD_ORPHAN_HOURS are pruned (0 keeps them forever).
+UPLOAD_CACHE_DAYS = int(os.environ.get('UPLOAD_CACHE_DAYS', 30))
+UPLOAD_ORPHAN_HOURS = int(os.environ.get('UPLOAD_ORPHAN_HOURS', 24))
+# Document extraction process pool (see DOCUMENT EXTRACTION)
+EXTRACT_WORKERS = int(os.environ.get('EXTRACT_WORKERS', min(4, os.cpu_count() or 1)))
+EXTRACT_TIMEOUT_SECONDS = float(os.environ.get('EXTRACT_TIMEOUT_SECONDS', 60))
+EXTRACT_MAX_PENDING = int(os.environ.get('EXTRACT_MAX_PENDING', 16))
+EXTRACT_PDF_PAGES_PER_TASK = int(os.environ.get('EXTRACT_PDF_PAGES_PER_TASK', 20))
+# Uploads are hashed and copied in chunks of this size (see UPLOAD
+# STREAMING); UPLOAD_TMP_DIR, where files awaiting extraction are written,
+# defaults to the system temp directory.
+UPLOAD_CHUNK_BYTES = int(os.environ.get('UPLOAD_CHUNK_BYTES', 1024 * 1024))
+UPLOAD_TMP_DIR = os.environ.get('UPLOAD_TMP_DIR', '').strip()
 TESSERACT_CMD = os.environ.get('TESSERACT_CMD', '').strip()
 TESSERACT_LANG = os.environ.get('TESSERACT_LANG', 'eng').strip() or 'eng'
 ALLOWED_RESUME_FORMATS = os.environ.get('ALLOWED_RESUME_FORMATS', 'pdf').split(',')
@@ -226,6 +371,33 @@ app.mount("/uploads", StaticFiles(directory=str(UPLOADS_ROOT)), name="uploads")
 MAX_DAILY_AI_REQUESTS = int(os.environ.get('MAX_DAILY_AI_REQUESTS', 20))
 MAX_CODE_SUBMISSIONS_PER_DAY = int(os.environ.get('MAX_CODE_SUBMISSIONS_PER_DAY', 50))
 MAX_INTERVIEWS_PER_DAY = int(os.environ.get('MAX_INTERVIEWS_PER_DAY', 5))
+# Quotas (see QUOTAS): the daily limits above are sliding 24-hour windows
+# per user (0 = unlimited); on top of them a per-user token bucket of
+# QUOTA_BURST requests, refilled at QUOTA_BURST_PER_MINUTE, absorbs bursts
+# across all limited endpoints. QUOTA_BACKEND=sqlite shares the daily
+# counters between worker processes through the database; "memory" keeps
+# them per process.
+QUOTA_ENABLED = os.environ.get('QUOTA_ENABLED', 'true').lower() == 'true'
+QUOTA_BACKEND = os.environ.get('QUOTA_BACKEND', 'memory').lower()
+QUOTA_BURST = int(os.environ.get('QUOTA_BURST', 10))
+QUOTA_BURST_PER_MINUTE = float(os.environ.get('QUOTA_BURST_PER_MINUTE', 30))
+
+# Background jobs (see JOBS): code, resume and interview evaluations run on a
+# bounded worker pool from a queue persisted in SQLite. A running job holds a
+# lease; if its worker dies, another worker picks it up after the lease
+# expires, up to JOB_MAX_ATTEMPTS runs.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 300))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 2))
+JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', 7))
+
+# Batch code evaluation: up to CODE_BATCH_MAX_ITEMS submissions per request;
+# with a real provider up to CODE_BATCH_PACK_SIZE of them share one AI
+# request, and at most CODE_BATCH_CONCURRENCY AI requests per batch run at once.
+CODE_BATCH_MAX_ITEMS = int(os.environ.get('CODE_BATCH_MAX_ITEMS', 50))
+CODE_BATCH_PACK_SIZE = int(os.environ.get('CODE_BATCH_PACK_SIZE', 5))
+CODE_BATCH_CONCURRENCY = int(os.environ.get('CODE_BATCH_CONCURRENCY', 4))
 
 # Logging Configuration
 LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
@@ -282,8 +454,12 @@ elif AI_MODE == 'openai' and OPENAI_API_KEY:
     print("✓ OpenAI configured - AI features will use real-time responses")
 elif AI_MODE in ('azure', 'openai'):
     print(f"⚠ {AI_MODE} mode selected but not configured - using demo mode")
+elif AI_MODE == 'fake':
+    print("ℹ Running with the fake AI provider - simulated latency, no network calls")
 else:
     print("ℹ Running in demo mode - AI features will use sample responses")
+if AI_PROVIDERS and AI_MODE != 'demo':
+    print(f"ℹ AI router backends: {', '.join(AI_PROVIDERS)}")
 
 # ==================== MODELS ====================
 
@@ -399,6 +575,10 @@ class CodeSubmission(BaseModel):
     solve_time_seconds: Optional[int] = None
 
 
+class CodeBatchRequest(BaseModel):
+    submissions: List[CodeSubmission]
+
+
 class ActivityEvent(BaseModel):
     event_type: str
     path: Optional[str] = None
@@ -673,7 +853,7 @@ def _create_reset_otp(email: str, ttl_minutes: int) -> str:
     now = datetime.now(timezone.utc)
     expires_at = now + timedelta(minutes=ttl_minutes)
 
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             """
             INSERT INTO password_reset_otps (id, email, otp_hash, expires_at, created_at, used_at, attempts)
@@ -687,37 +867,33 @@ def _create_reset_otp(email: str, ttl_minutes: int) -> str:
                 now.isoformat(),
             ),
         )
-        conn.commit()
     return otp
 
 
 def _mark_reset_otp_used(email: str) -> None:
     now = datetime.now(timezone.utc).isoformat()
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "UPDATE password_reset_otps SET used_at = ? WHERE email = ? AND used_at IS NULL",
             (now, email),
         )
-        conn.commit()
 
 
 def _increment_reset_otp_attempts(row_id: str) -> None:
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "UPDATE password_reset_otps SET attempts = COALESCE(attempts, 0) + 1 WHERE id = ?",
             (row_id,),
         )
-        conn.commit()
 
 
 def _update_user_password(email: str, new_password_hash: str) -> None:
     now = datetime.now(timezone.utc).isoformat()
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         cur = conn.execute(
             "UPDATE users SET password = ?, updated_at = ? WHERE email = ?",
             (new_password_hash, now, email),
         )
-        conn.commit()
         if cur.rowcount <= 0:
             raise HTTPException(status_code=404, detail="User not found")
 
@@ -778,10 +954,410 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     return user
 
 
+_SQLITE_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+_SQLITE_SYNCHRONOUS_MODES = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+def _configure_sqlite_connection(conn: sqlite3.Connection) -> None:
+    """Per-connection PRAGMAs (journal_mode is set once per database in _init_sqlite_db)."""
+    synchronous = SQLITE_SYNCHRONOUS if SQLITE_SYNCHRONOUS in _SQLITE_SYNCHRONOUS_MODES else "NORMAL"
+    conn.execute(f"PRAGMA busy_timeout = {max(0, int(SQLITE_BUSY_TIMEOUT_MS))}")
+    conn.execute(f"PRAGMA synchronous = {synchronous}")
+    # Negative cache_size is interpreted by SQLite as KiB instead of pages.
+    conn.execute(f"PRAGMA cache_size = -{max(0, int(SQLITE_CACHE_SIZE_KB))}")
+    conn.execute(f"PRAGMA mmap_size = {max(0, int(SQLITE_MMAP_SIZE_MB)) * 1024 * 1024}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def _sqlite_storage_settings(conn: sqlite3.Connection) -> dict:
+    settings = {}
+    for pragma in ("journal_mode", "synchronous", "cache_size", "mmap_size", "busy_timeout"):
+        try:
+            row = conn.execute(f"PRAGMA {pragma}").fetchone()
+            settings[pragma] = row[0] if row else None
+        except sqlite3.Error:
+            settings[pragma] = None
+    return settings
+
+
+class _SQLiteConnectionPool:
+    """Long-lived SQLite connections shared across requests.
+
+    Each worker thread keeps its own reader connection (reused on every call),
+    while all writes go through one writer connection guarded by a lock so
+    concurrent inserts never fight over the database file lock.
+    """
+
+    def __init__(self, db_path: Path, max_readers: int, connect_timeout: float, writer_wait_timeout: float, on_connect=None):
+        self.db_path = db_path
+        self.on_connect = on_connect
+        self.max_readers = max(1, int(max_readers))
+        self.connect_timeout = connect_timeout
+        self.writer_wait_timeout = writer_wait_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._readers: Dict[int, tuple] = {}
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.RLock()
+        self._stats = {"hits": 0, "misses": 0, "waits": 0, "wait_seconds": 0.0, "overflow": 0, "closed_stale": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        # check_same_thread=False lets the pool close a dead thread's connection;
+        # each reader is still only ever used by the thread that opened it.
+        conn = sqlite3.connect(self.db_path, timeout=self.connect_timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        return conn
+
+    def _bump(self, key: str, amount=1) -> None:
+        with self._lock:
+            self._stats[key] += amount
+
+    def _close_stale_readers(self) -> None:
+        # Caller holds self._lock
+        alive = {t.ident for t in threading.enumerate()}
+        for ident in [i for i in self._readers if i not in alive]:
+            conn, _thread_name = self._readers.pop(ident)
+            try:
+                conn.close()
+            except Exception:
+                pass
+            self._stats["closed_stale"] += 1
+
+    def _reader(self) -> tuple:
+        """Return (connection, pooled) for the calling thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._bump("hits")
+            return conn, True
+
+        with self._lock:
+            if len(self._readers) >= self.max_readers:
+                self._close_stale_readers()
+            if len(self._readers) >= self.max_readers:
+                self._stats["overflow"] += 1
+                pooled = False
+            else:
+                self._stats["misses"] += 1
+                pooled = True
+
+        conn = self._connect()
+        if pooled:
+            thread = threading.current_thread()
+            with self._lock:
+                self._readers[thread.ident] = (conn, thread.name)
+            self._local.conn = conn
+        return conn, pooled
+
+    @contextmanager
+    def reader(self):
+        if getattr(self._local, "writer_depth", 0) > 0:
+            # Reads issued while this thread holds the writer must see its
+            # uncommitted changes (read-modify-write helpers in a batch).
+            yield self._writer
+            return
+        conn, pooled = self._reader()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            if not pooled:
+                conn.close()
+
+    @contextmanager
+    def writer(self):
+        started = time.perf_counter()
+        acquired = self._writer_lock.acquire(blocking=False)
+        if not acquired:
+            acquired = self._writer_lock.acquire(timeout=self.writer_wait_timeout)
+            with self._lock:
+                self._stats["waits"] += 1
+                self._stats["wait_seconds"] += time.perf_counter() - started
+            if not acquired:
+                raise sqlite3.OperationalError("Timed out waiting for the SQLite writer connection")
+
+        depth = getattr(self._local, "writer_depth", 0)
+        self._local.writer_depth = depth + 1
+        try:
+            if self._writer is None:
+                self._writer = self._connect()
+                self._bump("misses")
+            elif depth == 0:
+                self._bump("hits")
+            conn = self._writer
+            try:
+                yield conn
+                # Nested writer blocks share the outer transaction.
+                if depth == 0 and conn.in_transaction:
+                    conn.commit()
+            except BaseException:
+                if depth == 0 and conn.in_transaction:
+                    conn.rollback()
+                raise
+        finally:
+            self._local.writer_depth = depth
+            self._writer_lock.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = dict(self._stats)
+            readers = len(self._readers)
+        writer_open = self._writer is not None
+        lookups = data["hits"] + data["misses"] + data["overflow"]
+        data["wait_seconds"] = round(data["wait_seconds"], 4)
+        data["open_readers"] = readers
+        data["writer_open"] = writer_open
+        data["open"] = readers + (1 if writer_open else 0)
+        data["max_readers"] = self.max_readers
+        data["hit_rate"] = round(data["hits"] / lookups, 4) if lookups else 0.0
+        return data
+
+    def close_all(self) -> None:
+        with self._writer_lock:
+            if self._writer is not None:
+                try:
+                    self._writer.close()
+                except Exception:
+                    pass
+                self._writer = None
+        with self._lock:
+            for conn, _thread_name in self._readers.values():
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._readers.clear()
+        # Threads that still hold a closed connection will reconnect lazily.
+        self._local = threading.local()
+
+
+_sqlite_pool = _SQLiteConnectionPool(
+    SQLITE_DB_PATH,
+    max_readers=SQLITE_POOL_MAX_READERS,
+    connect_timeout=SQLITE_CONNECT_TIMEOUT_SECONDS,
+    writer_wait_timeout=SQLITE_WRITER_WAIT_TIMEOUT_SECONDS,
+    on_connect=_configure_sqlite_connection,
+)
+
+
 def _sqlite_connection():
-    conn = sqlite3.connect(SQLITE_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Pooled read connection for the calling thread (use as a context manager)."""
+    return _sqlite_pool.reader()
+
+
+def _sqlite_write_connection():
+    """The shared, serialized writer connection (use as a context manager)."""
+    return _sqlite_pool.writer()
+
+
+class _SQLiteWriteQueue:
+    """Serializes writes through one background task with group commit.
+
+    Callers await submit(fn, *args); the task drains whatever is queued (up to
+    SQLITE_WRITE_BATCH_MAX), runs every write on the writer connection inside a
+    single transaction and commits once. Each write gets its own SAVEPOINT so a
+    failing write only rolls back itself and its caller sees the exception.
+    """
+
+    def __init__(self, batch_max: int, batch_window_ms: float):
+        self.batch_max = max(1, int(batch_max))
+        self.batch_window = max(0.0, float(batch_window_ms)) / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._executor = None
+        self._stats = {"submitted": 0, "batches": 0, "committed": 0, "failed": 0, "max_batch": 0, "commit_seconds": 0.0}
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._run(), name="sqlite-write-queue")
+
+    async def submit(self, fn, *args, **kwargs):
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._stats["submitted"] += 1
+        await self._queue.put((fn, args, kwargs, future))
+        return await future
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            if self.batch_window:
+                await asyncio.sleep(self.batch_window)
+            while len(batch) < self.batch_max:
+                try:
+                    batch.append(queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+
+            started = time.perf_counter()
+            try:
+                outcomes = await self._loop.run_in_executor(self._executor, self._apply_batch, batch)
+            except Exception as e:
+                outcomes = [(False, e)] * len(batch)
+
+            self._stats["batches"] += 1
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+            self._stats["commit_seconds"] += time.perf_counter() - started
+            for (_fn, _args, _kwargs, future), (ok, value) in zip(batch, outcomes):
+                self._stats["committed" if ok else "failed"] += 1
+                if future.done():
+                    pass
+                elif ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+            for _ in batch:
+                queue.task_done()
+
+    def _apply_batch(self, batch: list) -> list:
+        outcomes = []
+        with _sqlite_write_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for index, (fn, args, kwargs, _future) in enumerate(batch):
+                savepoint = f"w{index}"
+                conn.execute(f"SAVEPOINT {savepoint}")
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    conn.execute(f"ROLLBACK TO {savepoint}")
+                    conn.execute(f"RELEASE {savepoint}")
+                    outcomes.append((False, e))
+                else:
+                    conn.execute(f"RELEASE {savepoint}")
+                    outcomes.append((True, result))
+        return outcomes
+
+    def stats(self) -> dict:
+        data = dict(self._stats)
+        data["commit_seconds"] = round(data["commit_seconds"], 4)
+        data["queued"] = self._queue.qsize() if self._queue is not None else 0
+        data["running"] = bool(self._task is not None and not self._task.done())
+        data["avg_batch"] = round(data["committed"] / data["batches"], 2) if data["batches"] else 0.0
+        return data
+
+    async def stop(self) -> None:
+        if self._task is not None and self._loop is asyncio.get_running_loop():
+            # Let queued and in-flight writes commit before stopping.
+            await self._queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._queue = None
+
+
+_sqlite_write_queue = _SQLiteWriteQueue(SQLITE_WRITE_BATCH_MAX, SQLITE_WRITE_BATCH_WINDOW_MS)
+
+
+async def run_sqlite_write(fn, *args, **kwargs):
+    """Run a write helper through the group-commit writer task."""
+    return await _sqlite_write_queue.submit(fn, *args, **kwargs)
+
+
+# ==================== SINGLE FLIGHT ====================
+# Identical calls that overlap (a class opening the same tutor topic, a
+# dashboard refreshed repeatedly) share one execution: callers passing the
+# same (name, key) while a call is in flight await its result instead of
+# starting their own. Nothing is cached; the next call after it finishes
+# runs again. A caller that joins gets the result of a call started before
+# it arrived, which is fine for reads and AI answers but not for anything
+# that must observe the caller's own preceding write.
+
+class _SingleFlight:
+    """Coalesces concurrent identical async calls.
+
+    The call runs in its own task, so cancelling one caller (say, its client
+    disconnected) does not cancel it for the others; it is cancelled once
+    every caller has gone. An exception reaches every waiting caller.
+    Callers after the first get a deep copy of the result, so they cannot
+    mutate each other's. Per-key counters are kept for the most recently
+    used `tracked_keys` keys, labelled by a digest of the key.
+    """
+
+    def __init__(self, tracked_keys: int = 256):
+        self.tracked_keys = max(1, int(tracked_keys))
+        self._calls: Dict[tuple, dict] = {}
+        self._totals: Dict[str, Dict[str, int]] = {}
+        self._keys: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+
+    def _count(self, name: str, key, field: str) -> None:
+        totals = self._totals.setdefault(name, {"calls": 0, "executions": 0, "shared": 0, "errors": 0, "cancelled": 0})
+        totals[field] += 1
+        if field in ("executions", "shared"):
+            totals["calls"] += 1
+        label = f"{name}:{hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:12]}"
+        counters = self._keys.pop(label, None) or {"executions": 0, "shared": 0, "errors": 0, "cancelled": 0}
+        counters[field] += 1
+        self._keys[label] = counters
+        while len(self._keys) > self.tracked_keys:
+            self._keys.popitem(last=False)
+
+    def _forget(self, flight_key: tuple, call: dict) -> None:
+        if self._calls.get(flight_key) is call:
+            del self._calls[flight_key]
+
+    async def do(self, name: str, key, fn, *args, **kwargs):
+        """await fn(*args, **kwargs), shared with concurrent callers of the same (name, key)."""
+        flight_key = (name, key)
+        call = self._calls.get(flight_key)
+        leader = call is None
+        if leader:
+            call = {"task": asyncio.get_running_loop().create_task(fn(*args, **kwargs)), "waiters": 0}
+            self._calls[flight_key] = call
+            call["task"].add_done_callback(lambda _task: self._forget(flight_key, call))
+        self._count(name, key, "executions" if leader else "shared")
+
+        task = call["task"]
+        call["waiters"] += 1
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            call["waiters"] -= 1
+            if call["waiters"] == 0 and not task.done():
+                # Last caller gone; later callers start a fresh call.
+                self._forget(flight_key, call)
+                task.cancel()
+                self._count(name, key, "cancelled")
+            raise
+        except Exception:
+            call["waiters"] -= 1
+            if leader:
+                self._count(name, key, "errors")
+            raise
+        call["waiters"] -= 1
+        return result if leader else copy.deepcopy(result)
+
+    def running(self, name: str, key) -> Optional[asyncio.Task]:
+        """The task of the call in flight for (name, key), if any."""
+        call = self._calls.get((name, key))
+        return call["task"] if call else None
+
+    def stats(self) -> dict:
+        busiest = sorted(self._keys.items(), key=lambda item: item[1]["shared"], reverse=True)[:10]
+        return {
+            "in_flight": len(self._calls),
+            "calls": {name: dict(totals) for name, totals in self._totals.items()},
+            "top_keys": {label: dict(counters) for label, counters in busiest if counters["shared"]},
+        }
+
+
+_single_flight = _SingleFlight()
 
 
 def _row_to_dict(row: Optional[sqlite3.Row]) -> Optional[dict]:
@@ -789,7 +1365,10 @@ def _row_to_dict(row: Optional[sqlite3.Row]) -> Optional[dict]:
 
 
 def _init_sqlite_db():
-    with _sqlite_connection() as conn:
+    journal_mode = SQLITE_JOURNAL_MODE if SQLITE_JOURNAL_MODE in _SQLITE_JOURNAL_MODES else "WAL"
+    with _sqlite_write_connection() as conn:
+        # journal_mode is persistent for WAL and cannot change inside a transaction.
+        conn.execute(f"PRAGMA journal_mode = {journal_mode}")
         conn.execute(
             """
             CREATE TABLE IF NOT EXISTS users (
@@ -1218,10 +1797,758 @@ def _init_sqlite_db():
         except Exception:
             pass
 
+        _apply_sqlite_migrations(conn)
+
+
+# ==================== SCHEMA MIGRATIONS ====================
+# Ordered, append-only. Each entry runs once per database and is recorded in
+# schema_version; never edit a shipped migration, add a new one instead.
+# Steps are SQL strings or callables taking the writer connection (backfills).
+# Check new queries with: python tools/explain_queries.py --scans
+SQLITE_MIGRATIONS = [
+    (
+        1,
+        "user_created_at_indexes",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_learning_history_user_created ON learning_history(user_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_code_evaluations_user_created ON code_evaluations(user_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_resume_analyses_user_created ON resume_analyses(user_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_interview_evaluations_user_created ON interview_evaluations(user_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_activity_events_user_created ON activity_events(user_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_users_role_created ON users(role, created_at)",
+        ],
+    ),
+    (
+        2,
+        "activity_event_type_index",
+        [
+            # time_spent / page_view analytics filter on event_type before the date range.
+            "CREATE INDEX IF NOT EXISTS idx_activity_events_user_type_created ON activity_events(user_id, event_type, created_at)",
+        ],
+    ),
+    (
+        3,
+        "per_owner_lookup_indexes",
+        [
+            "CREATE INDEX IF NOT EXISTS idx_readiness_snapshots_user_date ON career_readiness_snapshots(user_id, snapshot_date)",
+            "CREATE INDEX IF NOT EXISTS idx_daily_action_locks_user_date ON daily_action_locks(user_id, action_date, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_apply_tracker_user_updated ON apply_tracker(user_id, updated_at)",
+            "CREATE INDEX IF NOT EXISTS idx_apply_tracker_user_url ON apply_tracker(user_id, url)",
+            "CREATE INDEX IF NOT EXISTS idx_personal_goals_user_created ON personal_goals(user_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_course_enrollments_user ON course_enrollments(user_id)",
+            "CREATE INDEX IF NOT EXISTS idx_internship_applications_user_date ON internship_applications(user_id, application_date)",
+            "CREATE INDEX IF NOT EXISTS idx_tests_company_created ON tests(company_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_job_postings_company_created ON job_postings(company_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_job_postings_status_created ON job_postings(status, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_assessments_company_created ON assessments(company_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_candidate_actions_company_candidate ON candidate_actions(company_id, candidate_id, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_candidate_actions_company_created ON candidate_actions(company_id, created_at)",
+            # Databases created from schema.sql have announcements.college_id instead.
+            lambda conn: _create_index_if_columns(conn, "idx_announcements_admin_created", "announcements", ("college_admin_id", "created_at")),
+        ],
+    ),
+    (
+        4,
+        "user_stats_rollup",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id TEXT PRIMARY KEY,
+                code_count INTEGER NOT NULL DEFAULT 0,
+                code_passed INTEGER NOT NULL DEFAULT 0,
+                code_score_sum REAL NOT NULL DEFAULT 0,
+                code_score_count INTEGER NOT NULL DEFAULT 0,
+                resume_count INTEGER NOT NULL DEFAULT 0,
+                resume_score_sum REAL NOT NULL DEFAULT 0,
+                resume_score_count INTEGER NOT NULL DEFAULT 0,
+                interview_count INTEGER NOT NULL DEFAULT 0,
+                interview_score_sum REAL NOT NULL DEFAULT 0,
+                interview_score_count INTEGER NOT NULL DEFAULT 0,
+                learning_count INTEGER NOT NULL DEFAULT 0,
+                last_activity_at TEXT,
+                updated_at TEXT NOT NULL
+            );
+            """,
+            lambda conn: _rebuild_user_stats(conn),
+        ],
+    ),
+    (
+        5,
+        "activity_daily_rollup",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS activity_daily (
+                scope TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                day TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (scope, metric, day)
+            );
+            """,
+            lambda conn: _rebuild_activity_daily(conn),
+        ],
+    ),
+    (
+        6,
+        "ai_usage_daily",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS ai_usage_daily (
+                user_id TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                day TEXT NOT NULL,
+                requests INTEGER NOT NULL DEFAULT 0,
+                prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                completion_tokens INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, endpoint, day)
+            );
+            """,
+        ],
+    ),
+    (
+        7,
+        "quota_counters",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS quota_counters (
+                key TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (key, bucket)
+            );
+            """,
+        ],
+    ),
+    (
+        8,
+        "background_jobs",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS background_jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                error_status INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL,
+                created_at TEXT NOT NULL,
+                started_at TEXT,
+                finished_at TEXT
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_background_jobs_status_created ON background_jobs(status, created_at)",
+            "CREATE INDEX IF NOT EXISTS idx_background_jobs_user_created ON background_jobs(user_id, created_at)",
+        ],
+    ),
+    (
+        9,
+        "tutor_context_chunks",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS tutor_context_chunks (
+                id INTEGER PRIMARY KEY,
+                context_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                tokens INTEGER NOT NULL
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_tutor_context_chunks_context ON tutor_context_chunks(context_id, position)",
+            lambda conn: _create_tutor_chunk_index(conn),
+            lambda conn: _rebuild_tutor_context_chunks(conn),
+        ],
+    ),
+    (
+        10,
+        "search_index",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS search_docs (
+                rowid INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                created_at TEXT,
+                UNIQUE (kind, doc_id)
+            );
+            """,
+            lambda conn: _create_search_index(conn),
+        ],
+    ),
+    (
+        11,
+        "upload_dedup",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS upload_blobs (
+                sha256 TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                refs INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT NOT NULL,
+                last_used_at TEXT NOT NULL
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_upload_blobs_orphans ON upload_blobs(refs, last_used_at);",
+            """
+            CREATE TABLE IF NOT EXISTS extraction_cache (
+                sha256 TEXT NOT NULL,
+                extractor TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                last_used_at TEXT NOT NULL,
+                PRIMARY KEY (sha256, extractor)
+            );
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_extraction_cache_last_used ON extraction_cache(last_used_at);",
+            # schema.sql already declares the column.
+            lambda conn: _add_column_if_missing(conn, "resume_analyses", "file_sha256", "TEXT"),
+            # refs counts the analyses pointing at a stored file.
+            """
+            CREATE TRIGGER IF NOT EXISTS resume_analyses_blob_ai AFTER INSERT ON resume_analyses
+            WHEN new.file_sha256 IS NOT NULL BEGIN
+                UPDATE upload_blobs SET refs = refs + 1 WHERE sha256 = new.file_sha256;
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS resume_analyses_blob_ad AFTER DELETE ON resume_analyses
+            WHEN old.file_sha256 IS NOT NULL BEGIN
+                UPDATE upload_blobs SET refs = refs - 1 WHERE sha256 = old.file_sha256;
+            END;
+            """,
+        ],
+    ),
+    (
+        12,
+        "role_activity_follows_role",
+        [
+            # Role-scoped rollup rows move with the user when their role changes.
+            """
+            CREATE TRIGGER IF NOT EXISTS users_role_activity_au AFTER UPDATE OF role ON users
+            WHEN old.role IS NOT new.role BEGIN
+                UPDATE activity_daily SET count = count - 1
+                WHERE scope = 'role:' || old.role AND metric = 'signups' AND day = substr(new.created_at, 1, 10);
+                INSERT INTO activity_daily (scope, metric, day, count)
+                VALUES ('role:' || new.role, 'signups', substr(new.created_at, 1, 10), 1)
+                ON CONFLICT(scope, metric, day) DO UPDATE SET count = count + 1;
+                UPDATE activity_daily SET count = count - (
+                    SELECT COUNT(*) FROM learning_history t WHERE t.user_id = new.id AND substr(t.created_at, 1, 10) = activity_daily.day
+                ) WHERE scope = 'role:' || old.role AND metric = 'learning_sessions'
+                  AND day IN (SELECT substr(created_at, 1, 10) FROM learning_history WHERE user_id = new.id);
+                INSERT INTO activity_daily (scope, metric, day, count)
+                SELECT 'role:' || new.role, 'learning_sessions', substr(t.created_at, 1, 10), COUNT(*)
+                FROM learning_history t WHERE t.user_id = new.id GROUP BY 3
+                ON CONFLICT(scope, metric, day) DO UPDATE SET count = count + excluded.count;
+                UPDATE activity_daily SET count = count - (
+                    SELECT COUNT(*) FROM code_evaluations t WHERE t.user_id = new.id AND substr(t.created_at, 1, 10) = activity_daily.day
+                ) WHERE scope = 'role:' || old.role AND metric = 'code_submissions'
+                  AND day IN (SELECT substr(created_at, 1, 10) FROM code_evaluations WHERE user_id = new.id);
+                INSERT INTO activity_daily (scope, metric, day, count)
+                SELECT 'role:' || new.role, 'code_submissions', substr(t.created_at, 1, 10), COUNT(*)
+                FROM code_evaluations t WHERE t.user_id = new.id GROUP BY 3
+                ON CONFLICT(scope, metric, day) DO UPDATE SET count = count + excluded.count;
+            END;
+            """,
+            # Rows counted under a user's earlier role before the trigger existed.
+            lambda conn: _rebuild_activity_daily(conn),
+        ],
+    ),
+    (
+        13,
+        "search_external_content",
+        [
+            # search_fts reads its text through the search_content view
+            # instead of keeping a copy; VACUUM returns the freed pages.
+            lambda conn: _recreate_search_index(conn),
+        ],
+    ),
+]
+
+
+def _sqlite_schema_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT MAX(version) AS version FROM schema_version").fetchone()
+    return int(row["version"] or 0) if row else 0
+
+
+def _create_index_if_columns(conn: sqlite3.Connection, index: str, table: str, columns: tuple) -> bool:
+    """CREATE INDEX unless `table` lacks one of `columns`."""
+    existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    missing = [column for column in columns if column not in existing]
+    if missing:
+        logger.warning(f"Skipping index {index}: {table} has no {', '.join(missing)} column")
+        return False
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {index} ON {table}({', '.join(columns)})")
+    return True
+
+
+def _add_column_if_missing(conn: sqlite3.Connection, table: str, column: str, declaration: str) -> bool:
+    existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column in existing:
+        return False
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+    return True
+
+
+def _apply_sqlite_migrations(conn: sqlite3.Connection) -> list:
+    """Run pending SQLITE_MIGRATIONS in order on the (already locked) writer connection.
+
+    Each migration and its schema_version row commit together, so one that
+    fails part-way leaves nothing behind and is retried on the next start.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        );
+        """
+    )
+    current = _sqlite_schema_version(conn)
+    applied = []
+    for version, name, statements in sorted(SQLITE_MIGRATIONS, key=lambda m: m[0]):
+        if version <= current:
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                (version, name, datetime.now(timezone.utc).isoformat()),
+            )
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        applied.append(version)
+        logger.info(f"Applied SQLite migration {version}: {name}")
+    if applied:
+        # Refresh planner statistics so the new indexes are picked up.
+        conn.execute("ANALYZE")
+    return applied
+
+
+# ==================== USER STATS ROLLUP ====================
+# user_stats keeps per-user counters/sums so dashboards, leaderboards and
+# college views read one row instead of aggregating history tables. The
+# _insert_* helpers update it in the same transaction as the history row;
+# python tools/user_stats.py rebuild|check backfills and verifies it.
+
+# kind -> (history table, score column, passed column)
+_USER_STATS_SOURCES = {
+    "code": ("code_evaluations", "score", "passed"),
+    "resume": ("resume_analyses", "credibility_score", None),
+    "interview": ("interview_evaluations", "readiness_score", None),
+    "learning": ("learning_history", None, None),
+}
+_USER_STATS_FIELDS = (
+    "code_count", "code_passed", "code_score_sum", "code_score_count",
+    "resume_count", "resume_score_sum", "resume_score_count",
+    "interview_count", "interview_score_sum", "interview_score_count",
+    "learning_count",
+)
+
+
+def _user_stats_select_sql(single_user: bool) -> str:
+    """SELECT computing user_stats rows from history (all users, or :user_id)."""
+    where = "WHERE user_id = :user_id" if single_user else ""
+    ids = " UNION ".join(f"SELECT user_id FROM {table} {where}" for table, _, _ in _USER_STATS_SOURCES.values())
+    columns = ["ids.user_id AS user_id"]
+    joins = []
+    last_parts = []
+    for kind, (table, score_col, passed_col) in _USER_STATS_SOURCES.items():
+        aggregates = ["COUNT(*) AS n", "MAX(created_at) AS last_at"]
+        columns.append(f"COALESCE({kind}.n, 0) AS {kind}_count")
+        if passed_col:
+            aggregates.append(f"SUM({passed_col}) AS passed")
+            columns.append(f"COALESCE({kind}.passed, 0) AS {kind}_passed")
+        if score_col:
+            aggregates.append(f"SUM({score_col}) AS score_sum")
+            aggregates.append(f"COUNT({score_col}) AS score_count")
+            columns.append(f"COALESCE({kind}.score_sum, 0) AS {kind}_score_sum")
+            columns.append(f"COALESCE({kind}.score_count, 0) AS {kind}_score_count")
+        joins.append(
+            f"LEFT JOIN (SELECT user_id, {', '.join(aggregates)} FROM {table} {where} GROUP BY user_id) {kind} "
+            f"ON {kind}.user_id = ids.user_id"
+        )
+        last_parts.append(f"COALESCE({kind}.last_at, '')")
+    columns.append(f"NULLIF(MAX({', '.join(last_parts)}), '') AS last_activity_at")
+    return f"SELECT {', '.join(columns)} FROM ({ids}) ids {' '.join(joins)}"
+
+
+def _rebuild_user_stats(conn: sqlite3.Connection, user_id: Optional[str] = None) -> int:
+    """Recompute user_stats from history (one user or everyone) on a writer connection."""
+    params = {"user_id": user_id} if user_id else {}
+    if user_id:
+        conn.execute("DELETE FROM user_stats WHERE user_id = ?", (user_id,))
+    else:
+        conn.execute("DELETE FROM user_stats")
+    fields = ", ".join(("user_id",) + _USER_STATS_FIELDS + ("last_activity_at",))
+    cur = conn.execute(
+        f"INSERT INTO user_stats ({fields}, updated_at) SELECT {fields}, :now FROM ({_user_stats_select_sql(bool(user_id))})",
+        {**params, "now": datetime.now(timezone.utc).isoformat()},
+    )
+    return cur.rowcount or 0
+
+
+def rebuild_user_stats(user_id: Optional[str] = None) -> int:
+    with _sqlite_write_connection() as conn:
+        return _rebuild_user_stats(conn, user_id)
+
+
+def check_user_stats(user_id: Optional[str] = None) -> List[dict]:
+    """Compare user_stats with a fresh aggregate; returns one entry per mismatched field."""
+    params = {"user_id": user_id} if user_id else {}
+    with _sqlite_connection() as conn:
+        expected = {row["user_id"]: dict(row) for row in conn.execute(_user_stats_select_sql(bool(user_id)), params)}
+        if user_id:
+            stored_rows = conn.execute("SELECT * FROM user_stats WHERE user_id = ?", (user_id,)).fetchall()
+        else:
+            stored_rows = conn.execute("SELECT * FROM user_stats").fetchall()
+    stored = {row["user_id"]: dict(row) for row in stored_rows}
+
+    mismatches = []
+    for uid in sorted(set(expected) | set(stored)):
+        want = expected.get(uid) or {}
+        have = stored.get(uid) or {}
+        for field in _USER_STATS_FIELDS:
+            if float(want.get(field) or 0) != float(have.get(field) or 0):
+                mismatches.append({"user_id": uid, "field": field, "expected": want.get(field) or 0, "actual": have.get(field) or 0})
+        # Deletes keep last_activity_at (the activity still happened), so only
+        # a rollup that lags behind history is inconsistent.
+        if (want.get("last_activity_at") or "") > (have.get("last_activity_at") or ""):
+            mismatches.append({"user_id": uid, "field": "last_activity_at", "expected": want.get("last_activity_at"), "actual": have.get("last_activity_at")})
+    return mismatches
+
+
+def _bump_user_stats(
+    conn: sqlite3.Connection,
+    user_id: str,
+    kind: str,
+    score: Any = None,
+    passed: bool = False,
+    created_at: Optional[str] = None,
+    sign: int = 1,
+) -> None:
+    """Apply one history row (sign=1) or its removal (sign=-1) to user_stats."""
+    _, score_col, passed_col = _USER_STATS_SOURCES[kind]
+    deltas = {f"{kind}_count": sign}
+    if passed_col:
+        deltas[f"{kind}_passed"] = sign if passed else 0
+    if score_col and score is not None:
+        deltas[f"{kind}_score_sum"] = sign * float(score)
+        deltas[f"{kind}_score_count"] = sign
+    columns = list(deltas)
+    updates = ", ".join(f"{col} = {col} + excluded.{col}" for col in columns)
+    conn.execute(
+        f"INSERT INTO user_stats (user_id, {', '.join(columns)}, last_activity_at, updated_at) "
+        f"VALUES (?, {', '.join('?' for _ in columns)}, ?, ?) "
+        f"ON CONFLICT(user_id) DO UPDATE SET {updates}, "
+        "last_activity_at = CASE WHEN excluded.last_activity_at > COALESCE(user_stats.last_activity_at, '') "
+        "THEN excluded.last_activity_at ELSE user_stats.last_activity_at END, "
+        "updated_at = excluded.updated_at",
+        (user_id, *deltas.values(), created_at if sign > 0 else None, datetime.now(timezone.utc).isoformat()),
+    )
+
+
+def _fetch_user_stats_row(user_id: str, conn: Optional[sqlite3.Connection] = None) -> dict:
+    """user_stats row for a user (zeros when they have no history yet)."""
+    if conn is None:
+        with _sqlite_connection() as conn:
+            return _fetch_user_stats_row(user_id, conn)
+    row = conn.execute("SELECT * FROM user_stats WHERE user_id = ?", (user_id,)).fetchone()
+    if not row:
+        return {**{field: 0 for field in _USER_STATS_FIELDS}, "user_id": user_id, "last_activity_at": None}
+    return dict(row)
+
+
+def _user_stats_avg(stats: dict, kind: str) -> float:
+    n = stats.get(f"{kind}_score_count") or 0
+    return float(stats.get(f"{kind}_score_sum") or 0) / n if n else 0.0
+
+
+# ==================== LEADERBOARD ====================
+# Students with at least one code submission, ranked by total points
+# (avg score x submissions), then average score. The full ranking is loaded
+# with one query over user_stats and kept as a sorted key list, so a page is
+# a slice and "my rank" is a bisect. Code submissions re-rank just the
+# submitting user; the whole board is reloaded after LEADERBOARD_CACHE_TTL_SECONDS
+# to pick up renames and new or removed accounts.
+
+_LEADERBOARD_SQL = """
+    SELECT
+        u.id, u.name, u.email, u.role, u.created_at,
+        us.code_count AS code_submissions,
+        COALESCE(us.code_score_sum / NULLIF(us.code_score_count, 0), 0) AS avg_code_score
+    FROM users u
+    JOIN user_stats us ON us.user_id = u.id
+    WHERE u.role = 'student' AND us.code_count > 0
+"""
+
+
+def _leaderboard_entry(row) -> dict:
+    avg_score = float(row["avg_code_score"] or 0)
+    submissions = int(row["code_submissions"] or 0)
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "email": row["email"],
+        "role": row["role"],
+        "created_at": row["created_at"],
+        "avg_code_score": round(avg_score, 2),
+        "code_submissions": submissions,
+        "total_points": round(avg_score * submissions, 2),
+    }
+
+
+def _leaderboard_key(entry: dict) -> tuple:
+    return (-entry["total_points"], -entry["avg_code_score"], -entry["code_submissions"], entry["id"])
+
+
+class _LeaderboardCache:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._keys: List[tuple] = []
+        self._entries: Dict[str, dict] = {}
+        self._loaded_at = 0.0
+        self._stats = {"loads": 0, "user_refreshes": 0, "hits": 0}
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded_at and time.monotonic() - self._loaded_at < self.ttl_seconds:
+            self._stats["hits"] += 1
+            return
+        with _sqlite_connection() as conn:
+            rows = conn.execute(_LEADERBOARD_SQL).fetchall()
+        entries = {row["id"]: _leaderboard_entry(row) for row in rows}
+        self._entries = entries
+        self._keys = sorted(_leaderboard_key(entry) for entry in entries.values())
+        self._loaded_at = time.monotonic()
+        self._stats["loads"] += 1
+
+    def page(self, limit: int, offset: int = 0) -> tuple:
+        """(entries with 1-based rank, total ranked users)."""
+        with self._lock:
+            self._ensure_loaded()
+            keys = self._keys[offset:offset + limit]
+            page = [{**self._entries[key[-1]], "rank": offset + i + 1} for i, key in enumerate(keys)]
+            return page, len(self._keys)
+
+    def rank_of(self, user_id: str) -> tuple:
+        """(rank or None, entry or None, total ranked users)."""
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None, None, len(self._keys)
+            rank = bisect.bisect_left(self._keys, _leaderboard_key(entry)) + 1
+            return rank, {**entry, "rank": rank}, len(self._keys)
+
+    def refresh_user(self, user_id: str) -> None:
+        """Re-rank one user after their code stats changed (no-op until the board is loaded)."""
+        with self._lock:
+            if not self._loaded_at:
+                return
+            with _sqlite_connection() as conn:
+                row = conn.execute(f"{_LEADERBOARD_SQL} AND u.id = ?", (user_id,)).fetchone()
+            old = self._entries.pop(user_id, None)
+            if old is not None:
+                index = bisect.bisect_left(self._keys, _leaderboard_key(old))
+                if index < len(self._keys) and self._keys[index] == _leaderboard_key(old):
+                    self._keys.pop(index)
+            if row is not None:
+                entry = _leaderboard_entry(row)
+                self._entries[user_id] = entry
+                bisect.insort(self._keys, _leaderboard_key(entry))
+            self._stats["user_refreshes"] += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "ranked_users": len(self._keys), "ttl_seconds": self.ttl_seconds}
+
+
+_leaderboard = _LeaderboardCache(LEADERBOARD_CACHE_TTL_SECONDS)
+
+
+async def refresh_leaderboard_user(user_id: str) -> None:
+    try:
+        await asyncio.to_thread(_leaderboard.refresh_user, user_id)
+    except Exception as e:
+        # The TTL reload will catch up; never fail a submission over the cache.
+        logger.warning(f"Leaderboard refresh failed for {user_id}: {e}")
+
+
+# ==================== ACTIVITY ROLLUPS ====================
+# activity_daily holds one counter per (scope, metric, UTC day) so analytics
+# trends over a semester read ~100 rows per metric instead of scanning
+# history. Scopes: "role:<role>" for signups and learning/code activity by
+# user role, "company:<id>" for candidate actions and job postings. Write paths bump it
+# in the same transaction; hourly buckets are read from the raw tables. A
+# user's role-scoped rows follow them to a new role (users_role_activity_au
+# trigger), so counts are always by the user's current role.
+
+# (history table, scope kind, scope column, metric SQL) used to rebuild the
+# rollup; the scope is "<kind>:<column value>".
+_ACTIVITY_DAILY_SOURCES = [
+    ("learning_history t JOIN users u ON u.id = t.user_id", "role", "u.role", "'learning_sessions'"),
+    ("code_evaluations t JOIN users u ON u.id = t.user_id", "role", "u.role", "'code_submissions'"),
+    ("users t", "role", "t.role", "'signups'"),
+    ("candidate_actions t", "company", "t.company_id", "'action:' || t.action"),
+    ("job_postings t", "company", "t.company_id", "'job_postings'"),
+]
+ANALYTICS_GRANULARITIES = ("hour", "day", "week")
+ANALYTICS_MAX_DAYS = {"hour": 14, "day": 400, "week": 400}
+
+
+def _rebuild_activity_daily(conn: sqlite3.Connection) -> int:
+    conn.execute("DELETE FROM activity_daily")
+    total = 0
+    for table, kind, column, metric_sql in _ACTIVITY_DAILY_SOURCES:
+        cur = conn.execute(
+            f"""
+            INSERT INTO activity_daily (scope, metric, day, count)
+            SELECT '{kind}:' || {column}, {metric_sql}, substr(t.created_at, 1, 10), COUNT(*)
+            FROM {table}
+            GROUP BY 1, 2, 3
+            """
+        )
+        total += cur.rowcount or 0
+    return total
+
+
+def rebuild_activity_daily() -> int:
+    with _sqlite_write_connection() as conn:
+        return _rebuild_activity_daily(conn)
+
+
+def _bump_activity_daily(conn: sqlite3.Connection, scope: str, metric: str, created_at: str, delta: int = 1) -> None:
+    conn.execute(
+        "INSERT INTO activity_daily (scope, metric, day, count) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(scope, metric, day) DO UPDATE SET count = count + excluded.count",
+        (scope, metric, str(created_at)[:10], int(delta)),
+    )
+
+
+def _bump_role_activity(conn: sqlite3.Connection, user_id: str, metric: str, created_at: str, delta: int = 1) -> None:
+    row = conn.execute("SELECT role FROM users WHERE id = ?", (user_id,)).fetchone()
+    if row:
+        _bump_activity_daily(conn, f"role:{row['role']}", metric, created_at, delta)
+
+
+def _bucket_start(value: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return value.replace(minute=0, second=0, microsecond=0)
+    day = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "week":
+        # Monday-first weeks, same as the SQL bucket below.
+        day = day - timedelta(days=day.weekday())
+    return day
+
+
+def _bucket_key(value: datetime, granularity: str) -> str:
+    if granularity == "hour":
+        return value.strftime("%Y-%m-%dT%H:00")
+    return value.strftime("%Y-%m-%d")
+
+
+def _fetch_activity_series(scope: str, metrics: List[str], start: date, end: date, granularity: str = "day") -> List[dict]:
+    """Zero-filled buckets between start and end (inclusive days, UTC) for the given metrics."""
+    start_dt = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+    end_dt = datetime(end.year, end.month, end.day, tzinfo=timezone.utc) + timedelta(days=1)
+    names = {f"m{i}": metric for i, metric in enumerate(metrics)}
+    scope_kind, _, scope_value = scope.partition(":")
+    params: Dict[str, Any] = {
+        "scope": scope,
+        "scope_value": scope_value,
+        "start_day": start.isoformat(),
+        "end_day": end.isoformat(),
+        "start_ts": start_dt.isoformat(),
+        "end_ts": end_dt.isoformat(),
+        **names,
+    }
+    metric_in = ", ".join(f":{name}" for name in names)
+
+    if granularity == "hour":
+        # Too fine for the daily rollup; read the (indexed) history tables
+        # directly, comparing the bare scope column so its index applies.
+        parts = []
+        for table, kind, column, metric_sql in _ACTIVITY_DAILY_SOURCES:
+            if kind != scope_kind:
+                continue
+            parts.append(
+                f"SELECT {metric_sql} AS metric, substr(t.created_at, 1, 13) || ':00' AS bucket FROM {table} "
+                f"WHERE {column} = :scope_value AND t.created_at >= :start_ts AND t.created_at < :end_ts"
+            )
+        sql = (
+            f"SELECT bucket, metric, COUNT(*) AS count FROM ({' UNION ALL '.join(parts)}) "
+            f"WHERE metric IN ({metric_in}) GROUP BY bucket, metric"
+        )
+    else:
+        # Weeks start on Monday: step back (weekday + 6) % 7 days, %w being 0 for Sunday.
+        bucket_sql = "day" if granularity == "day" else "date(day, '-' || ((strftime('%w', day) + 6) % 7) || ' days')"
+        sql = (
+            f"SELECT {bucket_sql} AS bucket, metric, SUM(count) AS count FROM activity_daily "
+            f"WHERE scope = :scope AND metric IN ({metric_in}) AND day >= :start_day AND day <= :end_day "
+            f"GROUP BY bucket, metric"
+        )
+
+    with _sqlite_connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+
+    counts: Dict[str, Dict[str, int]] = {}
+    for row in rows:
+        counts.setdefault(row["bucket"], {})[row["metric"]] = int(row["count"] or 0)
+
+    step = timedelta(hours=1) if granularity == "hour" else timedelta(days=7 if granularity == "week" else 1)
+    series = []
+    cursor = _bucket_start(start_dt, granularity)
+    while cursor < end_dt:
+        key = _bucket_key(cursor, granularity)
+        bucket_counts = counts.get(key, {})
+        series.append({"bucket": key, **{metric: bucket_counts.get(metric, 0) for metric in metrics}})
+        cursor += step
+    return series
+
+
+def _bucket_label(bucket: str, granularity: str) -> str:
+    """Short chart label for a bucket key: "Mon" for days, "Mar 03" for weeks, "14:00" for hours."""
+    if granularity == "hour":
+        return bucket[11:]
+    day = datetime.strptime(bucket, "%Y-%m-%d")
+    return day.strftime("%a") if granularity == "day" else day.strftime("%b %d")
+
+
+def _resolve_analytics_range(start: Optional[date], end: Optional[date], granularity: str) -> tuple:
+    """Validate the query range (defaults: the last 7 days) for analytics endpoints."""
+    today = datetime.now(timezone.utc).date()
+    end = end or today
+    start = start or (end - timedelta(days=6))
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must be on or before end")
+    max_days = ANALYTICS_MAX_DAYS[granularity]
+    if (end - start).days + 1 > max_days:
+        raise HTTPException(status_code=400, detail=f"Range too large for {granularity} granularity (max {max_days} days)")
+    return start, end
+
 
 def _insert_sqlite_user(user_doc: dict) -> bool:
     try:
-        with _sqlite_connection() as conn:
+        with _sqlite_write_connection() as conn:
             cursor = conn.execute(
                 "INSERT INTO users (id, email, password, name, role, created_at) VALUES (?, ?, ?, ?, ?, ?)",
                 (
@@ -1233,7 +2560,7 @@ def _insert_sqlite_user(user_doc: dict) -> bool:
                     user_doc['created_at'],
                 ),
             )
-            conn.commit()
+            _bump_activity_daily(conn, f"role:{user_doc['role']}", "signups", user_doc['created_at'])
             return cursor.rowcount > 0
     except sqlite3.IntegrityError as e:
         logger.error(f"Failed to insert user: {e}")
@@ -1253,7 +2580,7 @@ def _get_sqlite_user(email: str) -> Optional[dict]:
 
 
 async def store_sqlite_user(user_doc: dict):
-    await asyncio.to_thread(_insert_sqlite_user, user_doc)
+    await run_sqlite_write(_insert_sqlite_user, user_doc)
 
 
 async def fetch_sqlite_user(email: str) -> Optional[dict]:
@@ -1277,7 +2604,7 @@ def _update_sqlite_user_profile(user_id: str, name: Optional[str], profile_data:
     updated_at = datetime.now(timezone.utc).isoformat()
     profile_json = json.dumps(profile_data) if profile_data is not None else None
 
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         if name is not None and profile_data is not None:
             conn.execute(
                 "UPDATE users SET name = ?, profile_data = ?, updated_at = ? WHERE id = ?",
@@ -1295,29 +2622,27 @@ def _update_sqlite_user_profile(user_id: str, name: Optional[str], profile_data:
             )
         else:
             return
-        conn.commit()
 
 
 async def update_sqlite_user_profile(user_id: str, name: Optional[str], profile_data: Optional[dict]):
-    await asyncio.to_thread(_update_sqlite_user_profile, user_id, name, profile_data)
+    await run_sqlite_write(_update_sqlite_user_profile, user_id, name, profile_data)
 
 
 def _update_sqlite_user_avatar(user_id: str, avatar_url: str):
     updated_at = datetime.now(timezone.utc).isoformat()
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "UPDATE users SET avatar_url = ?, updated_at = ? WHERE id = ?",
             (avatar_url, updated_at, user_id),
         )
-        conn.commit()
 
 
 async def update_sqlite_user_avatar(user_id: str, avatar_url: str):
-    await asyncio.to_thread(_update_sqlite_user_avatar, user_id, avatar_url)
+    await run_sqlite_write(_update_sqlite_user_avatar, user_id, avatar_url)
 
 
 def _insert_learning_history(history_doc: dict):
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "INSERT INTO learning_history (id, user_id, topic, difficulty, question, response, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
             (
@@ -1330,10 +2655,17 @@ def _insert_learning_history(history_doc: dict):
                 history_doc['created_at'],
             ),
         )
+        _bump_user_stats(conn, history_doc['user_id'], "learning", created_at=history_doc['created_at'])
+        _bump_role_activity(conn, history_doc['user_id'], "learning_sessions", history_doc['created_at'])
 
 
 def _insert_tutor_context(context_doc: dict):
-    with _sqlite_connection() as conn:
+    """Store a context and its retrieval chunks (context_doc["chunks"], from
+    _tutor_context_chunks; computed here when absent)."""
+    chunks = context_doc.get("chunks")
+    if chunks is None:
+        chunks = _tutor_context_chunks(context_doc["text_content"])
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "INSERT INTO tutor_contexts (id, user_id, kind, source_name, source_url, text_content, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
             (
@@ -1346,98 +2678,724 @@ def _insert_tutor_context(context_doc: dict):
                 context_doc["created_at"],
             ),
         )
-        conn.commit()
+        _insert_tutor_context_chunks(conn, context_doc["id"], context_doc["user_id"], chunks)
 
 
-def _select_tutor_contexts_by_ids(user_id: str, context_ids: List[str]) -> List[dict]:
-    if not context_ids:
-        return []
-    # Limit number of contexts fetched to avoid huge prompts
-    ids = [str(x) for x in context_ids if x]
-    ids = ids[:10]
-    placeholders = ",".join(["?"] * len(ids))
-    with _sqlite_connection() as conn:
-        cursor = conn.execute(
-            f"SELECT id, user_id, kind, source_name, source_url, text_content, created_at FROM tutor_contexts WHERE user_id = ? AND id IN ({placeholders}) ORDER BY created_at DESC",
-            (user_id, *ids),
-        )
-        rows = cursor.fetchall()
-    return [dict(r) for r in rows]
+async def store_tutor_context(context_doc: dict):
+    await run_sqlite_write(_insert_tutor_context, context_doc)
 
 
-async def store_tutor_context(context_doc: dict):
-    await asyncio.to_thread(_insert_tutor_context, context_doc)
+# Tutor context retrieval: each context's text is stored again as chunks in
+# tutor_context_chunks, indexed by the tutor_context_chunks_fts FTS5 table
+# (kept in sync by triggers). A chat reads only chunk metadata plus the
+# chunks it selects, never the full text_content blobs.
 
+_FTS_TERM_RE = re.compile(r"\w+")
+_FTS_STOPWORDS = frozenset(
+    "a an and are as at be by can do does explain for from how i in is it me my of on or please "
+    "tell that the this to was what when where which who why with you your".split()
+)
 
-async def fetch_tutor_contexts_by_ids(user_id: str, context_ids: List[str]) -> List[dict]:
-    return await asyncio.to_thread(_select_tutor_contexts_by_ids, user_id, context_ids)
 
+def _fts_query(text: str, max_terms: int = 32, operator: str = "OR", prefix_last: bool = False) -> str:
+    """FTS5 MATCH expression joining the distinct words of free text ("" if none).
 
-def _extract_text_from_pdf_bytes(contents: bytes) -> str:
-    pdf_file = io.BytesIO(contents)
-    pdf_reader = PyPDF2.PdfReader(pdf_file)
-    text_content = ""
-    for page in pdf_reader.pages:
-        try:
-            text_content += (page.extract_text() or "") + "\n"
-        except Exception:
+    Every term is quoted, so FTS operators typed by users are matched
+    literally; prefix_last makes the last word a prefix (search as you type).
+    """
+    terms: List[str] = []
+    for word in _FTS_TERM_RE.findall((text or "").lower()):
+        if len(word) < 2 or word in _FTS_STOPWORDS or word in terms:
             continue
-    return text_content.strip()
+        terms.append(word)
+    quoted = [f'"{term}"' for term in terms[:max_terms]]
+    if quoted and prefix_last and text == text.rstrip():
+        quoted[-1] += "*"
+    return f" {operator} ".join(quoted)
 
 
-def _extract_text_from_docx_bytes(contents: bytes) -> str:
+def _sqlite_fts5_available(conn: sqlite3.Connection) -> bool:
     try:
-        from docx import Document  # python-docx
-    except Exception:
-        raise RuntimeError("DOCX support requires 'python-docx' package")
-
-    doc = Document(io.BytesIO(contents))
-    parts: List[str] = []
-    for p in doc.paragraphs:
-        t = (p.text or "").strip()
-        if t:
-            parts.append(t)
-    return "\n".join(parts).strip()
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
 
 
-def _extract_text_from_image_bytes(contents: bytes) -> str:
-    """Best-effort OCR.
+def _create_tutor_chunk_index(conn: sqlite3.Connection) -> None:
+    if not _sqlite_fts5_available(conn):
+        logger.warning("SQLite has no FTS5; tutor chats will use the leading chunks of each context")
+        return
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS tutor_context_chunks_fts USING fts5("
+        "content, content='tutor_context_chunks', content_rowid='id', tokenize='porter unicode61')"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS tutor_context_chunks_ai AFTER INSERT ON tutor_context_chunks BEGIN "
+        "INSERT INTO tutor_context_chunks_fts(rowid, content) VALUES (new.id, new.content); END"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS tutor_context_chunks_ad AFTER DELETE ON tutor_context_chunks BEGIN "
+        "INSERT INTO tutor_context_chunks_fts(tutor_context_chunks_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+    )
+
+
+def _chunk_text(text: str, size: int, overlap: int) -> List[str]:
+    """Split text into ~size-char chunks, each starting ~overlap chars before
+    the previous one ended; cuts prefer paragraph, line, sentence and word
+    boundaries in the second half of the window."""
+    text = (text or "").strip()
+    size = max(200, size)
+    overlap = max(0, min(overlap, size // 4))
+    chunks: List[str] = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            window = text[start:end]
+            for separator in ("\n\n", "\n", ". ", " "):
+                cut = window.rfind(separator, size // 2)
+                if cut != -1:
+                    end = start + cut + len(separator)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        start = end - overlap
+        if overlap:
+            space = text.find(" ", start, end)
+            start = space + 1 if space != -1 else end
+    return chunks
+
+
+def _tutor_context_chunks(text: str) -> List[tuple]:
+    """[(content, tokens)] for a context's text."""
+    return [(chunk, _tokenizer.count(chunk)) for chunk in _chunk_text(text, TUTOR_CONTEXT_CHUNK_CHARS, TUTOR_CONTEXT_CHUNK_OVERLAP)]
+
+
+def _insert_tutor_context_chunks(conn: sqlite3.Connection, context_id: str, user_id: str, chunks: List[tuple]) -> None:
+    conn.executemany(
+        "INSERT INTO tutor_context_chunks (context_id, user_id, position, content, tokens) VALUES (?, ?, ?, ?, ?)",
+        [(context_id, user_id, position, content, tokens) for position, (content, tokens) in enumerate(chunks)],
+    )
+
+
+def _rebuild_tutor_context_chunks(conn: sqlite3.Connection) -> int:
+    """Re-chunk every tutor context (the FTS index follows via triggers)."""
+    conn.execute("DELETE FROM tutor_context_chunks")
+    rows = conn.execute("SELECT id, user_id, text_content FROM tutor_contexts").fetchall()
+    for row in rows:
+        _insert_tutor_context_chunks(conn, row["id"], row["user_id"], _tutor_context_chunks(row["text_content"]))
+    return len(rows)
+
+
+def rebuild_tutor_context_chunks() -> int:
+    with _sqlite_write_connection() as conn:
+        return _rebuild_tutor_context_chunks(conn)
+
+
+def _select_tutor_context_excerpts(user_id: str, context_ids: List[str], question: str, budget_tokens: int) -> List[dict]:
+    """The user's contexts (newest first) with the chunks to show, in document order.
+
+    Everything is included when it fits. Otherwise chunks are taken by BM25
+    rank against the question, then leading chunks of each context (round
+    robin) fill what is left, so broad questions ("summarize this") still
+    see the start of each document.
+    """
+    ids = [str(x) for x in context_ids if x][:10]
+    if not ids:
+        return []
+    placeholders = ",".join(["?"] * len(ids))
+    with _sqlite_connection() as conn:
+        contexts = [
+            dict(row)
+            for row in conn.execute(
+                f"SELECT id, kind, source_name, source_url FROM tutor_contexts WHERE user_id = ? AND id IN ({placeholders}) ORDER BY created_at DESC",
+                (user_id, *ids),
+            ).fetchall()
+        ]
+        if not contexts:
+            return []
+        ids = [context["id"] for context in contexts]
+        placeholders = ",".join(["?"] * len(ids))
+        meta = conn.execute(
+            f"SELECT id, context_id, position, tokens FROM tutor_context_chunks WHERE context_id IN ({placeholders}) ORDER BY context_id, position",
+            ids,
+        ).fetchall()
+
+        selected: Dict[int, tuple] = {}
+        if sum(row["tokens"] for row in meta) <= budget_tokens:
+            selected = {row["id"]: (row["context_id"], row["position"]) for row in meta}
+        else:
+            tokens_by_id = {row["id"]: row["tokens"] for row in meta}
+            used = 0
+            query = _fts_query(question)
+            ranked = []
+            if query:
+                try:
+                    ranked = conn.execute(
+                        f"SELECT c.id, c.context_id, c.position FROM tutor_context_chunks_fts "
+                        f"JOIN tutor_context_chunks c ON c.id = tutor_context_chunks_fts.rowid "
+                        f"WHERE tutor_context_chunks_fts MATCH ? AND c.context_id IN ({placeholders}) "
+                        f"ORDER BY bm25(tutor_context_chunks_fts) LIMIT 200",
+                        (query, *ids),
+                    ).fetchall()
+                except sqlite3.OperationalError as e:
+                    logger.warning(f"Tutor context search unavailable, using leading chunks: {e}")
+            by_context: Dict[str, List[sqlite3.Row]] = {}
+            for row in meta:
+                by_context.setdefault(row["context_id"], []).append(row)
+            leading = []
+            for position in range(max((len(rows) for rows in by_context.values()), default=0)):
+                leading.extend(rows[position] for rows in by_context.values() if position < len(rows))
+            for row in [*ranked, *leading]:
+                tokens = tokens_by_id.get(row["id"], 0)
+                if row["id"] in selected or used + tokens > budget_tokens:
+                    continue
+                selected[row["id"]] = (row["context_id"], row["position"])
+                used += tokens
+
+        contents = {}
+        chunk_ids = list(selected)
+        for offset in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[offset:offset + 500]
+            for row in conn.execute(
+                f"SELECT id, content FROM tutor_context_chunks WHERE id IN ({','.join(['?'] * len(batch))})",
+                batch,
+            ).fetchall():
+                contents[row["id"]] = row["content"]
+
+    for context in contexts:
+        chunks = sorted((position, chunk_id) for chunk_id, (context_id, position) in selected.items() if context_id == context["id"])
+        context["chunks"] = [(position, contents[chunk_id]) for position, chunk_id in chunks if chunk_id in contents]
+    return contexts
+
+
+async def fetch_tutor_context_excerpts(user_id: str, context_ids: List[str], question: str, budget_tokens: int) -> List[dict]:
+    return await asyncio.to_thread(_select_tutor_context_excerpts, user_id, context_ids, question, budget_tokens)
+
+
+# ==================== DOCUMENT EXTRACTION ====================
+# PDF parsing and OCR are CPU-bound, so they run on a dedicated, bounded
+# process pool (the parsers live in extraction.py, which workers import
+# without the rest of the server) instead of the default thread pool. Large
+# PDFs are split into page ranges extracted in parallel. A document that
+# exceeds EXTRACT_TIMEOUT_SECONDS fails, and its pool is killed and
+# replaced (a running task can't be cancelled otherwise); tasks of other
+# documents caught in that pool are retried once. With EXTRACT_MAX_PENDING
+# documents in flight, uploads get a 503 with Retry-After while background
+# jobs wait for a slot. EXTRACT_WORKERS=0 runs extraction in threads; a
+# timed-out thread runs on to the end, holding one of EXTRACT_MAX_PENDING
+# threads, so new documents wait behind it rather than pile up.
+
+_EXTRACT_FORMATS = ("pdf", "docx", "ocr")
+
+
+class _ExtractionService:
+    def __init__(self, workers: int, timeout_seconds: float, max_pending: int, pages_per_task: int):
+        self.workers = max(0, int(workers))
+        self.timeout_seconds = max(1.0, float(timeout_seconds))
+        self.max_pending = max(1, int(max_pending))
+        self.pages_per_task = max(1, int(pages_per_task))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending = 0
+        self._restarts = 0
+        self._stats = {
+            fmt: {"documents": 0, "pages": 0, "bytes": 0, "seconds": 0.0, "failed": 0, "timed_out": 0, "rejected": 0}
+            for fmt in _EXTRACT_FORMATS
+        }
+
+    @property
+    def mode(self) -> str:
+        return "process" if self.workers else "thread"
+
+    def _pool(self) -> Optional[ProcessPoolExecutor]:
+        with self._lock:
+            if self._executor is None and self.workers:
+                try:
+                    # spawn: workers must not inherit the server's threads and connections.
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+                except (OSError, NotImplementedError, ImportError) as e:
+                    logger.warning(f"No process pool for document extraction ({e}); using threads")
+                    self.workers = 0
+            return self._executor
+
+    def _kill_pool(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self._restarts += 1
+        # Queued tasks then fail with BrokenProcessPool and are retried.
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False)
+
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        # A thread can't be stopped, so one that timed out keeps its slot in
+        # this pool until it returns: at most max_pending extractions ever
+        # run at once, even after timeouts.
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.max_pending, thread_name_prefix="extract")
+            return self._threads
+
+    async def _submit(self, executor, deadline: float, fn, *args):
+        future = asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+        try:
+            return await asyncio.wait_for(future, max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            if isinstance(executor, ProcessPoolExecutor):
+                self._kill_pool(executor)
+            raise
 
-    - First tries pytesseract (requires system Tesseract + Pillow).
-    - If not available, returns empty string (caller can decide fallback).
+    async def _call(self, deadline: float, fn, *args):
+        if deadline - time.monotonic() <= 0:
+            raise asyncio.TimeoutError()
+        executor = self._pool()
+        if executor is None:
+            return await self._submit(self._thread_pool(), deadline, fn, *args)
+        try:
+            return await self._submit(executor, deadline, fn, *args)
+        except BrokenProcessPool:
+            # Another document's timeout (or a crashed worker) took the pool down.
+            self._kill_pool(executor)
+            executor = self._pool()
+            return await self._submit(executor or self._thread_pool(), deadline, fn, *args)
+
+    async def _extract_pdf(self, source, deadline: float) -> tuple:
+        # The first range also reports the page count; the rest run in parallel.
+        step = self.pages_per_task
+        text, total = await self._call(deadline, extraction.extract_pdf_pages, source, 0, step)
+        if total > step:
+            rest = await asyncio.gather(
+                *(self._call(deadline, extraction.extract_pdf_pages, source, start, start + step) for start in range(step, total, step))
+            )
+            text = "\n".join([text] + [part for part, _ in rest])
+        return text.strip(), total
+
+    async def _extract(self, fmt: str, source, deadline: float) -> tuple:
+        if fmt == "pdf":
+            return await self._extract_pdf(source, deadline)
+        if fmt == "docx":
+            return await self._call(deadline, extraction.extract_docx, source), 0
+        return await self._call(deadline, extraction.extract_image_text, source, _detect_tesseract_cmd(), TESSERACT_LANG), 1
+
+    def _ensure_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.max_pending)
+        return self._slots
+
+    async def extract(self, fmt: str, source, wait: bool = False) -> str:
+        """Text of a document (a file path, or bytes); fmt is "pdf", "docx" or
+        "ocr" (images).
+
+        Raises 503 when saturated (unless wait) and 422 on timeout; parser
+        errors propagate (RuntimeError for missing OCR/DOCX support).
+        """
+        if fmt not in self._stats:
+            raise ValueError(f"Unknown document format '{fmt}'")
+        stats = self._stats[fmt]
+        slots = self._ensure_slots()
+        if slots.locked() and not wait:
+            stats["rejected"] += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Too many documents are being processed right now. Please retry shortly.",
+                headers={"Retry-After": "5"},
+            )
+        async with slots:
+            self._pending += 1
+            started = time.monotonic()
+            try:
+                text, pages = await self._extract(fmt, source, started + self.timeout_seconds)
+            except asyncio.TimeoutError:
+                stats["timed_out"] += 1
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"This file took too long to process (over {int(self.timeout_seconds)}s). Try a smaller or simpler file.",
+                )
+            except Exception:
+                stats["failed"] += 1
+                raise
+            finally:
+                self._pending -= 1
+        stats["documents"] += 1
+        stats["pages"] += pages
+        stats["bytes"] += len(source) if isinstance(source, (bytes, bytearray)) else os.path.getsize(source)
+        stats["seconds"] += time.monotonic() - started
+        return text
+
+    def stats(self) -> dict:
+        formats = {}
+        for fmt, data in self._stats.items():
+            data = dict(data)
+            seconds = data["seconds"]
+            data["seconds"] = round(seconds, 3)
+            data["avg_ms"] = round(seconds * 1000.0 / data["documents"], 1) if data["documents"] else 0.0
+            data["pages_per_second"] = round(data["pages"] / seconds, 2) if seconds else 0.0
+            data["mb_per_second"] = round(data["bytes"] / 1048576.0 / seconds, 3) if seconds else 0.0
+            formats[fmt] = data
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "pool_restarts": self._restarts,
+            "formats": formats,
+        }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+            threads, self._threads = self._threads, None
+        for pool in (executor, threads):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+
+_extraction_service = _ExtractionService(
+    EXTRACT_WORKERS, EXTRACT_TIMEOUT_SECONDS, EXTRACT_MAX_PENDING, EXTRACT_PDF_PAGES_PER_TASK
+)
+
+
+async def extract_document_text(fmt: str, source, wait: bool = False) -> str:
+    return await _extraction_service.extract(fmt, str(source) if isinstance(source, Path) else source, wait=wait)
+
+
+# ==================== UPLOAD STREAMING ====================
+# By the time a handler runs, Starlette has spooled the multipart body to a
+# SpooledTemporaryFile (bodies over the upload limits are refused earlier,
+# from Content-Length). receive_upload() hashes that file where it is, in
+# UPLOAD_CHUNK_BYTES chunks, instead of copying it: a stored upload is
+# written once, straight to its destination, and only an extraction cache
+# miss writes a temp file (in UPLOAD_TMP_DIR) for the extraction workers.
+
+# Multipart framing and form fields on top of the file itself.
+_UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+_UPLOAD_LIMITS_MB = {
+    "/api/tutor/context/upload": TUTOR_CONTEXT_MAX_FILE_SIZE_MB,
+    "/api/resume/analyze": MAX_FILE_SIZE_MB,
+    "/api/profile/avatar": MAX_FILE_SIZE_MB,
+    "/api/premium/enroll-course": MAX_FILE_SIZE_MB,
+    "/api/premium/apply-internship": MAX_FILE_SIZE_MB,
+}
+
+
+class _ReceivedUpload:
+    """An uploaded file, hashed in place: its size and SHA-256.
+
+    Use as an async context manager; a temp copy made by materialize() is
+    removed on exit, or once the task passed to keep_until() has finished.
     """
+
+    def __init__(self, file, size: int, sha256: str):
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+        self._path: Optional[Path] = None
+        self._keep_until: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "_ReceivedUpload":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.discard()
+
+    def _write_to(self, dest: Path) -> None:
+        # Atomic: readers of dest never see a partial file.
+        tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            if self._path is not None:
+                shutil.copyfile(self._path, tmp)
+            else:
+                self.file.seek(0)
+                with open(tmp, "wb") as out:
+                    shutil.copyfileobj(self.file, out, UPLOAD_CHUNK_BYTES)
+            os.replace(tmp, dest)
+        except BaseException:
+            _remove_file_quietly(tmp)
+            raise
+
+    async def save_to(self, dest: Path) -> None:
+        await asyncio.to_thread(self._write_to, dest)
+
+    async def materialize(self) -> Path:
+        """Path of a temp file holding the upload (written on first call)."""
+        if self._path is None:
+            fd, name = tempfile.mkstemp(prefix="upload-", dir=UPLOAD_TMP_DIR or None)
+            os.close(fd)
+            path = Path(name)
+            try:
+                await asyncio.to_thread(self._write_to, path)
+            except BaseException:
+                await asyncio.to_thread(_remove_file_quietly, path)
+                raise
+            self._path = path
+        return self._path
+
+    def keep_until(self, task: Optional[asyncio.Task]) -> None:
+        """Keep the temp copy until `task` (an extraction reading it) is done."""
+        self._keep_until = task
+
+    async def discard(self) -> None:
+        path, self._path = self._path, None
+        if path is None:
+            return
+        task = self._keep_until
+        if task is not None and not task.done():
+            loop = asyncio.get_running_loop()
+            task.add_done_callback(lambda _task: loop.run_in_executor(None, _remove_file_quietly, path))
+            return
+        await asyncio.to_thread(_remove_file_quietly, path)
+
+
+def _remove_file_quietly(path: Path) -> None:
     try:
-        from PIL import Image
-        import pytesseract
-        from pytesseract import TesseractNotFoundError
-    except Exception:
-        return ""
+        path.unlink(missing_ok=True)
+    except OSError as e:
+        logger.warning(f"Could not remove {path}: {e}")
+
+
+def _hash_upload_file(file, max_bytes: int) -> Optional[tuple]:
+    """(size, sha256 hex) of a file object, or None once it passes max_bytes."""
+    hasher = hashlib.sha256()
+    size = 0
+    file.seek(0)
+    while True:
+        chunk = file.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            return None
+        hasher.update(chunk)
+    file.seek(0)
+    return size, hasher.hexdigest()
+
+
+async def receive_upload(file: UploadFile, max_mb: int, allow_empty: bool = False) -> _ReceivedUpload:
+    """Size and hash `file` (413 past max_mb, 400 when empty unless allow_empty)."""
+    max_bytes = int(max_mb) * 1024 * 1024
+    too_large = HTTPException(status_code=413, detail=f"File too large. Max {max_mb}MB")
+    # The multipart parser already knows the size; fail before reading anything.
+    if (getattr(file, "size", None) or 0) > max_bytes:
+        raise too_large
+    measured = await asyncio.to_thread(_hash_upload_file, file.file, max_bytes)
+    if measured is None:
+        raise too_large
+    size, sha256 = measured
+    if size == 0 and not allow_empty:
+        raise HTTPException(status_code=400, detail="Empty file")
+    return _ReceivedUpload(file.file, size, sha256)
+
+
+@app.middleware("http")
+async def _reject_oversized_uploads(request: Request, call_next):
+    # Before Starlette reads (and spools) the body; receive_upload() checks
+    # the file itself when the client sends no Content-Length.
+    limit_mb = _UPLOAD_LIMITS_MB.get(request.url.path) if request.method == "POST" else None
+    length = request.headers.get("content-length")
+    if limit_mb is not None and length and length.isdigit():
+        if int(length) > limit_mb * 1024 * 1024 + _UPLOAD_FORM_OVERHEAD_BYTES:
+            origin = request.headers.get("origin")
+            headers = {"Access-Control-Allow-Origin": origin, "Access-Control-Allow-Credentials": "true"} if origin else {}
+            return JSONResponse(status_code=413, content={"detail": f"File too large. Max {limit_mb}MB"}, headers=headers)
+    return await call_next(request)
+
+
+# ==================== UPLOAD CACHE ====================
+# Uploads are identified by their SHA-256. Extracted text (PDF/DOCX parsing,
+# OCR) is cached per (hash, extractor) in extraction_cache, so a re-uploaded
+# lecture PDF or resume skips parsing; concurrent uploads of the same file
+# share one extraction. Stored files live once per hash in upload_blobs,
+# whose refs column triggers on the referencing tables keep up to date.
+
+_upload_cache_stats = {"hits": 0, "misses": 0, "stored": 0, "blobs_reused": 0, "blobs_written": 0}
+
+
+def _fetch_extraction(sha256: str, extractor: str) -> Optional[sqlite3.Row]:
+    with _sqlite_connection() as conn:
+        return conn.execute(
+            "SELECT text, last_used_at FROM extraction_cache WHERE sha256 = ? AND extractor = ?",
+            (sha256, extractor),
+        ).fetchone()
+
+
+def _store_extraction(sha256: str, extractor: str, text: str) -> None:
+    now = datetime.now(timezone.utc).isoformat()
+    with _sqlite_write_connection() as conn:
+        conn.execute(
+            "INSERT INTO extraction_cache (sha256, extractor, text, created_at, last_used_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(sha256, extractor) DO UPDATE SET last_used_at = excluded.last_used_at",
+            (sha256, extractor, text, now, now),
+        )
+
+
+def _touch_extraction(sha256: str, extractor: str) -> None:
+    with _sqlite_write_connection() as conn:
+        conn.execute(
+            "UPDATE extraction_cache SET last_used_at = ? WHERE sha256 = ? AND extractor = ?",
+            (datetime.now(timezone.utc).isoformat(), sha256, extractor),
+        )
+
+
+async def _extract_and_cache(sha256: str, extractor: str, extract, *args) -> str:
+    text = await extract(*args)
+    # Empty results are not cached: OCR may be set up later, and scanned PDFs
+    # are rejected anyway.
+    if text:
+        await run_sqlite_write(_store_extraction, sha256, extractor, text)
+        _upload_cache_stats["stored"] += 1
+    return text
+
 
-    tesseract_cmd = _detect_tesseract_cmd()
-    if tesseract_cmd:
-        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+async def _cached_text(sha256: str, extractor: str) -> Optional[str]:
+    try:
+        row = await asyncio.to_thread(_fetch_extraction, sha256, extractor)
+    except sqlite3.Error as e:
+        logger.warning(f"Extraction cache lookup failed: {e}")
+        row = None
+    if row is not None:
+        _upload_cache_stats["hits"] += 1
+        # Keeps entries in use from being pruned; at most one write a day each.
+        if row["last_used_at"] < (datetime.now(timezone.utc) - timedelta(days=1)).isoformat():
+            await run_sqlite_write(_touch_extraction, sha256, extractor)
+        return row["text"]
+    _upload_cache_stats["misses"] += 1
+    return None
+
+
+async def cached_extraction(sha256: Optional[str], extractor: str, extract, *args) -> str:
+    """Text of an upload: from extraction_cache, else await extract(*args).
+
+    Exceptions from extract propagate and nothing is cached. Without a hash
+    (e.g. jobs queued before hashing) extract always runs. Concurrent misses
+    share one call per extract function, so a request's upload never joins
+    a background job's extraction or the other way round (see extract_upload_text).
+    """
+    if not sha256:
+        return await extract(*args)
+    text = await _cached_text(sha256, extractor)
+    if text is not None:
+        return text
+    return await _single_flight.do("extract", (sha256, extractor, extract), _extract_and_cache, sha256, extractor, extract, *args)
+
+
+async def extract_upload_text(upload: _ReceivedUpload, fmt: str) -> str:
+    """Text of a received upload ("pdf", "docx" or "ocr") through the extraction cache.
 
-    # Detect missing system Tesseract early for a clearer error.
+    Only a miss writes the upload to a temp file. Identical concurrent
+    uploads share the first one's extraction, which reads that request's
+    temp file, so the file is kept until the extraction is over even if
+    its request is gone first.
+    """
+    text = await _cached_text(upload.sha256, fmt)
+    if text is not None:
+        return text
+    path = await upload.materialize()
+    key = (upload.sha256, fmt, extract_document_text)
     try:
-        _ = pytesseract.get_tesseract_version()
-    except TesseractNotFoundError:
-        raise RuntimeError(
-            "OCR is not configured (Tesseract not found). Install Tesseract OCR and add it to PATH, "
-            "or set TESSERACT_CMD to the full path of tesseract.exe (e.g. C:/Program Files/Tesseract-OCR/tesseract.exe)."
+        return await _single_flight.do("extract", key, _extract_and_cache, upload.sha256, fmt, extract_document_text, fmt, path)
+    finally:
+        upload.keep_until(_single_flight.running("extract", key))
+
+
+def _stored_upload_blob(sha256: str) -> Optional[str]:
+    with _sqlite_connection() as conn:
+        row = conn.execute("SELECT path FROM upload_blobs WHERE sha256 = ?", (sha256,)).fetchone()
+    return row["path"] if row is not None and Path(row["path"]).is_file() else None
+
+
+def _store_upload_blob(sha256: str, size: int, path: Path, staged: Optional[Path]) -> Optional[str]:
+    """Path of the stored copy of an upload: the existing one, else `staged`
+    renamed to `path`; None if there is neither.
+
+    Runs on the writer so pruning can't remove a file being reused; the
+    upload was already written to `staged` outside it.
+    """
+    now = datetime.now(timezone.utc).isoformat()
+    with _sqlite_write_connection() as conn:
+        row = conn.execute("SELECT path FROM upload_blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        if row is not None and Path(row["path"]).is_file():
+            conn.execute("UPDATE upload_blobs SET last_used_at = ? WHERE sha256 = ?", (now, sha256))
+            _upload_cache_stats["blobs_reused"] += 1
+            return row["path"]
+        if staged is None:
+            return None
+        os.replace(staged, path)
+        conn.execute(
+            "INSERT INTO upload_blobs (sha256, path, size, refs, created_at, last_used_at) VALUES (?, ?, ?, 0, ?, ?) "
+            "ON CONFLICT(sha256) DO UPDATE SET path = excluded.path, size = excluded.size, last_used_at = excluded.last_used_at",
+            (sha256, str(path), size, now, now),
         )
-    except Exception:
-        # If version check fails for some other reason, keep best-effort behavior.
-        pass
+        _upload_cache_stats["blobs_written"] += 1
+        return str(path)
 
+
+async def store_upload_blob(upload: _ReceivedUpload, directory: Path, ext: str) -> str:
+    """Path of the stored copy of an upload, writing one only if none exists."""
+    path = directory / f"{upload.sha256}.{ext}"
+    staged = None
+    if await asyncio.to_thread(_stored_upload_blob, upload.sha256) is None:
+        staged = directory / f".{upload.sha256}.{uuid.uuid4().hex}.staged"
+        await upload.save_to(staged)
     try:
-        img = Image.open(io.BytesIO(contents))
-        # Ensure a common color mode for OCR
-        if img.mode not in ("RGB", "L"):
-            img = img.convert("RGB")
-        text = pytesseract.image_to_string(img, lang=TESSERACT_LANG)
-        return (text or "").strip()
-    except Exception:
-        return ""
+        stored = await run_sqlite_write(_store_upload_blob, upload.sha256, upload.size, path, staged)
+        if stored is None:
+            # Pruned between the check and the write: store it after all.
+            staged = directory / f".{upload.sha256}.{uuid.uuid4().hex}.staged"
+            await upload.save_to(staged)
+            stored = await run_sqlite_write(_store_upload_blob, upload.sha256, upload.size, path, staged)
+        return stored
+    finally:
+        # Left over when another request stored the same file first.
+        if staged is not None:
+            await asyncio.to_thread(_remove_file_quietly, staged)
+
+
+def _prune_upload_cache(cache_before: Optional[str], orphans_before: Optional[str]) -> dict:
+    """Drop cached text unused since cache_before and files with no references
+    since orphans_before (either None to skip)."""
+    removed = {"extractions": 0, "blobs": 0}
+    with _sqlite_write_connection() as conn:
+        if cache_before:
+            removed["extractions"] = conn.execute(
+                "DELETE FROM extraction_cache WHERE last_used_at < ?", (cache_before,)
+            ).rowcount
+        if orphans_before:
+            rows = conn.execute(
+                "SELECT sha256, path FROM upload_blobs WHERE refs <= 0 AND last_used_at < ?", (orphans_before,)
+            ).fetchall()
+            for row in rows:
+                try:
+                    Path(row["path"]).unlink(missing_ok=True)
+                except OSError as e:
+                    logger.warning(f"Could not remove {row['path']}: {e}")
+                    continue
+                conn.execute("DELETE FROM upload_blobs WHERE sha256 = ?", (row["sha256"],))
+                removed["blobs"] += 1
+    return removed
+
+
+def upload_cache_stats() -> dict:
+    data = dict(_upload_cache_stats)
+    lookups = data["hits"] + data["misses"]
+    data["hit_rate"] = round(data["hits"] / lookups, 4) if lookups else 0.0
+    return data
 
 
 def _youtube_video_id(url: str) -> Optional[str]:
@@ -1468,30 +3426,49 @@ def _truncate_text(text: str, max_chars: int) -> str:
     return s[:max_chars] + "\n... (truncated)"
 
 
+def _code_evaluation_row(eval_doc: dict) -> tuple:
+    return (
+        eval_doc['id'],
+        eval_doc['user_id'],
+        eval_doc['problem_id'],
+        eval_doc.get('topic'),
+        eval_doc.get('difficulty'),
+        eval_doc.get('solve_time_seconds'),
+        eval_doc['code'],
+        eval_doc['language'],
+        eval_doc['evaluation'],
+        1 if eval_doc['passed'] else 0,
+        eval_doc['suggestions'],
+        eval_doc['score'],
+        eval_doc['created_at'],
+    )
+
+
 def _insert_code_evaluation(eval_doc: dict):
-    with _sqlite_connection() as conn:
-        conn.execute(
+    _insert_code_evaluations([eval_doc])
+
+
+def _insert_code_evaluations(eval_docs: List[dict]):
+    """Store evaluations (and their rollup updates) in one transaction."""
+    with _sqlite_write_connection() as conn:
+        conn.executemany(
             "INSERT INTO code_evaluations (id, user_id, problem_id, topic, difficulty, solve_time_seconds, code, language, evaluation, passed, suggestions, score, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (
-                eval_doc['id'],
-                eval_doc['user_id'],
-                eval_doc['problem_id'],
-                eval_doc.get('topic'),
-                eval_doc.get('difficulty'),
-                eval_doc.get('solve_time_seconds'),
-                eval_doc['code'],
-                eval_doc['language'],
-                eval_doc['evaluation'],
-                1 if eval_doc['passed'] else 0,
-                eval_doc['suggestions'],
-                eval_doc['score'],
-                eval_doc['created_at'],
-            ),
+            [_code_evaluation_row(eval_doc) for eval_doc in eval_docs],
         )
+        for eval_doc in eval_docs:
+            _bump_user_stats(
+                conn,
+                eval_doc['user_id'],
+                "code",
+                score=eval_doc['score'],
+                passed=bool(eval_doc['passed']),
+                created_at=eval_doc['created_at'],
+            )
+            _bump_role_activity(conn, eval_doc['user_id'], "code_submissions", eval_doc['created_at'])
 
 
 def _insert_course_enrollment(enrollment_doc: dict):
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "INSERT INTO course_enrollments (id, user_id, course_id, course_title, enrollment_date, status, name, email, phone, address, qualification, experience, screenshot_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
             (
@@ -1513,7 +3490,7 @@ def _insert_course_enrollment(enrollment_doc: dict):
 
 
 def _insert_internship_application(application_doc: dict):
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "INSERT INTO internship_applications (id, user_id, internship_id, internship_title, application_date, status, company, location, duration, name, email, phone, address, qualification, experience, screenshot_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
             (
@@ -1547,7 +3524,7 @@ def _fetch_course_enrollments() -> List[dict]:
 
 
 def _update_enrollment_status(enrollment_id: str, status: str):
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "UPDATE course_enrollments SET status = ? WHERE id = ?",
             (status, enrollment_id),
@@ -1564,7 +3541,7 @@ def _fetch_internship_applications() -> List[dict]:
 
 
 def _update_application_status(application_id: str, status: str):
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "UPDATE internship_applications SET status = ? WHERE id = ?",
             (status, application_id),
@@ -1605,16 +3582,26 @@ def _fetch_code_submissions(user_id: str, limit: int = 100) -> List[dict]:
 
 
 def _delete_code_submission(user_id: str, submission_id: str) -> bool:
-    with _sqlite_connection() as conn:
-        cur = conn.execute(
+    with _sqlite_write_connection() as conn:
+        existing = conn.execute(
+            "SELECT score, passed, created_at FROM code_evaluations WHERE id = ? AND user_id = ?",
+            (submission_id, user_id),
+        ).fetchone()
+        if not existing:
+            return False
+        conn.execute(
             "DELETE FROM code_evaluations WHERE id = ? AND user_id = ?",
             (submission_id, user_id),
         )
-        conn.commit()
-        return bool(cur.rowcount and cur.rowcount > 0)
+        _bump_user_stats(conn, user_id, "code", score=existing["score"], passed=bool(existing["passed"]), sign=-1)
+        _bump_role_activity(conn, user_id, "code_submissions", existing["created_at"], -1)
+        return True
 
 
 def _count_table_rows(table: str, user_id: str) -> int:
+    for kind, (source_table, _, _) in _USER_STATS_SOURCES.items():
+        if source_table == table:
+            return int(_fetch_user_stats_row(user_id)[f"{kind}_count"] or 0)
     with _sqlite_connection() as conn:
         cursor = conn.execute(f"SELECT COUNT(*) as total FROM {table} WHERE user_id = ?", (user_id,))
         row = cursor.fetchone()
@@ -1622,27 +3609,21 @@ def _count_table_rows(table: str, user_id: str) -> int:
 
 
 def _get_avg_code_score(user_id: str) -> float:
-    with _sqlite_connection() as conn:
-        cursor = conn.execute("SELECT AVG(score) as avg_score FROM code_evaluations WHERE user_id = ?", (user_id,))
-        row = cursor.fetchone()
-    avg = row['avg_score']
-    return float(avg) if avg is not None else 0.0
+    return _user_stats_avg(_fetch_user_stats_row(user_id), "code")
 
 
 def _get_avg_resume_credibility(user_id: str) -> float:
-    with _sqlite_connection() as conn:
-        cursor = conn.execute("SELECT AVG(credibility_score) as avg_score FROM resume_analyses WHERE user_id = ?", (user_id,))
-        row = cursor.fetchone()
-    avg = row['avg_score']
-    return float(avg) if avg is not None else 0.0
+    return _user_stats_avg(_fetch_user_stats_row(user_id), "resume")
 
 
 def _get_avg_interview_readiness(user_id: str) -> float:
-    with _sqlite_connection() as conn:
-        cursor = conn.execute("SELECT AVG(readiness_score) as avg_score FROM interview_evaluations WHERE user_id = ?", (user_id,))
-        row = cursor.fetchone()
-    avg = row['avg_score']
-    return float(avg) if avg is not None else 0.0
+    return _user_stats_avg(_fetch_user_stats_row(user_id), "interview")
+
+
+def _learning_consistency_from_count(count: int) -> float:
+    # Assume 30 sessions in 30 days is perfect consistency (100)
+    # Scale accordingly, cap at 100
+    return min((count or 0) * (100.0 / 30.0), 100.0)
 
 
 def _calculate_learning_consistency(user_id: str) -> float:
@@ -1653,10 +3634,7 @@ def _calculate_learning_consistency(user_id: str) -> float:
         thirty_days_ago = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
         cursor = conn.execute("SELECT COUNT(*) as count FROM learning_history WHERE user_id = ? AND created_at >= ?", (user_id, thirty_days_ago))
         row = cursor.fetchone()
-        count = row['count']
-        # Assume 30 sessions in 30 days is perfect consistency (100)
-        # Scale accordingly, cap at 100
-        return min(count * (100.0 / 30.0), 100.0)
+        return _learning_consistency_from_count(row['count'])
 
 
 def _parse_iso_datetime(value: str) -> Optional[datetime]:
@@ -1677,7 +3655,10 @@ def _calculate_learning_streak_stats(user_id: str) -> dict:
         rows = cursor.fetchall()
 
     # sqlite3.Row supports dict-style indexing (row["col"]) but not .get()
-    timestamps = [r["created_at"] for r in rows if r and r["created_at"]]
+    return _learning_streak_from_timestamps([r["created_at"] for r in rows if r and r["created_at"]])
+
+
+def _learning_streak_from_timestamps(timestamps: List[str]) -> dict:
     datetimes = [dt for dt in (_parse_iso_datetime(ts) for ts in timestamps) if dt]
     if not datetimes:
         return {
@@ -1726,19 +3707,20 @@ async def get_learning_streak_stats(user_id: str) -> dict:
 
 
 async def store_learning_history(history_doc: dict):
-    await asyncio.to_thread(_insert_learning_history, history_doc)
+    await run_sqlite_write(_insert_learning_history, history_doc)
 
 
 async def store_course_enrollment(enrollment_doc: dict):
-    await asyncio.to_thread(_insert_course_enrollment, enrollment_doc)
+    await run_sqlite_write(_insert_course_enrollment, enrollment_doc)
 
 
 async def store_internship_application(application_doc: dict):
-    await asyncio.to_thread(_insert_internship_application, application_doc)
+    await run_sqlite_write(_insert_internship_application, application_doc)
 
 
 async def store_code_evaluation(eval_doc: dict):
-    await asyncio.to_thread(_insert_code_evaluation, eval_doc)
+    await run_sqlite_write(_insert_code_evaluation, eval_doc)
+    await refresh_leaderboard_user(eval_doc['user_id'])
 
 
 async def get_user_code_submissions(user_id: str) -> List[dict]:
@@ -1782,26 +3764,117 @@ async def calculate_learning_consistency(user_id: str) -> float:
 
 
 async def calculate_career_readiness_score(user_id: str) -> float:
+    return await _single_flight.do("career_readiness", user_id, _calculate_career_readiness_score, user_id)
+
+
+async def _calculate_career_readiness_score(user_id: str) -> float:
     # Calculate CRS based on weighted average of components
     coding_score = await get_avg_code_score(user_id)
     resume_score = await get_avg_resume_credibility(user_id)
     interview_score = await get_avg_interview_readiness(user_id)
     learning_score = await calculate_learning_consistency(user_id)
-    
+    return _career_readiness_score(coding_score, resume_score, interview_score, learning_score)
+
+
+def _career_readiness_score(coding_score: float, resume_score: float, interview_score: float, learning_score: float) -> float:
     # Weights: coding 30%, resume 25%, interview 25%, learning 20%
     crs = (coding_score * 0.3) + (resume_score * 0.25) + (interview_score * 0.25) + (learning_score * 0.2)
     return round(crs, 2)
 
 
-def _insert_resume_analysis(doc: dict):
+def _fetch_user_stats(user_id: str) -> dict:
+    """All dashboard counters, averages and streaks for a user on one connection.
+
+    Replaces the count_*/get_avg_*/streak helpers for callers that need most of
+    them at once; intermediate averages are shared with the readiness score.
+    """
+    since_30d = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+    params = {"user_id": user_id, "since_30d": since_30d}
     with _sqlite_connection() as conn:
+        # Counters/sums come from the user_stats rollup; only the 30-day
+        # learning window needs an (indexed) range count.
+        row = conn.execute(
+            """
+            SELECT
+                COALESCE(us.code_count, 0) AS code_submissions,
+                us.code_score_sum / NULLIF(us.code_score_count, 0) AS avg_code_score,
+                COALESCE(us.resume_count, 0) AS resume_analyses,
+                us.resume_score_sum / NULLIF(us.resume_score_count, 0) AS avg_resume_score,
+                COALESCE(us.interview_count, 0) AS interviews_taken,
+                us.interview_score_sum / NULLIF(us.interview_score_count, 0) AS avg_interview_score,
+                COALESCE(us.learning_count, 0) AS learning_sessions,
+                (SELECT COUNT(*) FROM learning_history
+                 WHERE user_id = :user_id AND created_at >= :since_30d) AS learning_sessions_30d,
+                ls.current_streak AS login_current_streak,
+                ls.longest_streak AS login_longest_streak,
+                ls.last_login_at AS login_last_login_at
+            FROM (SELECT :user_id AS user_id) u
+            LEFT JOIN user_stats us ON us.user_id = u.user_id
+            LEFT JOIN login_streaks ls ON ls.user_id = u.user_id
+            """,
+            params,
+        ).fetchone()
+        # Same windows as _calculate_learning_streak_stats / _get_coding_streak_for_ui.
+        timeline = conn.execute(
+            """
+            SELECT 'learning' AS kind, created_at, NULL AS passed FROM (
+                SELECT created_at FROM learning_history
+                WHERE user_id = :user_id ORDER BY created_at DESC LIMIT 5000
+            )
+            UNION ALL
+            SELECT 'code' AS kind, created_at, passed FROM (
+                SELECT created_at, passed FROM code_evaluations
+                WHERE user_id = :user_id ORDER BY created_at DESC LIMIT 500
+            )
+            """,
+            params,
+        ).fetchall()
+
+    avg_code = float(row["avg_code_score"]) if row["avg_code_score"] is not None else 0.0
+    avg_resume = float(row["avg_resume_score"]) if row["avg_resume_score"] is not None else 0.0
+    avg_interview = float(row["avg_interview_score"]) if row["avg_interview_score"] is not None else 0.0
+    learning_consistency = _learning_consistency_from_count(row["learning_sessions_30d"])
+
+    learning_timestamps = [r["created_at"] for r in timeline if r["kind"] == "learning" and r["created_at"]]
+    code_rows = [{"created_at": r["created_at"], "passed": bool(r["passed"])} for r in timeline if r["kind"] == "code"]
+    login_row = None
+    if row["login_last_login_at"] is not None or row["login_current_streak"] is not None:
+        login_row = {
+            "current_streak": int(row["login_current_streak"] or 0),
+            "longest_streak": int(row["login_longest_streak"] or 0),
+            "last_login_at": row["login_last_login_at"],
+        }
+
+    return {
+        "code_submissions": int(row["code_submissions"] or 0),
+        "avg_code_score": avg_code,
+        "resume_analyses": int(row["resume_analyses"] or 0),
+        "avg_resume_score": avg_resume,
+        "interviews_taken": int(row["interviews_taken"] or 0),
+        "avg_interview_score": avg_interview,
+        "learning_sessions": int(row["learning_sessions"] or 0),
+        "learning_consistency": learning_consistency,
+        "career_readiness_score": _career_readiness_score(avg_code, avg_resume, avg_interview, learning_consistency),
+        "learning_streak": _learning_streak_from_timestamps(learning_timestamps),
+        "login_streak": _login_streak_for_ui(login_row),
+        "coding_streak": _coding_streak_from_submissions(code_rows),
+    }
+
+
+async def get_user_stats(user_id: str) -> dict:
+    return await _single_flight.do("user_stats", user_id, asyncio.to_thread, _fetch_user_stats, user_id)
+
+
+def _insert_resume_analysis(doc: dict):
+    with _sqlite_write_connection() as conn:
         conn.execute(
-            "INSERT INTO resume_analyses (id, user_id, filename, file_url, text_content, credibility_score, projects_score, skills_score, experience_score, ats_score, fake_skills, suggestions, analysis, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            "INSERT INTO resume_analyses (id, user_id, filename, file_url, file_sha256, text_content, credibility_score, projects_score, skills_score, experience_score, ats_score, fake_skills, suggestions, analysis, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
             (
                 doc['id'],
                 doc['user_id'],
                 doc.get('filename'),
                 doc.get('file_url'),
+                doc.get('file_sha256'),
                 doc.get('text_content'),
                 doc.get('credibility_score'),
                 doc.get('projects_score'),
@@ -1814,6 +3887,7 @@ def _insert_resume_analysis(doc: dict):
                 doc['created_at'],
             ),
         )
+        _bump_user_stats(conn, doc['user_id'], "resume", score=doc.get('credibility_score'), created_at=doc['created_at'])
 
 
 def _row_to_resume(doc: sqlite3.Row) -> dict:
@@ -1846,7 +3920,7 @@ def _get_latest_resume(user_id: str) -> Optional[dict]:
 
 
 async def store_resume_analysis(doc: dict):
-    await asyncio.to_thread(_insert_resume_analysis, doc)
+    await run_sqlite_write(_insert_resume_analysis, doc)
 
 
 async def fetch_resume_history(user_id: str) -> List[dict]:
@@ -1881,7 +3955,7 @@ async def fetch_interview_history(user_id: str, limit: int = 50) -> List[dict]:
 
 
 def _insert_interview_evaluation(eval_doc: dict):
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "INSERT INTO interview_evaluations (id, user_id, interview_type, questions, answers, evaluation, readiness_score, confidence_score, communication_score, technical_depth_score, strengths, weaknesses, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
             (
@@ -1900,6 +3974,13 @@ def _insert_interview_evaluation(eval_doc: dict):
                 eval_doc['created_at'],
             ),
         )
+        _bump_user_stats(
+            conn,
+            eval_doc['user_id'],
+            "interview",
+            score=eval_doc.get('readiness_score'),
+            created_at=eval_doc['created_at'],
+        )
 
 
 def _clamp_0_100(value: Any) -> float:
@@ -2082,12 +4163,11 @@ def _select_daily_action_lock(user_id: str, action_date: str) -> Optional[dict]:
 def _insert_daily_action_lock(user_id: str, action_date: str, action: dict) -> dict:
     lock_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "INSERT INTO daily_action_locks (id, user_id, action_date, action_json, created_at) VALUES (?, ?, ?, ?, ?)",
             (lock_id, user_id, action_date, json.dumps(action), now),
         )
-        conn.commit()
     return action
 
 
@@ -2118,7 +4198,7 @@ def _upsert_weekly_checklist_state(user_id: str, week_start: str, done_map: dict
     state_id = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
     payload = done_map if isinstance(done_map, dict) else {}
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             """
             INSERT INTO weekly_checklist_states (id, user_id, week_start, done_json, created_at, updated_at)
@@ -2128,7 +4208,6 @@ def _upsert_weekly_checklist_state(user_id: str, week_start: str, done_map: dict
             """,
             (state_id, user_id, week_start, json.dumps(payload), now, now),
         )
-        conn.commit()
     return payload
 
 
@@ -2166,9 +4245,12 @@ def _compute_streak_from_dates(dates: List[date]) -> dict:
 
 
 def _get_coding_streak_for_ui(user_id: str, now: Optional[datetime] = None) -> dict:
-    dt = now or datetime.now(timezone.utc)
-    submissions = _fetch_code_submissions(user_id, 500)
+    return _coding_streak_from_submissions(_fetch_code_submissions(user_id, 500), now)
 
+
+def _coding_streak_from_submissions(submissions: List[dict], now: Optional[datetime] = None) -> dict:
+    """Coding streak from recent submissions (dicts with 'passed' and 'created_at')."""
+    dt = now or datetime.now(timezone.utc)
     solved_datetimes: List[datetime] = []
     for s in submissions:
         try:
@@ -2210,7 +4292,7 @@ def _get_coding_streak_for_ui(user_id: str, now: Optional[datetime] = None) -> d
 
 
 def _insert_snapshot_if_missing(user_id: str, snapshot_date: str, readiness_score: float, breakdown: dict) -> None:
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         exists = conn.execute(
             "SELECT 1 FROM career_readiness_snapshots WHERE user_id = ? AND snapshot_date = ? LIMIT 1",
             (user_id, snapshot_date),
@@ -2223,7 +4305,6 @@ def _insert_snapshot_if_missing(user_id: str, snapshot_date: str, readiness_scor
             "INSERT INTO career_readiness_snapshots (id, user_id, snapshot_date, readiness_score, breakdown_json, created_at) VALUES (?, ?, ?, ?, ?, ?)",
             (snap_id, user_id, snapshot_date, float(readiness_score), json.dumps(breakdown), now),
         )
-        conn.commit()
 
 
 def _fetch_snapshots(user_id: str, days: int = 30) -> List[dict]:
@@ -2243,6 +4324,10 @@ def _fetch_snapshots(user_id: str, days: int = 30) -> List[dict]:
     return list(reversed(items))
 
 
+async def fetch_snapshots(user_id: str, days: int = 30) -> List[dict]:
+    return await _single_flight.do("snapshots", (user_id, days), asyncio.to_thread, _fetch_snapshots, user_id, days)
+
+
 def _fetch_distinct_learning_topics(user_id: str, limit: int = 200) -> List[str]:
     with _sqlite_connection() as conn:
         rows = conn.execute(
@@ -2343,12 +4428,11 @@ def _insert_activity_event(user_id: str, event: ActivityEvent) -> None:
 
     event_id = str(uuid.uuid4())
     created_at = datetime.now(timezone.utc).isoformat()
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "INSERT INTO activity_events (id, user_id, event_type, path, duration_seconds, metadata_json, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
             (event_id, user_id, event_type, path, duration_seconds, metadata_json, created_at),
         )
-        conn.commit()
 
 
 def _fetch_login_streak_row(user_id: str) -> Optional[dict]:
@@ -2408,13 +4492,12 @@ def _update_login_streak_on_login(user_id: str, now: Optional[datetime] = None)
             longest = max(prev_longest, current)
             last_login_at = now_iso
 
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "INSERT INTO login_streaks (user_id, current_streak, longest_streak, last_login_at, updated_at) VALUES (?, ?, ?, ?, ?) "
             "ON CONFLICT(user_id) DO UPDATE SET current_streak=excluded.current_streak, longest_streak=excluded.longest_streak, last_login_at=excluded.last_login_at, updated_at=excluded.updated_at",
             (user_id, int(current), int(longest), last_login_at, now_iso),
         )
-        conn.commit()
 
     return {
         "current_streak": int(current),
@@ -2426,8 +4509,12 @@ def _update_login_streak_on_login(user_id: str, now: Optional[datetime] = None)
 
 def _get_login_streak_for_ui(user_id: str) -> dict:
     """Return login streak stats plus a 'display_current_streak' that auto-zeros after 24h."""
+    return _login_streak_for_ui(_fetch_login_streak_row(user_id))
+
+
+def _login_streak_for_ui(row: Optional[dict]) -> dict:
     now_dt = datetime.now(timezone.utc)
-    row = _fetch_login_streak_row(user_id) or {
+    row = row or {
         "current_streak": 0,
         "longest_streak": 0,
         "last_login_at": None,
@@ -2548,7 +4635,7 @@ def _upsert_apply_tracker_item(user_id: str, payload: ApplyTrackerCreate) -> dic
         raise ValueError("role, source, and url are required")
 
     now = datetime.now(timezone.utc).isoformat()
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         existing = conn.execute(
             "SELECT id, user_id, role, source, url, match_tag, status, created_at, updated_at FROM apply_tracker WHERE user_id = ? AND url = ? LIMIT 1",
             (user_id, url),
@@ -2560,7 +4647,6 @@ def _upsert_apply_tracker_item(user_id: str, payload: ApplyTrackerCreate) -> dic
                 "UPDATE apply_tracker SET role = ?, source = ?, match_tag = ?, status = ?, updated_at = ? WHERE id = ?",
                 (role, source, match_tag, status, now, existing["id"]),
             )
-            conn.commit()
             row = conn.execute(
                 "SELECT id, user_id, role, source, url, match_tag, status, created_at, updated_at FROM apply_tracker WHERE id = ?",
                 (existing["id"],),
@@ -2572,7 +4658,6 @@ def _upsert_apply_tracker_item(user_id: str, payload: ApplyTrackerCreate) -> dic
             "INSERT INTO apply_tracker (id, user_id, role, source, url, match_tag, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
             (item_id, user_id, role, source, url, match_tag, status, now, now),
         )
-        conn.commit()
         row = conn.execute(
             "SELECT id, user_id, role, source, url, match_tag, status, created_at, updated_at FROM apply_tracker WHERE id = ?",
             (item_id,),
@@ -2596,7 +4681,7 @@ def _update_apply_tracker_item(user_id: str, item_id: str, payload: ApplyTracker
         raise ValueError("id is required")
     status = _normalize_apply_status(payload.status)
     now = datetime.now(timezone.utc).isoformat()
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         row = conn.execute(
             "SELECT id FROM apply_tracker WHERE id = ? AND user_id = ? LIMIT 1",
             (item_id, user_id),
@@ -2607,7 +4692,6 @@ def _update_apply_tracker_item(user_id: str, item_id: str, payload: ApplyTracker
             "UPDATE apply_tracker SET status = ?, updated_at = ? WHERE id = ? AND user_id = ?",
             (status, now, item_id, user_id),
         )
-        conn.commit()
         updated = conn.execute(
             "SELECT id, user_id, role, source, url, match_tag, status, created_at, updated_at FROM apply_tracker WHERE id = ? AND user_id = ?",
             (item_id, user_id),
@@ -2619,12 +4703,11 @@ def _delete_apply_tracker_item(user_id: str, item_id: str) -> None:
     item_id = (item_id or "").strip()
     if not item_id:
         raise ValueError("id is required")
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "DELETE FROM apply_tracker WHERE id = ? AND user_id = ?",
             (item_id, user_id),
         )
-        conn.commit()
 
 
 def _tracking_based_job_suggestions(
@@ -2872,11 +4955,11 @@ def _weekly_plan_from_blocker(blocker: str) -> List[dict]:
 
 
 async def store_interview_evaluation(eval_doc: dict):
-    await asyncio.to_thread(_insert_interview_evaluation, eval_doc)
+    await run_sqlite_write(_insert_interview_evaluation, eval_doc)
 
 
 def _insert_test(test_doc: dict):
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "INSERT INTO tests (id, title, description, questions, duration, company_id, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
             (
@@ -2907,7 +4990,7 @@ def _fetch_company_tests(company_id: str) -> List[dict]:
 
 
 async def store_test(test_doc: dict):
-    await asyncio.to_thread(_insert_test, test_doc)
+    await run_sqlite_write(_insert_test, test_doc)
 
 
 async def get_company_tests(company_id: str) -> List[dict]:
@@ -2927,16 +5010,209 @@ def _select_users_by_role(role: str, limit: int = 100) -> List[dict]:
 async def fetch_users_by_role(role: str, limit: int = 100) -> List[dict]:
     return await asyncio.to_thread(_select_users_by_role, role, limit)
 
-# ==================== AI RESPONSE FUNCTIONS ====================
 
-def _check_internet_connectivity() -> bool:
-    """Check if internet connection is available"""
+# Batched per-student metrics for college views: a handful of set-based
+# queries per page instead of several queries per student.
+_SQLITE_IN_CHUNK = 500
+
+_STUDENT_SORT_COLUMNS = {
+    "created_at": "u.created_at",
+    "name": "u.name COLLATE NOCASE",
+    "learning_sessions": "COALESCE(us.learning_count, 0)",
+    "code_submissions": "COALESCE(us.code_count, 0)",
+    "streak": "CASE WHEN ls.last_login_at >= :streak_cutoff THEN COALESCE(ls.current_streak, 0) ELSE 0 END",
+    "login_longest_streak": "COALESCE(ls.longest_streak, 0)",
+}
+
+
+def _fetch_student_metrics(user_ids: List[str]) -> Dict[str, dict]:
+    """Counters and login streak for each user id (missing users get zeros)."""
+    metrics = {}
+    unique_ids = list(dict.fromkeys(user_ids))
+    with _sqlite_connection() as conn:
+        for start in range(0, len(unique_ids), _SQLITE_IN_CHUNK):
+            chunk = unique_ids[start:start + _SQLITE_IN_CHUNK]
+            placeholders = ",".join("(?)" for _ in chunk)
+            rows = conn.execute(
+                f"""
+                WITH ids(user_id) AS (VALUES {placeholders})
+                SELECT ids.user_id AS user_id,
+                       COALESCE(us.learning_count, 0) AS learning_sessions,
+                       COALESCE(us.code_count, 0) AS code_submissions,
+                       COALESCE(us.code_passed, 0) AS code_passed,
+                       COALESCE(us.resume_count, 0) AS resume_analyses,
+                       COALESCE(us.interview_count, 0) AS interviews_taken,
+                       us.last_activity_at AS last_activity_at,
+                       ls.current_streak, ls.longest_streak, ls.last_login_at
+                FROM ids
+                LEFT JOIN user_stats us ON us.user_id = ids.user_id
+                LEFT JOIN login_streaks ls ON ls.user_id = ids.user_id
+                """,
+                chunk,
+            ).fetchall()
+            for row in rows:
+                login_row = None
+                if row["last_login_at"] is not None or row["current_streak"] is not None:
+                    login_row = {
+                        "current_streak": int(row["current_streak"] or 0),
+                        "longest_streak": int(row["longest_streak"] or 0),
+                        "last_login_at": row["last_login_at"],
+                    }
+                metrics[row["user_id"]] = {
+                    "learning_sessions": int(row["learning_sessions"]),
+                    "code_submissions": int(row["code_submissions"]),
+                    "code_passed": int(row["code_passed"]),
+                    "resume_analyses": int(row["resume_analyses"]),
+                    "interviews_taken": int(row["interviews_taken"]),
+                    "last_activity_at": row["last_activity_at"],
+                    "login_streak": _login_streak_for_ui(login_row),
+                }
+    return metrics
+
+
+async def fetch_student_metrics(user_ids: List[str]) -> Dict[str, dict]:
+    return await asyncio.to_thread(_fetch_student_metrics, user_ids)
+
+
+def _select_students_page(sort: str = "created_at", order: str = "desc", limit: int = 100, offset: int = 0) -> tuple:
+    """(student rows for one page, total students), ordered server-side by a metric or user column."""
+    sort_expr = _STUDENT_SORT_COLUMNS.get(sort, _STUDENT_SORT_COLUMNS["created_at"])
+    direction = "ASC" if str(order).lower() == "asc" else "DESC"
+    params = {
+        "streak_cutoff": (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat(),
+        "limit": int(limit),
+        "offset": int(offset),
+    }
+    with _sqlite_connection() as conn:
+        total = conn.execute("SELECT COUNT(*) AS total FROM users WHERE role = 'student'").fetchone()["total"]
+        rows = conn.execute(
+            f"""
+            SELECT u.id, u.email, u.name, u.role, u.created_at
+            FROM users u
+            LEFT JOIN user_stats us ON us.user_id = u.id
+            LEFT JOIN login_streaks ls ON ls.user_id = u.id
+            WHERE u.role = 'student'
+            ORDER BY {sort_expr} {direction}, u.id
+            LIMIT :limit OFFSET :offset
+            """,
+            params,
+        ).fetchall()
+    return [dict(row) for row in rows], int(total or 0)
+
+
+def _student_totals() -> dict:
+    """College-wide student counters in one aggregate over users + user_stats."""
+    with _sqlite_connection() as conn:
+        row = conn.execute(
+            """
+            SELECT COUNT(*) AS total_students,
+                   COALESCE(SUM(us.learning_count), 0) AS total_learning_sessions,
+                   COALESCE(SUM(us.code_count), 0) AS total_code_submissions,
+                   COALESCE(SUM(COALESCE(us.learning_count, 0) > 0 OR COALESCE(us.code_count, 0) > 0), 0) AS active_students
+            FROM users u
+            LEFT JOIN user_stats us ON us.user_id = u.id
+            WHERE u.role = 'student'
+            """
+        ).fetchone()
+    return {key: int(row[key] or 0) for key in row.keys()}
+
+# Company candidate listing: job seekers joined with their latest resume,
+# code average (user_stats) and this company's latest action, as one query.
+# Pages use a keyset cursor over (sort value, id) so deep pages cost the same
+# as the first one.
+_CANDIDATE_SORT_COLUMNS = {
+    "created_at": "created_at",
+    "name": "name",
+    "resume_score": "resume_score",
+    "avg_code_score": "avg_code_score",
+}
+
+_CANDIDATES_SQL = """
+    WITH candidates AS (
+        SELECT
+            u.id, u.email, u.name, u.role, u.created_at,
+            COALESCE(r.credibility_score, 0) AS resume_score,
+            COALESCE(us.code_score_sum / NULLIF(us.code_score_count, 0), 0) AS avg_code_score,
+            COALESCE(ca.action, 'new') AS status,
+            ca.interview_date, ca.interview_type
+        FROM users u
+        LEFT JOIN user_stats us ON us.user_id = u.id
+        LEFT JOIN resume_analyses r ON r.id = (
+            SELECT id FROM resume_analyses
+            WHERE user_id = u.id ORDER BY created_at DESC LIMIT 1
+        )
+        LEFT JOIN candidate_actions ca ON ca.id = (
+            SELECT id FROM candidate_actions
+            WHERE company_id = :company_id AND candidate_id = u.id ORDER BY created_at DESC LIMIT 1
+        )
+        WHERE u.role = 'job_seeker'
+    )
+    SELECT * FROM candidates
+"""
+
+
+def _encode_candidate_cursor(value: Any, candidate_id: str) -> str:
+    raw = json.dumps([value, candidate_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_candidate_cursor(cursor: str) -> tuple:
     try:
-        import socket
-        socket.create_connection(("8.8.8.8", 53), timeout=3)
-        return True
-    except OSError:
-        return False
+        value, candidate_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return value, str(candidate_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _select_candidates_page(
+    company_id: str,
+    statuses: Optional[List[str]] = None,
+    min_resume_score: Optional[float] = None,
+    min_code_score: Optional[float] = None,
+    sort: str = "created_at",
+    order: str = "desc",
+    limit: int = 100,
+    cursor: Optional[str] = None,
+) -> tuple:
+    """(candidate rows, next cursor or None) for one company's listing page."""
+    sort_col = _CANDIDATE_SORT_COLUMNS.get(sort, "created_at")
+    descending = str(order).lower() != "asc"
+    comparison = "<" if descending else ">"
+    direction = "DESC" if descending else "ASC"
+
+    where = []
+    params: Dict[str, Any] = {"company_id": company_id, "limit": int(limit) + 1}
+    if statuses:
+        names = [f"status_{i}" for i in range(len(statuses))]
+        where.append(f"status IN ({', '.join(':' + name for name in names)})")
+        params.update(zip(names, statuses))
+    if min_resume_score is not None:
+        where.append("resume_score >= :min_resume_score")
+        params["min_resume_score"] = float(min_resume_score)
+    if min_code_score is not None:
+        where.append("avg_code_score >= :min_code_score")
+        params["min_code_score"] = float(min_code_score)
+    if cursor:
+        params["cursor_value"], params["cursor_id"] = _decode_candidate_cursor(cursor)
+        where.append(f"({sort_col}, id) {comparison} (:cursor_value, :cursor_id)")
+
+    sql = _CANDIDATES_SQL
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {sort_col} {direction}, id {direction} LIMIT :limit"
+
+    with _sqlite_connection() as conn:
+        rows = [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_candidate_cursor(rows[-1][sort_col], rows[-1]["id"])
+    for row in rows:
+        row["avg_code_score"] = round(float(row["avg_code_score"] or 0), 2)
+    return rows, next_cursor
+
+# ==================== AI RESPONSE FUNCTIONS ====================
 
 def _get_demo_response(prompt: str, response_type: str = "tutor") -> str:
     """Generate demo responses when AI is not configured"""
@@ -3241,147 +5517,1608 @@ print(f"Sum: {result}")  # Output: Sum: 30
 Ask me about "add two numbers" to see a complete tutorial, or configure OpenAI API for full tutoring capabilities."""
 
 
-def _call_azure_openai_sync(prompt: str, system_instruction: str = None) -> str:
-    """Synchronous function to call Azure OpenAI API"""
-    try:
-        client = AzureOpenAI(
+# ==================== AI PROVIDER CLIENTS ====================
+# One long-lived async SDK client per provider, so completions reuse pooled
+# keep-alive (optionally HTTP/2) connections and wait on the event loop
+# instead of holding an executor thread. A per-provider semaphore caps
+# in-flight requests; callers that wait longer than the queue timeout fail
+# fast instead of piling up.
+
+_HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class AIProviderError(Exception):
+    """A provider call failed. Subclasses say whether retrying can help and
+    whether the failure counts against the provider's circuit breaker."""
+
+    kind = "provider_error"
+    retryable = False
+    trips_breaker = False
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class AIProviderTimeout(AIProviderError):
+    kind = "timeout"
+    retryable = True
+    trips_breaker = True
+
+
+class AIProviderUnavailable(AIProviderError):
+    """Connection failure or 5xx."""
+
+    kind = "unavailable"
+    retryable = True
+    trips_breaker = True
+
+
+class AIProviderRateLimited(AIProviderError):
+    kind = "rate_limited"
+    retryable = True
+
+
+class AIProviderThrottled(AIProviderRateLimited):
+    """Our own RPM/TPM limit for the provider; nothing was sent."""
+
+    kind = "throttled"
+
+
+class AIProviderQuotaExceeded(AIProviderError):
+    kind = "insufficient_quota"
+
+
+class AIProviderAuthError(AIProviderError):
+    kind = "auth"
+
+
+class AIProviderRejected(AIProviderError):
+    """The provider refused this request (400/404/422, content filter...)."""
+
+    kind = "bad_request"
+
+
+class AIProviderBusy(AIProviderError):
+    """No free concurrency slot within the queue timeout."""
+
+    kind = "saturated"
+
+
+class AICircuitOpen(AIProviderError):
+    kind = "circuit_open"
+
+
+def _classify_ai_error(error: Exception) -> AIProviderError:
+    """Map SDK/transport exceptions onto the AIProviderError hierarchy."""
+    if isinstance(error, AIProviderError):
+        return error
+    message = str(error)
+    status = getattr(error, "status_code", None)
+    if isinstance(error, (openai.APITimeoutError, httpx.TimeoutException, asyncio.TimeoutError)):
+        return AIProviderTimeout(message or "request timed out")
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError)):
+        return AIProviderUnavailable(message, status)
+    if isinstance(error, openai.RateLimitError):
+        lowered = message.lower()
+        if "insufficient_quota" in lowered or "exceeded your current quota" in lowered:
+            return AIProviderQuotaExceeded(message, status)
+        return AIProviderRateLimited(message, status)
+    if isinstance(error, (openai.AuthenticationError, openai.PermissionDeniedError)):
+        return AIProviderAuthError(message, status)
+    if isinstance(error, openai.APIStatusError):
+        if status is not None and status >= 500:
+            return AIProviderUnavailable(message, status)
+        return AIProviderRejected(message, status)
+    return AIProviderError(message)
+
+
+class _CircuitBreaker:
+    """closed -> open after N consecutive breaker-tripping failures; after the
+    reset timeout one half-open trial call decides between closed and open."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._stats = {"opened": 0, "short_circuited": 0}
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+            self.state = "half_open"
+            self._trial_in_flight = False
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        self._stats["short_circuited"] += 1
+        return False
+
+    def is_open(self) -> bool:
+        """Whether allow() would refuse right now (without claiming the half-open trial)."""
+        if self.state == "open":
+            return time.monotonic() - self._opened_at < self.reset_seconds
+        return self.state == "half_open" and self._trial_in_flight
+
+    def record_success(self):
+        self._failures = 0
+        self._trial_in_flight = False
+        self.state = "closed"
+
+    def record_failure(self, error: AIProviderError):
+        if not error.trips_breaker:
+            # e.g. a rejected prompt: says nothing about the provider; just end a trial.
+            if self.state == "half_open":
+                self._trial_in_flight = False
+            return
+        self._failures += 1
+        if self.state == "half_open" or self._failures >= self.failure_threshold:
+            if self.state != "open":
+                self._stats["opened"] += 1
+                logger.warning(f"AI circuit opened after {self._failures} failure(s); retrying in {self.reset_seconds:.0f}s")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def record_cancelled(self):
+        if self.state == "half_open":
+            self._trial_in_flight = False
+
+    def stats(self) -> dict:
+        return {"state": self.state, "consecutive_failures": self._failures, **self._stats}
+
+
+class _RetryBudget:
+    """Caps retries (and hedged requests) to a fraction of recent traffic."""
+
+    WINDOW_SECONDS = 10.0
+
+    def __init__(self, ratio: float, min_per_second: float):
+        self.ratio = ratio
+        self.min_retries = min_per_second * self.WINDOW_SECONDS
+        self._requests: "deque[float]" = deque()
+        self._retries: "deque[float]" = deque()
+        self._stats = {"granted": 0, "denied": 0}
+
+    def _trim(self, now: float):
+        cutoff = now - self.WINDOW_SECONDS
+        for events in (self._requests, self._retries):
+            while events and events[0] < cutoff:
+                events.popleft()
+
+    def record_request(self):
+        self._requests.append(time.monotonic())
+
+    def try_spend(self) -> bool:
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._retries) < max(self.min_retries, self.ratio * len(self._requests)):
+            self._retries.append(now)
+            self._stats["granted"] += 1
+            return True
+        self._stats["denied"] += 1
+        return False
+
+    def stats(self) -> dict:
+        self._trim(time.monotonic())
+        return {
+            "window_seconds": self.WINDOW_SECONDS,
+            "requests": len(self._requests),
+            "retries": len(self._retries),
+            **self._stats,
+        }
+
+
+def _estimate_ai_tokens(messages: List[dict]) -> int:
+    """Prompt size in tokens, plus the per-message overhead of the chat format."""
+    return sum(_tokenizer.count(message.get("content") or "") + 4 for message in messages)
+
+
+class _AIRateLimiter:
+    """Client-side requests/tokens per minute for one provider: two token
+    buckets refilled continuously; a limit of 0 is not enforced."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = max(0, rpm)
+        self.tpm = max(0, tpm)
+        self._requests = float(self.rpm)
+        self._tokens = float(self.tpm)
+        self._updated = time.monotonic()
+        self._stats = {"throttled": 0, "tokens_reserved": 0, "tokens_used": 0}
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self._updated = now - self._updated, now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    def has_capacity(self, tokens: int) -> bool:
+        self._refill()
+        # A request bigger than the whole TPM limit waits for a full bucket.
+        return (not self.rpm or self._requests >= 1) and (not self.tpm or self._tokens >= min(tokens, self.tpm))
+
+    def acquire(self, tokens: int) -> bool:
+        if not self.has_capacity(tokens):
+            self._stats["throttled"] += 1
+            return False
+        if self.rpm:
+            self._requests -= 1
+        if self.tpm:
+            self._tokens -= tokens
+        self._stats["tokens_reserved"] += tokens
+        return True
+
+    def settle(self, reserved: int, used: int):
+        """Return (or charge) the difference between the reservation and real usage."""
+        self._stats["tokens_used"] += used
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + reserved - used)
+
+    def retry_after(self, tokens: int) -> float:
+        """Seconds until has_capacity(tokens) would be true."""
+        self._refill()
+        wait = 0.0
+        if self.rpm and self._requests < 1:
+            wait = (1 - self._requests) * 60.0 / self.rpm
+        if self.tpm:
+            wait = max(wait, (min(tokens, self.tpm) - self._tokens) * 60.0 / self.tpm)
+        return max(0.0, wait)
+
+    def stats(self) -> dict:
+        self._refill()
+        return {
+            "rpm": self.rpm or None,
+            "tpm": self.tpm or None,
+            "requests_available": round(self._requests, 1) if self.rpm else None,
+            "tokens_available": round(self._tokens) if self.tpm else None,
+            **self._stats,
+        }
+
+
+class _AIFaultInjector:
+    """Test hook: adds latency and raises synthetic provider errors inside
+    the provider call, so breaker/retry/hedging/health all see them."""
+
+    ERRORS = {
+        "timeout": lambda: AIProviderTimeout("injected timeout"),
+        "unavailable": lambda: AIProviderUnavailable("injected 503", 503),
+        "rate_limited": lambda: AIProviderRateLimited("injected 429", 429),
+        "bad_request": lambda: AIProviderRejected("injected 400", 400),
+    }
+
+    def __init__(self, spec: str = ""):
+        self.configure(spec)
+
+    def configure(self, spec) -> None:
+        """spec: "timeout=0.1,latency_ms=200" or the equivalent dict; empty disables."""
+        if isinstance(spec, str):
+            spec = dict(part.split("=", 1) for part in spec.replace(" ", "").split(",") if "=" in part)
+        unknown = set(spec) - set(self.ERRORS) - {"latency_ms", "providers"}
+        if unknown:
+            raise ValueError(f"Unknown fault injection keys: {', '.join(sorted(unknown))}")
+        providers = spec.get("providers") or ""
+        self.providers = set(providers.split("|")) if isinstance(providers, str) and providers else set(providers or ())
+        self.latency_ms = float(spec.get("latency_ms") or 0)
+        self.rates = {kind: float(spec[kind]) for kind in self.ERRORS if spec.get(kind)}
+        self.injected = 0
+
+    @property
+    def active(self) -> bool:
+        return bool(self.latency_ms or self.rates)
+
+    async def inject(self, provider: str) -> None:
+        if not self.active or (self.providers and provider not in self.providers):
+            return
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000.0)
+        for kind, rate in self.rates.items():
+            if random.random() < rate:
+                self.injected += 1
+                raise self.ERRORS[kind]()
+
+    def stats(self) -> dict:
+        return {"latency_ms": self.latency_ms, "rates": self.rates, "providers": sorted(self.providers), "injected": self.injected}
+
+
+_ai_retry_budget = _RetryBudget(AI_RETRY_BUDGET_RATIO, AI_RETRY_BUDGET_MIN_PER_SECOND)
+_ai_faults = _AIFaultInjector(AI_FAULT_INJECTION)
+
+
+def set_ai_fault_injection(spec) -> None:
+    """Enable/disable fault injection at runtime (tests, load tools)."""
+    _ai_faults.configure(spec or "")
+
+
+def _ai_backoff_seconds(attempt: int) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (1-based)."""
+    cap = min(AI_RETRY_MAX_DELAY_MS, AI_RETRY_BASE_DELAY_MS * (2 ** (attempt - 1)))
+    return random.uniform(0, cap) / 1000.0
+
+
+def _ai_setting(provider: str, name: str, default):
+    """Per-provider override (AI_<PROVIDER>_<NAME>) of a global AI_<NAME> limit."""
+    raw = os.environ.get(f"AI_{provider.upper()}_{name}")
+    return type(default)(raw) if raw not in (None, "") else default
+
+
+class _AIProvider(ABC):
+    """Shared async chat-completions client for one provider."""
+
+    def __init__(self, name: str, label: str, model: str):
+        self.name = name
+        self.label = label
+        self.model = model
+        self.max_concurrency = max(1, _ai_setting(name, "MAX_CONCURRENCY", AI_MAX_CONCURRENCY))
+        self.queue_timeout = _ai_setting(name, "QUEUE_TIMEOUT_SECONDS", AI_QUEUE_TIMEOUT_SECONDS)
+        self.timeout = httpx.Timeout(
+            _ai_setting(name, "REQUEST_TIMEOUT_SECONDS", AI_REQUEST_TIMEOUT_SECONDS),
+            connect=_ai_setting(name, "CONNECT_TIMEOUT_SECONDS", AI_CONNECT_TIMEOUT_SECONDS),
+        )
+        self.http2 = AI_HTTP2 and _HTTP2_AVAILABLE
+        self.breaker = _CircuitBreaker(
+            _ai_setting(name, "BREAKER_FAILURE_THRESHOLD", AI_BREAKER_FAILURE_THRESHOLD),
+            _ai_setting(name, "BREAKER_RESET_SECONDS", AI_BREAKER_RESET_SECONDS),
+        )
+        self.limiter = _AIRateLimiter(_ai_setting(name, "RPM", AI_RPM), _ai_setting(name, "TPM", AI_TPM))
+        # Recent successful completion latencies (seconds), for hedging.
+        self._latencies: "deque[float]" = deque(maxlen=200)
+        self._client = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing: Set[asyncio.Task] = set()
+        self._clients_created = 0
+        self._in_flight = 0
+        self._counters = {
+            "calls": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "rejected": 0,
+            "cancelled": 0,
+            "peak_in_flight": 0,
+            "busy_seconds": 0.0,
+            "streams": 0,
+            "first_token_seconds": 0.0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        }
+
+    def _http_client(self, **kwargs) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=self.http2,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=_ai_setting(self.name, "MAX_CONNECTIONS", AI_MAX_CONNECTIONS),
+                max_keepalive_connections=_ai_setting(self.name, "MAX_KEEPALIVE_CONNECTIONS", AI_MAX_KEEPALIVE_CONNECTIONS),
+                keepalive_expiry=_ai_setting(self.name, "KEEPALIVE_EXPIRY_SECONDS", AI_KEEPALIVE_EXPIRY_SECONDS),
+            ),
+            **kwargs,
+        )
+
+    @abstractmethod
+    def _create_client(self):
+        """A new SDK client for this provider (called once per event loop)."""
+
+    def _bind_loop(self):
+        # Pooled connections and the semaphore belong to one event loop; the
+        # server runs a single loop, but tests and tools may start several.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            stale, stale_loop = self._client, self._loop
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._client = self._create_client()
+            self._clients_created += 1
+            if stale is not None:
+                self._close_stale_client(stale, stale_loop)
+        return self._client, self._semaphore
+
+    def _close_stale_client(self, client, loop: asyncio.AbstractEventLoop):
+        """Close a client left behind on another loop, without waiting for it."""
+        if loop.is_running():
+            # Still serving in another thread: close it there.
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
+            return
+
+        async def close():
+            try:
+                await client.close()
+            except Exception as e:
+                # Its loop is gone; the sockets close when the client is collected.
+                logger.debug(f"Could not close the previous {self.label} client: {e}")
+
+        task = asyncio.get_running_loop().create_task(close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @asynccontextmanager
+    async def _slot(self):
+        """Hold one of the provider's concurrency slots and record the call.
+
+        Fails fast with AICircuitOpen while the breaker is open; any other
+        failure is re-raised as a classified AIProviderError.
+        """
+        client, semaphore = self._bind_loop()
+        if not self.breaker.allow():
+            raise AICircuitOpen(f"{self.label} circuit is open")
+        # allow() may have claimed the half-open trial; give it back if this
+        # call never gets a slot.
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._counters["rejected"] += 1
+            self.breaker.record_cancelled()
+            raise AIProviderBusy(f"{self.label} is saturated ({self.max_concurrency} requests in flight)")
+        except BaseException:
+            self.breaker.record_cancelled()
+            raise
+
+        self._in_flight += 1
+        self._counters["calls"] += 1
+        self._counters["peak_in_flight"] = max(self._counters["peak_in_flight"], self._in_flight)
+        started = time.perf_counter()
+        try:
+            await _ai_faults.inject(self.name)
+            yield client
+            self.breaker.record_success()
+            _ai_health.record_success(self.name, time.perf_counter() - started)
+        except (asyncio.CancelledError, GeneratorExit):
+            self._counters["cancelled"] += 1
+            self.breaker.record_cancelled()
+            raise
+        except Exception as e:
+            error = _classify_ai_error(e)
+            self._counters["errors"] += 1
+            if isinstance(error, AIProviderTimeout):
+                self._counters["timeouts"] += 1
+            self.breaker.record_failure(error)
+            if error.trips_breaker:
+                _ai_health.record_failure(self.name, error)
+            if error is e:
+                raise
+            raise error from e
+        finally:
+            self._in_flight -= 1
+            self._counters["busy_seconds"] += time.perf_counter() - started
+            semaphore.release()
+
+    def _reserve(self, messages: List[dict], max_tokens: int) -> tuple:
+        """Take RPM/TPM capacity for one call; returns (reserved, prompt estimate)."""
+        prompt_tokens = _estimate_ai_tokens(messages)
+        reserved = prompt_tokens + max_tokens
+        if not self.limiter.acquire(reserved):
+            raise AIProviderThrottled(f"{self.label} local rate limit reached (retry in {self.limiter.retry_after(reserved):.1f}s)")
+        return reserved, prompt_tokens
+
+    def _record_usage(self, reserved: int, prompt_tokens: int, completion_tokens: int, usage: Optional[dict], sent: bool = True):
+        if not sent:
+            # Breaker open, saturated or failed before the request went out:
+            # hand the reservation back and count nothing.
+            self.limiter.settle(reserved, 0)
+            return
+        self._counters["prompt_tokens"] += prompt_tokens
+        self._counters["completion_tokens"] += completion_tokens
+        self.limiter.settle(reserved, prompt_tokens + completion_tokens)
+        if usage is not None:
+            usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + prompt_tokens
+            usage["completion_tokens"] = usage.get("completion_tokens", 0) + completion_tokens
+
+    async def complete(self, messages: List[dict], max_tokens: int = 2000, temperature: float = 0.7, usage: Optional[dict] = None) -> str:
+        """One completion; token usage is added to `usage` (a dict) when given."""
+        reserved, prompt_tokens = self._reserve(messages, max_tokens)
+        completion_tokens = 0
+        sent = answered = False
+        try:
+            async with self._slot() as client:
+                sent = True
+                started = time.perf_counter()
+                response = await client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                )
+                self._latencies.append(time.perf_counter() - started)
+                reported = getattr(response, "usage", None)
+                if reported is not None:
+                    prompt_tokens = reported.prompt_tokens or prompt_tokens
+                    completion_tokens = reported.completion_tokens or 0
+                answered = True
+                return response.choices[0].message.content or ""
+        finally:
+            # Failed calls still count against the limiter, not against the caller's usage.
+            self._record_usage(reserved, prompt_tokens, completion_tokens, usage if answered else None, sent)
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a hedged second request is worth sending, if hedging is on."""
+        if AI_HEDGE_PERCENTILE <= 0 or len(self._latencies) < AI_HEDGE_MIN_SAMPLES or self.breaker.state != "closed":
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * AI_HEDGE_PERCENTILE / 100.0))]
+
+    async def complete_hedged(self, messages: List[dict], max_tokens: int = 2000, temperature: float = 0.7, usage: Optional[dict] = None) -> str:
+        """complete(), plus a second identical request if the first is slower
+        than hedge_delay(); the first success wins and the other is cancelled."""
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self.complete(messages, max_tokens, temperature, usage)
+        first = asyncio.ensure_future(self.complete(messages, max_tokens, temperature, usage))
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        # A hedge on a saturated provider would only queue behind the original.
+        if done or self._in_flight >= self.max_concurrency or not _ai_retry_budget.try_spend():
+            return await first
+
+        self._counters["hedges"] += 1
+        second = asyncio.ensure_future(self.complete(messages, max_tokens, temperature, usage))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._counters["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, messages: List[dict], max_tokens: int = 2000, temperature: float = 0.7, usage: Optional[dict] = None):
+        """Yield completion text deltas as the provider produces them."""
+        reserved, prompt_tokens = self._reserve(messages, max_tokens)
+        streamed: List[str] = []
+        sent = finished = False
+        try:
+            async with self._slot() as client:
+                sent = True
+                started = time.perf_counter()
+                first_token = True
+                stream = await client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stream=True,
+                )
+                try:
+                    async for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if not delta:
+                            continue
+                        if first_token:
+                            first_token = False
+                            self._counters["streams"] += 1
+                            self._counters["first_token_seconds"] += time.perf_counter() - started
+                        streamed.append(delta)
+                        yield delta
+                    finished = True
+                finally:
+                    # Also runs when the consumer goes away (client disconnect
+                    # cancels the request task); closing the HTTP response aborts
+                    # the upstream generation instead of reading it to the end.
+                    with anyio.CancelScope(shield=True):
+                        await stream.close()
+        finally:
+            # Streams carry no usage block; count the text sent. Like complete(),
+            # a stream that failed before producing anything is not charged to
+            # the caller, whose failover provider will be.
+            answered = finished or bool(streamed)
+            self._record_usage(reserved, prompt_tokens, _tokenizer.count("".join(streamed)), usage if answered else None, sent)
+
+    async def aclose(self):
+        client, loop = self._client, self._loop
+        self._client = self._semaphore = self._loop = None
+        if client is not None and loop is asyncio.get_running_loop():
+            await client.close()
+
+    def stats(self) -> dict:
+        counters = dict(self._counters)
+        first_token_seconds = counters.pop("first_token_seconds")
+        return {
+            "provider": self.name,
+            "model": self.model,
+            "http2": self.http2,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "clients_created": self._clients_created,
+            **counters,
+            "busy_seconds": round(counters["busy_seconds"], 3),
+            "circuit": self.breaker.stats(),
+            "rate_limit": self.limiter.stats(),
+            "avg_first_token_ms": round(first_token_seconds * 1000.0 / counters["streams"], 1) if counters["streams"] else None,
+        }
+
+
+class _OpenAIProvider(_AIProvider):
+    def __init__(self):
+        super().__init__("openai", "OpenAI", OPENAI_MODEL)
+
+    def _create_client(self):
+        return AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=self.timeout, max_retries=0, http_client=self._http_client())
+
+
+class _AzureOpenAIProvider(_AIProvider):
+    def __init__(self):
+        super().__init__("azure", "Azure OpenAI", AZURE_OPENAI_DEPLOYMENT)
+
+    def _create_client(self):
+        return AsyncAzureOpenAI(
             api_key=AZURE_OPENAI_API_KEY,
-            api_version="2024-02-01",
-            azure_endpoint=AZURE_OPENAI_ENDPOINT
+            api_version=AZURE_OPENAI_API_VERSION,
+            azure_endpoint=AZURE_OPENAI_ENDPOINT,
+            timeout=self.timeout,
+            max_retries=0,
+            http_client=self._http_client(),
         )
 
-        messages = []
-        if system_instruction:
-            messages.append({"role": "system", "content": system_instruction})
-        messages.append({"role": "user", "content": prompt})
 
-        response = client.chat.completions.create(
-            model=AZURE_OPENAI_DEPLOYMENT,
-            messages=messages,
-            max_tokens=2000,
-            temperature=0.7,
+class _FakeAIProvider(_AIProvider):
+    """OpenAI-compatible provider served in-process for offline load tests.
+
+    Requests go through the real AsyncOpenAI client and the same limits; an
+    httpx mock transport answers after AI_FAKE_LATENCY_MS (+/- jitter) and
+    fails AI_FAKE_ERROR_RATE of requests with a 500. Any name starting with
+    "fake" is a separate fake backend (e.g. AI_PROVIDERS=fake,fake_slow to
+    exercise the router), with its own AI_<NAME>_FAKE_LATENCY_MS override.
+    """
+
+    def __init__(self, name: str = "fake"):
+        super().__init__(name, "Fake AI" if name == "fake" else f"Fake AI ({name})", "fake-model")
+        self.http2 = False
+        self.latency_ms = _ai_setting(name, "FAKE_LATENCY_MS", AI_FAKE_LATENCY_MS)
+
+    async def _respond(self, request: httpx.Request) -> httpx.Response:
+        delay_ms = max(0.0, self.latency_ms + random.uniform(-AI_FAKE_JITTER_MS, AI_FAKE_JITTER_MS))
+        body = json.loads(request.content or b"{}")
+        prompt = next((m.get("content") or "" for m in reversed(body.get("messages", [])) if m.get("role") == "user"), "")
+        content = f"FAKE RESPONSE ({len(prompt)} prompt chars, {delay_ms:.0f} ms). This placeholder stands in for a model completion."
+        if body.get("stream"):
+            # The latency is spread across the tokens, like a real stream.
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=self._stream_chunks(content, delay_ms))
+
+        await asyncio.sleep(delay_ms / 1000.0)
+        if AI_FAKE_ERROR_RATE and random.random() < AI_FAKE_ERROR_RATE:
+            return httpx.Response(500, json={"error": {"message": "fake provider error", "type": "server_error"}})
+        return httpx.Response(
+            200,
+            json={
+                "id": f"chatcmpl-fake-{uuid.uuid4().hex[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", self.model),
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4, "total_tokens": (len(prompt) + len(content)) // 4},
+            },
         )
 
-        return response.choices[0].message.content
+    async def _stream_chunks(self, content: str, delay_ms: float):
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            await asyncio.sleep(delay_ms / 1000.0 / len(words))
+            if i == 1 and AI_FAKE_ERROR_RATE and random.random() < AI_FAKE_ERROR_RATE:
+                raise httpx.ReadError("fake provider dropped the stream")
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": self.model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else f" {word}"}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+    def _create_client(self):
+        return AsyncOpenAI(
+            api_key="fake",
+            base_url="http://fake-ai.local/v1",
+            timeout=self.timeout,
+            max_retries=0,
+            http_client=self._http_client(transport=httpx.MockTransport(self._respond)),
+        )
 
-    except Exception as e:
-        logger.error(f"Error calling Azure OpenAI: {e}")
-        return f"Error: Unable to get AI response. Please try again. ({str(e)})"
 
+_AI_PROVIDER_CLASSES = {"openai": _OpenAIProvider, "azure": _AzureOpenAIProvider, "fake": _FakeAIProvider}
+_ai_providers: Dict[str, _AIProvider] = {}
 
-def _call_openai_sync(prompt: str, system_instruction: str = None) -> str:
-    """Synchronous function to call OpenAI Platform (non-Azure) API"""
-    try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
 
-        messages = []
-        if system_instruction:
-            messages.append({"role": "system", "content": system_instruction})
-        messages.append({"role": "user", "content": prompt})
+def _ai_provider_kind(name: str) -> Optional[str]:
+    """Provider class key for a backend name ("fake_slow" -> "fake")."""
+    if name in _AI_PROVIDER_CLASSES:
+        return name
+    return "fake" if name.startswith("fake") else None
+
+
+def _ai_provider_configured(name: str) -> bool:
+    kind = _ai_provider_kind(name)
+    if kind == "azure":
+        return bool(AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_DEPLOYMENT)
+    if kind == "openai":
+        return bool(OPENAI_API_KEY)
+    return kind == "fake"
+
+
+def get_ai_provider(name: str = None) -> _AIProvider:
+    """Shared client for a provider (default: AI_MODE), created on first use."""
+    name = name or AI_MODE
+    provider = _ai_providers.get(name)
+    if provider is None:
+        kind = _ai_provider_kind(name)
+        if kind is None:
+            raise KeyError(name)
+        provider = _ai_providers[name] = _FakeAIProvider(name) if kind == "fake" else _AI_PROVIDER_CLASSES[kind]()
+    return provider
+
+
+async def close_ai_providers():
+    for provider in list(_ai_providers.values()):
+        try:
+            await provider.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing AI client '{provider.name}': {e}")
+
+
+def ai_provider_stats() -> Dict[str, dict]:
+    return {name: provider.stats() for name, provider in _ai_providers.items()}
+
+
+# ==================== AI PROVIDER HEALTH ====================
+# Cached healthy/unhealthy state per provider, read in O(1) before every AI
+# request. It is fed by real calls (AI_HEALTH_FAILURE_THRESHOLD consecutive
+# failures mark a provider unhealthy, any success clears it) and by a
+# background TCP probe of the provider's host every
+# AI_HEALTH_PROBE_INTERVAL_SECONDS; a successful probe also gives an
+# unhealthy provider another chance.
+
+def _ai_provider_address(name: str) -> Optional[tuple]:
+    """(host, port) the probe connects to; None for providers with nothing to reach."""
+    if name == "openai":
+        return ("api.openai.com", 443)
+    if name == "azure" and AZURE_OPENAI_ENDPOINT:
+        url = httpx.URL(AZURE_OPENAI_ENDPOINT)
+        return (url.host, url.port or 443) if url.host else None
+    return None
+
 
-        response = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=messages,
-            max_tokens=2000,
-            temperature=0.7,
+class _AIHealthMonitor:
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, failure_threshold: int, probe_interval: float, probe_timeout: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self._states: Dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _state(self, name: str) -> dict:
+        state = self._states.get(name)
+        if state is None:
+            # Optimistic until a probe or a real call says otherwise.
+            state = self._states[name] = {
+                "healthy": True,
+                "reason": None,
+                "changed_at": time.time(),
+                "successes": 0,
+                "failures": 0,
+                "consecutive_failures": 0,
+                "latency_ewma_ms": None,
+                "last_error": None,
+                "last_probe_at": None,
+                "last_probe_ok": None,
+                "probe_latency_ms": None,
+            }
+        return state
+
+    def _set_healthy(self, name: str, healthy: bool, reason: Optional[str]):
+        state = self._state(name)
+        if state["healthy"] != healthy:
+            state["changed_at"] = time.time()
+            logger.log(logging.INFO if healthy else logging.WARNING, f"AI provider '{name}' marked {'healthy' if healthy else 'unhealthy'}: {reason or 'recovered'}")
+        state["healthy"] = healthy
+        state["reason"] = reason
+
+    def is_healthy(self, name: str) -> bool:
+        state = self._states.get(name)
+        return state is None or state["healthy"]
+
+    def latency_ms(self, name: str) -> Optional[float]:
+        state = self._states.get(name)
+        return state["latency_ewma_ms"] if state else None
+
+    def record_success(self, name: str, latency_seconds: float):
+        state = self._state(name)
+        state["successes"] += 1
+        state["consecutive_failures"] = 0
+        latency_ms = latency_seconds * 1000.0
+        previous = state["latency_ewma_ms"]
+        state["latency_ewma_ms"] = latency_ms if previous is None else previous + self.EWMA_ALPHA * (latency_ms - previous)
+        self._set_healthy(name, True, None)
+
+    def record_failure(self, name: str, error: Exception):
+        state = self._state(name)
+        state["failures"] += 1
+        state["consecutive_failures"] += 1
+        state["last_error"] = f"{type(error).__name__}: {error}"[:300]
+        if state["consecutive_failures"] >= self.failure_threshold:
+            self._set_healthy(name, False, f"{state['consecutive_failures']} consecutive failed calls")
+
+    async def probe(self, name: str) -> bool:
+        state = self._state(name)
+        address = _ai_provider_address(name)
+        started = time.perf_counter()
+        ok, error, writer = True, None, None
+        if address:
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(*address), timeout=self.probe_timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                ok, error = False, f"{address[0]}:{address[1]} unreachable ({type(e).__name__})"
+        latency_ms = round((time.perf_counter() - started) * 1000.0, 1)
+        if writer is not None:
+            # The connect answered the probe; how the close goes doesn't matter.
+            writer.close()
+            with suppress(OSError, asyncio.TimeoutError):
+                await asyncio.wait_for(writer.wait_closed(), timeout=self.probe_timeout)
+        state["last_probe_at"] = time.time()
+        state["last_probe_ok"] = ok
+        state["probe_latency_ms"] = latency_ms if ok else None
+        if ok:
+            if not state["healthy"]:
+                state["consecutive_failures"] = 0
+                self._set_healthy(name, True, None)
+        else:
+            self._set_healthy(name, False, error)
+        return ok
+
+    async def _run(self, names: List[str]):
+        while True:
+            results = await asyncio.gather(*(self.probe(name) for name in names), return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"AI health probe failed unexpectedly: {result}")
+            await asyncio.sleep(self.probe_interval)
+
+    def start(self, names: List[str]):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(list(names)))
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def snapshot(self, name: str) -> dict:
+        state = dict(self._state(name))
+        for key in ("changed_at", "last_probe_at"):
+            if state[key] is not None:
+                state[key] = datetime.fromtimestamp(state[key], timezone.utc).isoformat()
+        if state["latency_ewma_ms"] is not None:
+            state["latency_ewma_ms"] = round(state["latency_ewma_ms"], 1)
+        state["monitor_running"] = self._task is not None and not self._task.done()
+        return state
+
+
+_ai_health = _AIHealthMonitor(AI_HEALTH_FAILURE_THRESHOLD, AI_HEALTH_PROBE_INTERVAL_SECONDS, AI_HEALTH_PROBE_TIMEOUT_SECONDS)
+
+
+# ==================== AI ROUTER ====================
+# Spreads AI calls over the AI_PROVIDERS backends. Each call ranks the
+# backends that are healthy, not circuit-open and within their RPM/TPM
+# limits by score (latency EWMA from the health monitor, inflated by the
+# recent error rate) and picks an order by weighted random choice, so the
+# fastest backend gets most traffic while the others keep fresh latency
+# numbers. A failed call fails over to the next backend in that order;
+# streams only fail over before their first token.
+
+class _AIRouter:
+    ERROR_EWMA_ALPHA = 0.2
+
+    def __init__(self, names: List[str]):
+        self.names = list(dict.fromkeys(names))
+        self._error_rate = {name: 0.0 for name in self.names}
+        self._stats = {name: {"selected": 0, "failovers": 0, "successes": 0, "failures": 0, "throttled": 0} for name in self.names}
+
+    def backends(self) -> List[str]:
+        return [name for name in self.names if _ai_provider_configured(name)]
+
+    def any_healthy(self) -> bool:
+        return any(_ai_health.is_healthy(name) for name in self.backends())
+
+    def _skip_reason(self, name: str, tokens: int) -> Optional[str]:
+        if not _ai_health.is_healthy(name):
+            return "unhealthy"
+        provider = get_ai_provider(name)
+        if provider.breaker.is_open():
+            return "circuit_open"
+        if not provider.limiter.has_capacity(tokens):
+            return "rate_limited"
+        return None
+
+    def _score(self, name: str, default_latency_ms: float) -> float:
+        latency = _ai_health.latency_ms(name)
+        return max(1.0, latency if latency is not None else default_latency_ms) * (1 + AI_ROUTER_ERROR_PENALTY * self._error_rate[name])
+
+    def ranked(self, tokens: int) -> List[_AIProvider]:
+        """Eligible backends in the order to try them (weighted by 1 / score^2)."""
+        eligible = [name for name in self.backends() if self._skip_reason(name, tokens) is None]
+        known = [latency for latency in map(_ai_health.latency_ms, eligible) if latency is not None]
+        # Backends without measurements yet look as fast as the best one, so they get tried.
+        default_latency_ms = min(known) if known else 1.0
+        weights = {name: 1.0 / self._score(name, default_latency_ms) ** 2 for name in eligible}
+
+        order = []
+        while weights:
+            pick = random.uniform(0, sum(weights.values()))
+            for name, weight in weights.items():
+                pick -= weight
+                if pick <= 0:
+                    break
+            order.append(name)
+            del weights[name]
+        return [get_ai_provider(name) for name in order]
+
+    def _no_backend_error(self, tokens: int) -> AIProviderError:
+        reasons = {name: self._skip_reason(name, tokens) for name in self.backends()}
+        if reasons and all(reason == "rate_limited" for reason in reasons.values()):
+            wait = min(get_ai_provider(name).limiter.retry_after(tokens) for name in reasons)
+            return AIProviderThrottled(f"All AI backends are at their rate limits (retry in {wait:.1f}s)")
+        detail = ", ".join(f"{name}: {reason}" for name, reason in reasons.items()) or "none configured"
+        return AICircuitOpen(f"No AI backend available ({detail})")
+
+    def _record(self, name: str, error: Optional[AIProviderError]):
+        if isinstance(error, AIProviderThrottled):
+            # Our own limit, not the backend's fault.
+            self._stats[name]["throttled"] += 1
+            return
+        failed = error is not None and (error.trips_breaker or isinstance(error, AIProviderRateLimited))
+        self._error_rate[name] += self.ERROR_EWMA_ALPHA * ((1.0 if failed else 0.0) - self._error_rate[name])
+        self._stats[name]["failures" if error is not None else "successes"] += 1
+
+    def _attempts(self, tokens: int):
+        candidates = self.ranked(tokens)
+        if not candidates:
+            raise self._no_backend_error(tokens)
+        for index, provider in enumerate(candidates):
+            self._stats[provider.name]["selected"] += 1
+            if index:
+                self._stats[provider.name]["failovers"] += 1
+            yield provider
+
+    async def complete(self, messages: List[dict], max_tokens: int = 2000, temperature: float = 0.7, usage: Optional[dict] = None) -> str:
+        error = None
+        for provider in self._attempts(_estimate_ai_tokens(messages) + max_tokens):
+            try:
+                text = await provider.complete_hedged(messages, max_tokens, temperature, usage)
+            except AIProviderRejected:
+                # The request itself was refused; another backend would refuse it too.
+                raise
+            except AIProviderError as e:
+                self._record(provider.name, e)
+                logger.warning(f"AI backend '{provider.name}' failed ({e.kind}); trying the next one")
+                error = e
+                continue
+            self._record(provider.name, None)
+            return text
+        raise error
+
+    async def stream(self, messages: List[dict], max_tokens: int = 2000, temperature: float = 0.7, usage: Optional[dict] = None):
+        error = None
+        for provider in self._attempts(_estimate_ai_tokens(messages) + max_tokens):
+            started = False
+            try:
+                async for delta in provider.stream(messages, max_tokens, temperature, usage):
+                    started = True
+                    yield delta
+            except AIProviderError as e:
+                self._record(provider.name, e)
+                if started or isinstance(e, AIProviderRejected):
+                    raise
+                logger.warning(f"AI backend '{provider.name}' failed to stream ({e.kind}); trying the next one")
+                error = e
+                continue
+            self._record(provider.name, None)
+            return
+        raise error
+
+    def stats(self) -> dict:
+        backends = {}
+        for name in self.names:
+            configured = _ai_provider_configured(name)
+            latency = _ai_health.latency_ms(name)
+            backends[name] = {
+                "configured": configured,
+                "skip_reason": self._skip_reason(name, 0) if configured else "not_configured",
+                "latency_ewma_ms": round(latency, 1) if latency is not None else None,
+                "error_rate": round(self._error_rate[name], 3),
+                **self._stats[name],
+            }
+        return {"backends": backends}
+
+
+_ai_router = _AIRouter(AI_PROVIDERS or ([AI_MODE] if _ai_provider_kind(AI_MODE) else []))
+
+
+# ==================== AI RESPONSE CACHE ====================
+# Tutor and assistant answers keyed on normalized prompt + system instruction
+# + provider/model. Callers opt in per request with a cache scope (the
+# settings the answer depends on besides the question, e.g. topic and
+# difficulty) and the question text; the similarity tier only compares
+# questions within the same scope. Prompts carrying private tutor contexts
+# must not pass a scope (counted as bypassed).
+
+_MINHASH_PERMUTATIONS = 64
+_MINHASH_BANDS = 16  # 4 rows per band: pairs with Jaccard >= ~0.7 almost always share a band
+_MINHASH_PRIME = (1 << 61) - 1
+_MINHASH_SEEDS = [
+    (random.Random(i).randrange(1, _MINHASH_PRIME), random.Random(-i - 1).randrange(0, _MINHASH_PRIME))
+    for i in range(_MINHASH_PERMUTATIONS)
+]
+
+
+def _normalize_ai_text(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", (text or "").lower()).split())
+
+
+def _minhash_signature(text: str) -> tuple:
+    """MinHash of the character 4-grams of normalized text."""
+    normalized = _normalize_ai_text(text)
+    shingles = {normalized[i:i + 4] for i in range(max(1, len(normalized) - 3))}
+    hashes = [int.from_bytes(hashlib.blake2b(sh.encode(), digest_size=8).digest(), "big") for sh in shingles]
+    return tuple(min((a * h + b) % _MINHASH_PRIME for h in hashes) for a, b in _MINHASH_SEEDS)
+
+
+def _ai_cache_key(prompt: str, system_instruction: Optional[str]) -> str:
+    # Answers from any backend in the router pool are interchangeable.
+    model = ",".join(f"{name}:{get_ai_provider(name).model}" for name in _ai_router.backends())
+    # Only case and whitespace are folded here: punctuation matters in code snippets.
+    raw = "\x1f".join([model, " ".join((system_instruction or "").split()), " ".join(prompt.lower().split())])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _AIResponseCache:
+    """TTL + LRU cache with entry and byte caps and an optional MinHash tier."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int, max_bytes: int, similarity_threshold: float):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._bands: Dict[tuple, set] = {}
+        self._bytes = 0
+        self._stats = {
+            "exact_hits": 0,
+            "similar_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def _band_keys(self, scope: str, signature: tuple) -> List[tuple]:
+        rows = _MINHASH_PERMUTATIONS // _MINHASH_BANDS
+        return [(scope, band, signature[band * rows:(band + 1) * rows]) for band in range(_MINHASH_BANDS)]
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry["size"]
+        for band_key in entry["bands"]:
+            keys = self._bands.get(band_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._bands[band_key]
+
+    def _live(self, key: str, now: float) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is not None and entry["expires_at"] <= now:
+            self._remove(key)
+            self._stats["expirations"] += 1
+            return None
+        return entry
+
+    def _similar(self, scope: str, question: str, now: float) -> Optional[str]:
+        signature = _minhash_signature(question)
+        candidates = set()
+        for band_key in self._band_keys(scope, signature):
+            candidates.update(self._bands.get(band_key, ()))
+        best_key, best_score = None, self.similarity_threshold
+        for key in candidates:
+            entry = self._live(key, now)
+            if entry is None:
+                continue
+            score = sum(1 for a, b in zip(signature, entry["signature"]) if a == b) / _MINHASH_PERMUTATIONS
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def get(self, key: str, scope: str, question: str) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            hit_key = key if self._live(key, now) is not None else None
+            if hit_key is not None:
+                self._stats["exact_hits"] += 1
+            elif self.similarity_threshold > 0 and question:
+                hit_key = self._similar(scope, question, now)
+                if hit_key is not None:
+                    self._stats["similar_hits"] += 1
+            if hit_key is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(hit_key)
+            return self._entries[hit_key]["response"]
+
+    def put(self, key: str, scope: str, question: str, response: str) -> None:
+        size = len(response.encode("utf-8")) + len(question or "") + 200
+        if size > self.max_bytes:
+            return
+        signature = _minhash_signature(question) if self.similarity_threshold > 0 and question else None
+        bands = self._band_keys(scope, signature) if signature else []
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "response": response,
+                "signature": signature,
+                "bands": bands,
+                "size": size,
+                "expires_at": time.monotonic() + self.ttl_seconds,
+            }
+            self._bytes += size
+            for band_key in bands:
+                self._bands.setdefault(band_key, set()).add(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def note_bypass(self) -> None:
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bands.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._stats["exact_hits"] + self._stats["similar_hits"]
+            lookups = hits + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hit_rate": round(hits / lookups, 4) if lookups else None,
+                "similarity_threshold": self.similarity_threshold or None,
+                "ttl_seconds": self.ttl_seconds,
+                "enabled": AI_CACHE_ENABLED,
+            }
+
+
+_ai_response_cache = _AIResponseCache(
+    AI_CACHE_TTL_SECONDS,
+    AI_CACHE_MAX_ENTRIES,
+    int(AI_CACHE_MAX_MB * 1024 * 1024),
+    AI_CACHE_SIMILARITY_THRESHOLD,
+)
+
+
+# ==================== PROMPT BUDGETS ====================
+# Every AI call is planned against its endpoint's budget: the prompt is cut
+# down to the endpoint's prompt token budget (middle-out, so the instructions
+# at the start and the output format at the end survive) and max_tokens is
+# the endpoint's reply cap, lowered when the prompt leaves less room in the
+# context window. Token usage reported by the provider is summed per user,
+# endpoint and UTC day in ai_usage_daily.
+
+_TIKTOKEN_AVAILABLE = importlib.util.find_spec("tiktoken") is not None
+_TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+# endpoint -> (prompt token budget incl. system instruction, reply max_tokens)
+_AI_ENDPOINT_BUDGETS = {
+    "tutor": (6000, 1500),
+    "assistant": (2000, 600),
+    "code": (6000, 1200),
+    "code_batch": (12000, 3000),
+    "resume": (2000, 1200),
+    "interview_questions": (800, 500),
+    "interview": (4000, 1000),
+    "default": (4000, 2000),
+}
+
+
+class _Tokenizer:
+    """Token counts with tiktoken when available, else a word/punctuation estimate."""
+
+    def __init__(self, encoding_name: str):
+        self.encoding_name = encoding_name
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """The encoding, loaded on first use (preloaded off the loop at startup)."""
+        if self._loaded:
+            return self._encoding
+        with self._lock:
+            if not self._loaded and _TIKTOKEN_AVAILABLE:
+                try:
+                    import tiktoken
+
+                    self._encoding = tiktoken.get_encoding(self.encoding_name)
+                except Exception as e:
+                    # e.g. the encoding file cannot be downloaded on an offline host
+                    logger.warning(f"tiktoken encoding '{self.encoding_name}' unavailable ({e}); estimating token counts")
+            self._loaded = True
+        return self._encoding
+
+    @property
+    def exact(self) -> bool:
+        return self._load() is not None
+
+    def count(self, text: Optional[str]) -> int:
+        if not text:
+            return 0
+        encoding = self._load()
+        if encoding is not None:
+            return len(encoding.encode(text, disallowed_special=()))
+        # ~4 characters per token within a word, one per punctuation mark
+        return sum((len(piece) + 3) // 4 for piece in _TOKEN_PIECE_RE.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Keep the first 3/4 and the last 1/4 of max_tokens, joined by an elision marker."""
+        total = self.count(text)
+        if total <= max_tokens:
+            return text
+        budget = max(0, max_tokens - 16)  # room for the marker
+        head_tokens = budget * 3 // 4
+        tail_tokens = budget - head_tokens
+        encoding = self._load()
+        if encoding is not None:
+            ids = encoding.encode(text, disallowed_special=())
+            head = encoding.decode(ids[:head_tokens])
+            tail = encoding.decode(ids[len(ids) - tail_tokens:]) if tail_tokens else ""
+        else:
+            pieces = [(m.start(), m.end(), (m.end() - m.start() + 3) // 4) for m in _TOKEN_PIECE_RE.finditer(text)]
+            head_end, used = 0, 0
+            for _start, end, cost in pieces:
+                if used + cost > head_tokens:
+                    break
+                used, head_end = used + cost, end
+            tail_start, used = len(text), 0
+            for start, _end, cost in reversed(pieces):
+                if used + cost > tail_tokens:
+                    break
+                used, tail_start = used + cost, start
+            head, tail = text[:head_end], text[max(head_end, tail_start):]
+        omitted = max(0, total - self.count(head) - self.count(tail))
+        return f"{head}\n[... {omitted} tokens omitted ...]\n{tail}"
+
+
+_tokenizer = _Tokenizer(AI_TOKENIZER_ENCODING)
+
+
+def _ai_budget(endpoint: str) -> tuple:
+    """(prompt token budget, reply cap) for an endpoint, with AI_<ENDPOINT>_* overrides."""
+    prompt_tokens, max_tokens = _AI_ENDPOINT_BUDGETS.get(endpoint, _AI_ENDPOINT_BUDGETS["default"])
+    return _ai_setting(endpoint, "PROMPT_TOKENS", prompt_tokens), _ai_setting(endpoint, "MAX_TOKENS", max_tokens)
+
+
+_ai_budget_stats: Dict[str, dict] = {}
+
+
+def _plan_ai_prompt(endpoint: str, prompt: str, system_instruction: Optional[str]) -> tuple:
+    """(prompt trimmed to the endpoint's budget, max_tokens for the reply)."""
+    budget, reply_cap = _ai_budget(endpoint)
+    stats = _ai_budget_stats.setdefault(endpoint, {"calls": 0, "trimmed": 0, "prompt_tokens": 0, "completion_tokens": 0})
+    stats["calls"] += 1
+    system_tokens = _tokenizer.count(system_instruction)
+    prompt_tokens = _tokenizer.count(prompt)
+    if system_tokens + prompt_tokens > budget:
+        prompt = _tokenizer.truncate(prompt, max(64, budget - system_tokens))
+        prompt_tokens = _tokenizer.count(prompt)
+        stats["trimmed"] += 1
+    room = AI_CONTEXT_WINDOW_TOKENS - system_tokens - prompt_tokens - 16
+    return prompt, max(AI_MIN_COMPLETION_TOKENS, min(reply_cap, room))
+
+
+# Prompts longer than this (characters) are counted and trimmed off the loop:
+# encoding a tutor context of a few hundred KB takes tens of milliseconds.
+_AI_PLAN_THREAD_CHARS = 20000
+
+
+async def plan_ai_prompt(endpoint: str, prompt: str, system_instruction: Optional[str]) -> tuple:
+    if len(prompt) + len(system_instruction or "") > _AI_PLAN_THREAD_CHARS:
+        return await asyncio.to_thread(_plan_ai_prompt, endpoint, prompt, system_instruction)
+    return _plan_ai_prompt(endpoint, prompt, system_instruction)
+
+
+def _record_ai_usage_row(user_id: str, endpoint: str, day: str, prompt_tokens: int, completion_tokens: int):
+    with _sqlite_write_connection() as conn:
+        conn.execute(
+            "INSERT INTO ai_usage_daily (user_id, endpoint, day, requests, prompt_tokens, completion_tokens) VALUES (?, ?, ?, 1, ?, ?) "
+            "ON CONFLICT(user_id, endpoint, day) DO UPDATE SET requests = requests + 1, "
+            "prompt_tokens = prompt_tokens + excluded.prompt_tokens, completion_tokens = completion_tokens + excluded.completion_tokens",
+            (user_id, endpoint, day, int(prompt_tokens), int(completion_tokens)),
         )
 
-        return response.choices[0].message.content
+
+async def record_ai_usage(user_id: Optional[str], endpoint: str, usage: dict):
+    """Add one provider call's token usage to the endpoint stats and, for a user, ai_usage_daily."""
+    if not usage:
+        return
+    stats = _ai_budget_stats.setdefault(endpoint, {"calls": 0, "trimmed": 0, "prompt_tokens": 0, "completion_tokens": 0})
+    stats["prompt_tokens"] += usage.get("prompt_tokens", 0)
+    stats["completion_tokens"] += usage.get("completion_tokens", 0)
+    if not user_id:
+        return
+    day = datetime.now(timezone.utc).date().isoformat()
+    try:
+        await run_sqlite_write(_record_ai_usage_row, user_id, endpoint, day, usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
     except Exception as e:
-        logger.error(f"Error calling OpenAI: {e}")
-        return f"Error: Unable to get AI response. Please try again. ({str(e)})"
+        logger.error(f"Failed to record AI usage for {user_id}/{endpoint}: {e}")
 
 
-async def get_ai_response(prompt: str, session_id: str, system_instruction: str = None, response_type: str = "tutor") -> str:
-    """Get AI response - uses configured AI service or demo mode"""
-    
-    # Determine response type from prompt content
+def _fetch_ai_usage(user_id: str, since_day: str) -> List[dict]:
+    with _sqlite_connection() as conn:
+        cursor = conn.execute(
+            "SELECT endpoint, SUM(requests) AS requests, SUM(prompt_tokens) AS prompt_tokens, SUM(completion_tokens) AS completion_tokens "
+            "FROM ai_usage_daily WHERE user_id = ? AND day >= ? GROUP BY endpoint ORDER BY endpoint",
+            (user_id, since_day),
+        )
+        return [dict(row) for row in cursor.fetchall()]
+
+
+async def fetch_ai_usage(user_id: str, days: int) -> List[dict]:
+    since_day = (datetime.now(timezone.utc).date() - timedelta(days=max(0, days - 1))).isoformat()
+    return await asyncio.to_thread(_fetch_ai_usage, user_id, since_day)
+
+
+def ai_budget_stats() -> dict:
+    return {
+        "tokenizer": f"tiktoken:{AI_TOKENIZER_ENCODING}" if _tokenizer.exact else "estimate",
+        "endpoints": {
+            endpoint: {"prompt_budget": _ai_budget(endpoint)[0], "max_tokens": _ai_budget(endpoint)[1], **stats}
+            for endpoint, stats in _ai_budget_stats.items()
+        },
+    }
+
+
+async def _call_ai_provider(prompt: str, system_instruction: str = None, max_tokens: int = 2000, usage: Optional[dict] = None) -> str:
+    """One routed call (failover across backends, hedged when enabled); raises AIProviderError."""
+    return await _ai_router.complete(_ai_messages(prompt, system_instruction), max_tokens=max_tokens, temperature=0.7, usage=usage)
+
+
+# Default system instruction per response type
+_AI_SYSTEM_INSTRUCTIONS = {
+    "tutor": "You are an expert tutor and programming instructor. Provide clear, step-by-step explanations with code examples when appropriate.",
+    "code": "You are a code reviewer and programming expert. Analyze code for correctness, efficiency, and best practices. Provide constructive feedback.",
+    "resume": "You are a career counselor and resume expert. Analyze resumes for ATS compatibility, content quality, and improvement suggestions.",
+    "interview": "You are an experienced interviewer. Ask relevant technical questions and provide constructive feedback on answers."
+}
+
+
+def _detect_ai_response_type(prompt: str, response_type: str) -> str:
+    """Determine response type from prompt content"""
     if "code" in prompt.lower() or "evaluate" in prompt.lower():
-        response_type = "code"
+        return "code"
     elif "resume" in prompt.lower() or "credibility" in prompt.lower():
-        response_type = "resume"
+        return "resume"
     elif "interview" in prompt.lower() or "Q1:" in prompt or "Q2:" in prompt:
-        response_type = "interview"
-    
+        return "interview"
+    return response_type
+
+
+def _ai_provider_available() -> bool:
+    """Whether any routed backend can be called; logs why not (demo fallback)."""
     # Check AI mode - if demo, always use demo responses
     if AI_MODE == 'demo':
         logger.info("Using demo mode for AI response")
-        return _get_demo_response(prompt, response_type)
-    
-    # Check internet connectivity for real AI modes
-    if AI_MODE in ('azure', 'openai') and not _check_internet_connectivity():
-        logger.warning("No internet connection, falling back to demo mode")
-        return _get_demo_response(prompt, response_type)
+        return False
 
-    # Check if provider is configured
-    if AI_MODE == 'azure':
-        if not AZURE_OPENAI_API_KEY or not AZURE_OPENAI_ENDPOINT or not AZURE_OPENAI_DEPLOYMENT:
-            logger.warning("Azure OpenAI not configured, falling back to demo mode")
-            return _get_demo_response(prompt, response_type)
-    elif AI_MODE == 'openai':
-        if not OPENAI_API_KEY:
-            logger.warning("OpenAI not configured, falling back to demo mode")
-            return _get_demo_response(prompt, response_type)
-    else:
-        logger.warning(f"Unknown AI_MODE '{AI_MODE}', falling back to demo mode")
-        return _get_demo_response(prompt, response_type)
+    # Check if any backend is configured
+    if not _ai_router.backends():
+        logger.warning(f"No configured AI backend for AI_MODE '{AI_MODE}' ({', '.join(_ai_router.names) or 'none'}), falling back to demo mode")
+        return False
+
+    # Cached provider health (background probe + recent call outcomes)
+    if not _ai_router.any_healthy():
+        logger.warning("All AI backends are unhealthy, falling back to demo mode")
+        return False
+    return True
+
+
+def _ai_messages(prompt: str, system_instruction: Optional[str]) -> List[dict]:
+    messages = []
+    if system_instruction:
+        messages.append({"role": "system", "content": system_instruction})
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+def _ai_cache_lookup(prompt: str, system_instruction: str, cache_scope: Optional[str], cache_question: Optional[str]) -> tuple:
+    """(cache key or None when not caching, cached response or None)."""
+    if cache_scope is None or not AI_CACHE_ENABLED or not _ai_router.backends():
+        return None, None
+    key = _ai_cache_key(prompt, system_instruction)
+    return key, _ai_response_cache.get(key, cache_scope, cache_question)
+
+
+async def get_ai_response(
+    prompt: str,
+    session_id: str,
+    system_instruction: str = None,
+    response_type: str = "tutor",
+    cache_scope: Optional[str] = None,
+    cache_question: Optional[str] = None,
+    endpoint: Optional[str] = None,
+    user_id: Optional[str] = None,
+) -> str:
+    """Get AI response - uses configured AI service or demo mode
+
+    Pass cache_scope (and the bare question text for the similarity tier) to
+    serve/store the answer through the response cache; only real provider
+    answers are stored. The prompt is planned against the endpoint's token
+    budget (default: the response type) and the provider's token usage is
+    recorded for user_id.
+    """
+    response_type = _detect_ai_response_type(prompt, response_type)
     
     # Set appropriate system instruction based on response type
-    default_system_instructions = {
-        "tutor": "You are an expert tutor and programming instructor. Provide clear, step-by-step explanations with code examples when appropriate.",
-        "code": "You are a code reviewer and programming expert. Analyze code for correctness, efficiency, and best practices. Provide constructive feedback.",
-        "resume": "You are a career counselor and resume expert. Analyze resumes for ATS compatibility, content quality, and improvement suggestions.",
-        "interview": "You are an experienced interviewer. Ask relevant technical questions and provide constructive feedback on answers."
-    }
-    
-    system_instruction = system_instruction or default_system_instructions.get(response_type, default_system_instructions["tutor"])
-    
-    for attempt in range(3):
-        try:
-            if attempt > 0:
-                await asyncio.sleep(2 * attempt)
-            
-            if AI_MODE == 'azure':
-                response = await asyncio.to_thread(
-                    _call_azure_openai_sync,
-                    prompt,
-                    system_instruction
-                )
-            else:
-                response = await asyncio.to_thread(
-                    _call_openai_sync,
-                    prompt,
-                    system_instruction
-                )
-            
-            if not response.startswith("Error:"):
-                logger.info(f"Successfully got AI response (mode: {AI_MODE}, type: {response_type})")
-                return response
+    system_instruction = system_instruction or _AI_SYSTEM_INSTRUCTIONS.get(response_type, _AI_SYSTEM_INSTRUCTIONS["tutor"])
+
+    cache_key, cached = _ai_cache_lookup(prompt, system_instruction, cache_scope, cache_question)
+    if cached is not None:
+        return cached
 
+    if not _ai_provider_available():
+        return _get_demo_response(prompt, response_type)
+
+    endpoint = endpoint or response_type
+    # Identical prompts in flight share one provider call; its token usage
+    # is recorded for the caller that started it.
+    return await _single_flight.do(
+        "ai",
+        (endpoint, response_type, system_instruction, prompt),
+        _request_ai_response,
+        prompt,
+        system_instruction,
+        response_type,
+        endpoint,
+        user_id,
+        cache_key,
+        cache_scope,
+        cache_question,
+    )
+
+
+async def _request_ai_response(
+    prompt: str,
+    system_instruction: str,
+    response_type: str,
+    endpoint: str,
+    user_id: Optional[str],
+    cache_key: Optional[str],
+    cache_scope: Optional[str],
+    cache_question: Optional[str],
+) -> str:
+    """The provider call behind get_ai_response: retries, then the demo answer."""
+    planned_prompt, max_tokens = await plan_ai_prompt(endpoint, prompt, system_instruction)
+    usage: Dict[str, int] = {}
+    _ai_retry_budget.record_request()
+    for attempt in range(max(1, AI_MAX_ATTEMPTS)):
+        if attempt > 0:
+            if not _ai_retry_budget.try_spend():
+                logger.warning(f"AI retry budget exhausted, not retrying '{AI_MODE}'")
+                break
+            await asyncio.sleep(_ai_backoff_seconds(attempt))
+
+        try:
+            response = await _call_ai_provider(planned_prompt, system_instruction, max_tokens=max_tokens, usage=usage)
+        except AIProviderQuotaExceeded:
             # If the provider is configured but the account has no quota/billing,
             # return a clear error instead of misleading demo content.
-            lowered = response.lower()
-            if "insufficient_quota" in lowered or "exceeded your current quota" in lowered:
-                return (
-                    "OpenAI quota/billing issue: your account has no available quota for API calls. "
-                    "Please check Billing/Usage in your OpenAI dashboard (add a payment method or credits), "
-                    "then try again."
-                )
-            
-            # If AI call fails, fall back to demo mode
-            if attempt == 2:
-                logger.warning(f"AI provider '{AI_MODE}' failed, falling back to demo mode")
-                return _get_demo_response(prompt, response_type)
-                
-        except Exception as e:
-            logger.error(f"Error calling AI provider '{AI_MODE}' (attempt {attempt + 1}): {e}")
-            if attempt == 2:
-                logger.warning(f"AI provider '{AI_MODE}' failed, falling back to demo mode")
-                return _get_demo_response(prompt, response_type)
-    
+            return (
+                "OpenAI quota/billing issue: your account has no available quota for API calls. "
+                "Please check Billing/Usage in your OpenAI dashboard (add a payment method or credits), "
+                "then try again."
+            )
+        except AIProviderError as e:
+            logger.error(f"Error calling AI provider '{AI_MODE}' (attempt {attempt + 1}, {e.kind}): {e}")
+            if not e.retryable:
+                break
+            continue
+
+        logger.info(f"Successfully got AI response (mode: {AI_MODE}, type: {response_type})")
+        await record_ai_usage(user_id, endpoint, usage)
+        if cache_key is not None:
+            _ai_response_cache.put(cache_key, cache_scope, cache_question, response)
+        return response
+
+    # If AI call fails, fall back to demo mode
+    logger.warning(f"AI provider '{AI_MODE}' failed, falling back to demo mode")
     return _get_demo_response(prompt, response_type)
 
 
+async def stream_ai_response(
+    prompt: str,
+    session_id: str,
+    system_instruction: str = None,
+    response_type: str = "tutor",
+    cache_scope: Optional[str] = None,
+    cache_question: Optional[str] = None,
+    endpoint: Optional[str] = None,
+    user_id: Optional[str] = None,
+):
+    """Streaming get_ai_response: yields the response text in pieces as the provider produces them.
+
+    If the provider fails before the first token, falls back to get_ai_response
+    (retries, then demo) and yields its result whole; a failure mid-stream
+    raises AIProviderError since part of the answer has already been sent.
+    Cache hits are yielded whole; a completed stream is stored.
+    """
+    response_type = _detect_ai_response_type(prompt, response_type)
+    system_instruction = system_instruction or _AI_SYSTEM_INSTRUCTIONS.get(response_type, _AI_SYSTEM_INSTRUCTIONS["tutor"])
+
+    cache_key, cached = _ai_cache_lookup(prompt, system_instruction, cache_scope, cache_question)
+    if cached is not None:
+        yield cached
+        return
+
+    if not _ai_provider_available():
+        yield _get_demo_response(prompt, response_type)
+        return
+
+    endpoint = endpoint or response_type
+    planned_prompt, max_tokens = await plan_ai_prompt(endpoint, prompt, system_instruction)
+    usage: Dict[str, int] = {}
+    parts: List[str] = []
+    try:
+        async for delta in _ai_router.stream(_ai_messages(planned_prompt, system_instruction), max_tokens=max_tokens, usage=usage):
+            parts.append(delta)
+            yield delta
+    except AIProviderError as e:
+        if parts:
+            await record_ai_usage(user_id, endpoint, usage)
+            raise AIProviderError(f"AI stream interrupted: {e}") from e
+        logger.warning(f"Streaming failed on every AI backend ({e.kind}: {e}); retrying without streaming")
+        yield await get_ai_response(
+            prompt,
+            session_id,
+            system_instruction=system_instruction,
+            response_type=response_type,
+            cache_scope=cache_scope,
+            cache_question=cache_question,
+            endpoint=endpoint,
+            user_id=user_id,
+        )
+        return
+
+    await record_ai_usage(user_id, endpoint, usage)
+    if cache_key is not None and parts:
+        _ai_response_cache.put(cache_key, cache_scope, cache_question, "".join(parts))
+
+
 # Backwards compatibility alias
 async def get_gemini_response(prompt: str, session_id: str) -> str:
     """Backwards compatible wrapper - now uses AI service or demo mode"""
@@ -3389,25 +7126,9 @@ async def get_gemini_response(prompt: str, session_id: str) -> str:
 
 # ==================== MISSING HELPER FUNCTIONS ====================
 
-async def store_job(job_doc: dict):
-    """Store a job posting in the database"""
-    await asyncio.to_thread(_insert_job, job_doc)
-
-async def get_company_jobs(company_id: str) -> List[dict]:
-    """Get all jobs for a company"""
-    return await asyncio.to_thread(_fetch_company_jobs, company_id)
-
 async def delete_test(test_id: str):
     """Delete a test from the database"""
-    await asyncio.to_thread(_delete_test_record, test_id)
-
-async def delete_job_record(job_id: str):
-    """Delete a job from the database"""
-    await asyncio.to_thread(_delete_job_record, job_id)
-
-async def update_candidate_status(candidate_id: str, status: str):
-    """Update candidate application status"""
-    await asyncio.to_thread(_update_candidate_status, candidate_id, status)
+    await run_sqlite_write(_delete_test_record, test_id)
 
 async def get_college_announcements(college_id: str) -> List[dict]:
     """Get all announcements for a college"""
@@ -3415,59 +7136,20 @@ async def get_college_announcements(college_id: str) -> List[dict]:
 
 async def store_announcement(announcement_doc: dict):
     """Store an announcement in the database"""
-    await asyncio.to_thread(_insert_announcement, announcement_doc)
+    await run_sqlite_write(_insert_announcement, announcement_doc)
 
 async def delete_announcement_record(announcement_id: str):
     """Delete an announcement from the database"""
-    await asyncio.to_thread(_delete_announcement_record, announcement_id)
+    await run_sqlite_write(_delete_announcement_record, announcement_id)
 
 async def store_message(message_doc: dict):
     """Store a message in the database"""
-    await asyncio.to_thread(_insert_message, message_doc)
+    await run_sqlite_write(_insert_message, message_doc)
 
 # Database helper functions implementation
-def _insert_job(job_doc: dict):
-    with _sqlite_connection() as conn:
-        conn.execute(
-            """INSERT INTO jobs (id, company_id, title, description, requirements, location, salary_range, created_at, status)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (job_doc['id'], job_doc['company_id'], job_doc['title'], job_doc['description'],
-             json.dumps(job_doc.get('requirements', [])), job_doc.get('location'), 
-             job_doc.get('salary_range'), job_doc['created_at'], job_doc.get('status', 'active'))
-        )
-        conn.commit()
-
-def _fetch_company_jobs(company_id: str) -> List[dict]:
-    with _sqlite_connection() as conn:
-        cursor = conn.execute(
-            "SELECT * FROM jobs WHERE company_id = ? ORDER BY created_at DESC",
-            (company_id,)
-        )
-        rows = cursor.fetchall()
-    jobs = []
-    for row in rows:
-        job = dict(row)
-        job['requirements'] = json.loads(job.get('requirements', '[]'))
-        jobs.append(job)
-    return jobs
-
 def _delete_test_record(test_id: str):
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute("DELETE FROM tests WHERE id = ?", (test_id,))
-        conn.commit()
-
-def _delete_job_record(job_id: str):
-    with _sqlite_connection() as conn:
-        conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
-        conn.commit()
-
-def _update_candidate_status(candidate_id: str, status: str):
-    with _sqlite_connection() as conn:
-        conn.execute(
-            "UPDATE users SET application_status = ? WHERE id = ?",
-            (status, candidate_id)
-        )
-        conn.commit()
 
 def _fetch_college_announcements(college_id: str) -> List[dict]:
     with _sqlite_connection() as conn:
@@ -3479,7 +7161,7 @@ def _fetch_college_announcements(college_id: str) -> List[dict]:
     return [dict(row) for row in rows]
 
 def _insert_announcement(announcement_doc: dict):
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             """INSERT INTO announcements (id, college_id, title, message, type, target_students, created_at, created_by)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
@@ -3488,15 +7170,13 @@ def _insert_announcement(announcement_doc: dict):
              json.dumps(announcement_doc.get('target_students', [])),
              announcement_doc['created_at'], announcement_doc['created_by'])
         )
-        conn.commit()
 
 def _delete_announcement_record(announcement_id: str):
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute("DELETE FROM announcements WHERE id = ?", (announcement_id,))
-        conn.commit()
 
 def _insert_message(message_doc: dict):
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             """INSERT INTO messages (id, from_id, to_id, subject, message, created_at, type)
                VALUES (?, ?, ?, ?, ?, ?, ?)""",
@@ -3504,7 +7184,819 @@ def _insert_message(message_doc: dict):
              message_doc['subject'], message_doc['message'], message_doc['created_at'],
              message_doc.get('type', 'message'))
         )
-        conn.commit()
+
+# ==================== QUOTAS ====================
+# Per-user limits on the expensive endpoints. Handlers call enforce_quota()
+# first thing, so requests FastAPI rejects as invalid are never counted; a
+# request answered from the AI response cache still counts, as the quota is
+# per request rather than per provider call. Each action has a sliding-window limit
+# (window split into buckets; a bucket's events expire together) kept by a
+# pluggable backend, and every admitted request also takes a token from the
+# user's in-process burst bucket. Rejections are 429s with Retry-After; keys
+# with nothing left in their window are pruned every few minutes.
+
+class _QuotaPolicy:
+    def __init__(self, limit: int, window_seconds: int = 86400, buckets: int = 24):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.bucket_seconds = max(1, window_seconds // buckets)
+
+    def buckets_at(self, now: float) -> tuple:
+        """(current bucket, oldest bucket still in the window); an event
+        counts for between window_seconds and one bucket longer."""
+        return int(now // self.bucket_seconds), int((now - self.window_seconds) // self.bucket_seconds)
+
+
+_QUOTA_POLICIES = {
+    "ai": _QuotaPolicy(MAX_DAILY_AI_REQUESTS),
+    "code": _QuotaPolicy(MAX_CODE_SUBMISSIONS_PER_DAY),
+    "interview": _QuotaPolicy(MAX_INTERVIEWS_PER_DAY),
+    # Evaluations are counted separately so each started interview can be evaluated.
+    "interview_evaluation": _QuotaPolicy(MAX_INTERVIEWS_PER_DAY),
+}
+
+
+def _quota_retry_after(buckets: List[tuple], policy: _QuotaPolicy, now: float, count: int = 1) -> float:
+    """Seconds until enough of the oldest buckets expire to admit `count` more events."""
+    excess = sum(count for _, count in buckets) - policy.limit + count
+    for bucket, count in sorted(buckets):
+        excess -= count
+        if excess <= 0:
+            return max(1.0, (bucket + 1) * policy.bucket_seconds + policy.window_seconds - now)
+    return float(policy.window_seconds)
+
+
+class _MemoryQuotaBackend:
+    """Window buckets in a dict; per process."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Dict[int, int]] = {}
+
+    def _live(self, key: str, oldest: int) -> Dict[int, int]:
+        buckets = self._buckets.get(key, {})
+        for bucket in [b for b in buckets if b < oldest]:
+            del buckets[bucket]
+        if not buckets:
+            self._buckets.pop(key, None)
+        return buckets
+
+    async def hit(self, key: str, bucket: int, oldest: int, limit: int, count: int = 1) -> tuple:
+        """Count `count` events if they fit under limit; returns (allowed, [(bucket, count)])."""
+        with self._lock:
+            buckets = self._live(key, oldest)
+            if sum(buckets.values()) + count > limit:
+                return False, list(buckets.items())
+            buckets[bucket] = buckets.get(bucket, 0) + count
+            self._buckets[key] = buckets
+            return True, list(buckets.items())
+
+    async def peek(self, key: str, oldest: int) -> List[tuple]:
+        with self._lock:
+            return list(self._live(key, oldest).items())
+
+    async def prune(self, action: str, oldest: int) -> int:
+        """Forget `action` keys with nothing left in the window; returns how many."""
+        prefix = f"{action}:"
+        with self._lock:
+            idle = [key for key, buckets in self._buckets.items() if key.startswith(prefix) and max(buckets, default=oldest - 1) < oldest]
+            for key in idle:
+                del self._buckets[key]
+        return len(idle)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"keys": len(self._buckets)}
+
+
+def _sqlite_quota_hit(key: str, bucket: int, oldest: int, limit: int, count: int = 1) -> tuple:
+    with _sqlite_write_connection() as conn:
+        conn.execute("DELETE FROM quota_counters WHERE key = ? AND bucket < ?", (key, oldest))
+        rows = [(row["bucket"], row["count"]) for row in conn.execute("SELECT bucket, count FROM quota_counters WHERE key = ?", (key,))]
+        if sum(n for _, n in rows) + count > limit:
+            return False, rows
+        conn.execute(
+            "INSERT INTO quota_counters (key, bucket, count) VALUES (?, ?, ?) "
+            "ON CONFLICT(key, bucket) DO UPDATE SET count = count + excluded.count",
+            (key, bucket, count),
+        )
+        counts = dict(rows)
+        counts[bucket] = counts.get(bucket, 0) + count
+        return True, list(counts.items())
+
+
+def _sqlite_quota_peek(key: str, oldest: int) -> List[tuple]:
+    with _sqlite_connection() as conn:
+        cursor = conn.execute("SELECT bucket, count FROM quota_counters WHERE key = ? AND bucket >= ?", (key, oldest))
+        return [(row["bucket"], row["count"]) for row in cursor.fetchall()]
+
+
+class _SQLiteQuotaBackend:
+    """Window buckets in the quota_counters table, shared by every process on
+    the same database. Check-and-count runs as one write (group-committed)."""
+
+    name = "sqlite"
+
+    async def hit(self, key: str, bucket: int, oldest: int, limit: int, count: int = 1) -> tuple:
+        return await run_sqlite_write(_sqlite_quota_hit, key, bucket, oldest, limit, count)
+
+    async def peek(self, key: str, oldest: int) -> List[tuple]:
+        return await asyncio.to_thread(_sqlite_quota_peek, key, oldest)
+
+    async def prune(self, action: str, oldest: int) -> int:
+        # Expired rows are deleted the next time their key is hit.
+        return 0
+
+    def stats(self) -> dict:
+        return {}
+
+
+_QUOTA_BACKENDS = {"memory": _MemoryQuotaBackend, "sqlite": _SQLiteQuotaBackend}
+
+
+class _BurstLimiter:
+    """Per-user token buckets (in process) for short bursts across all limited endpoints."""
+
+    def __init__(self, capacity: int, per_minute: float):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, tuple] = {}
+
+    def _tokens(self, user_id: str, now: float) -> float:
+        tokens, updated = self._buckets.get(user_id, (float(self.capacity), now))
+        return min(float(self.capacity), tokens + (now - updated) * self.rate)
+
+    def wait(self, user_id: str) -> float:
+        """Seconds until take() would succeed (0 if it would now), without taking a token."""
+        if self.capacity <= 0 or self.rate <= 0:
+            return 0.0
+        with self._lock:
+            tokens = self._tokens(user_id, time.monotonic())
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def take(self, user_id: str) -> float:
+        """Take a token; returns 0 on success, else seconds until one is available."""
+        if self.capacity <= 0 or self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._tokens(user_id, now)
+            if tokens < 1:
+                self._buckets[user_id] = (tokens, now)
+                return (1 - tokens) / self.rate
+            self._buckets[user_id] = (tokens - 1, now)
+            if len(self._buckets) > 50_000:
+                # Full buckets carry no state; drop them.
+                for key in [k for k, (t, u) in self._buckets.items() if t + (now - u) * self.rate >= self.capacity]:
+                    del self._buckets[key]
+            return 0.0
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, action: str, limit: int, retry_after: float, reason: str):
+        super().__init__(f"{action} quota exceeded ({reason})")
+        self.action = action
+        self.limit = limit
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _QuotaEngine:
+    # How often idle keys are dropped from the backend.
+    PRUNE_INTERVAL_SECONDS = 600
+
+    def __init__(self, backend, burst: _BurstLimiter):
+        self.backend = backend
+        self.burst = burst
+        self._pruned_at = time.monotonic()
+        self._stats = {"allowed": 0, "rejected_daily": 0, "rejected_burst": 0, "pruned_keys": 0}
+
+    async def check(self, user_id: str, action: str, count: int = 1) -> None:
+        """Admit `count` of `action` for the user (one burst token) or raise QuotaExceeded.
+
+        The daily limit is checked first and the burst token taken only once
+        the request is admitted, so a rejected request uses up neither.
+        """
+        policy = _QUOTA_POLICIES[action]
+        now = time.time()
+        await self._maybe_prune(now)
+        key = f"{action}:{user_id}"
+        bucket, oldest = policy.buckets_at(now)
+        wait = self.burst.wait(user_id)
+        if wait:
+            if policy.limit > 0:
+                buckets = await self.backend.peek(key, oldest)
+                if sum(n for _, n in buckets) + count > policy.limit:
+                    self._reject_daily(action, policy, buckets, now, count)
+            self._stats["rejected_burst"] += 1
+            raise QuotaExceeded(action, self.burst.capacity, wait, "too many requests in a short time")
+        if policy.limit > 0:
+            allowed, buckets = await self.backend.hit(key, bucket, oldest, policy.limit, count)
+            if not allowed:
+                self._reject_daily(action, policy, buckets, now, count)
+        self.burst.take(user_id)
+        self._stats["allowed"] += 1
+
+    def _reject_daily(self, action: str, policy: _QuotaPolicy, buckets: List[tuple], now: float, count: int):
+        self._stats["rejected_daily"] += 1
+        raise QuotaExceeded(action, policy.limit, _quota_retry_after(buckets, policy, now, count), "daily limit reached")
+
+    async def _maybe_prune(self, now: float) -> None:
+        if time.monotonic() - self._pruned_at < self.PRUNE_INTERVAL_SECONDS:
+            return
+        self._pruned_at = time.monotonic()
+        for action, policy in _QUOTA_POLICIES.items():
+            if policy.limit > 0:
+                self._stats["pruned_keys"] += await self.backend.prune(action, policy.buckets_at(now)[1])
+
+    async def usage(self, user_id: str) -> dict:
+        now = time.time()
+        result = {}
+        for action, policy in _QUOTA_POLICIES.items():
+            if policy.limit <= 0:
+                result[action] = {"limit": None, "used": None, "remaining": None, "retry_after_seconds": None}
+                continue
+            _, oldest = policy.buckets_at(now)
+            buckets = await self.backend.peek(f"{action}:{user_id}", oldest)
+            used = sum(count for _, count in buckets)
+            result[action] = {
+                "limit": policy.limit,
+                "used": used,
+                "remaining": max(0, policy.limit - used),
+                "retry_after_seconds": round(_quota_retry_after(buckets, policy, now)) if used >= policy.limit else 0,
+            }
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "enabled": QUOTA_ENABLED,
+            "backend": self.backend.name,
+            "limits": {action: policy.limit or None for action, policy in _QUOTA_POLICIES.items()},
+            "burst": {"capacity": self.burst.capacity, "per_minute": QUOTA_BURST_PER_MINUTE},
+            **self._stats,
+            **self.backend.stats(),
+        }
+
+
+if QUOTA_BACKEND not in _QUOTA_BACKENDS:
+    logger.warning(f"Unknown QUOTA_BACKEND '{QUOTA_BACKEND}', using memory")
+_quota_engine = _QuotaEngine(_QUOTA_BACKENDS.get(QUOTA_BACKEND, _MemoryQuotaBackend)(), _BurstLimiter(QUOTA_BURST, QUOTA_BURST_PER_MINUTE))
+
+
+async def enforce_quota(user_id: str, action: str, count: int = 1) -> None:
+    """Count `count` of `action` against the user's quota; 429 + Retry-After when over.
+
+    400 when `count` is more than the whole daily limit, since waiting
+    would never help.
+    """
+    if not QUOTA_ENABLED:
+        return
+    limit = _QUOTA_POLICIES[action].limit
+    if 0 < limit < count:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {limit} per day; this request needs {count}.",
+            headers={"X-RateLimit-Limit": str(limit)},
+        )
+    try:
+        await _quota_engine.check(user_id, action, count)
+    except QuotaExceeded as e:
+        retry_after = max(1, math.ceil(e.retry_after))
+        raise HTTPException(
+            status_code=429,
+            detail=f"Limit reached: {e.reason}. Try again in {_format_retry_after(retry_after)}.",
+            headers={"Retry-After": str(retry_after), "X-RateLimit-Limit": str(e.limit)},
+        )
+
+
+def _format_retry_after(seconds: int) -> str:
+    if seconds < 120:
+        return f"{seconds} seconds"
+    if seconds < 7200:
+        return f"{seconds // 60} minutes"
+    return f"{seconds // 3600} hours"
+
+
+# ==================== JOBS ====================
+# Slow AI evaluations (code, resume, interview) run as background jobs. The
+# endpoints enqueue a row in the background_jobs table (not the job-postings
+# `jobs` table of schema.sql) and either wait for it (the default; same
+# response as before) or return 202 with the job id, which the client polls
+# at GET /api/jobs/{id} or follows at GET /api/jobs/{id}/events. A
+# dispatcher task leases queued jobs while fewer than JOB_WORKERS run. A
+# kind's runner returns the history row, which is inserted in the same write
+# that marks the job succeeded, so a job re-run after a crash is stored once.
+
+_JOB_FINISHED = ("succeeded", "failed")
+_JOB_COLUMNS = "id, user_id, kind, status, payload, result, error, error_status, attempts, lease_until, created_at, started_at, finished_at"
+
+
+class _JobKind:
+    def __init__(self, run, insert, after=None):
+        self.run = run  # async (user_id, payload) -> history row
+        self.insert = insert  # write helper storing the row
+        self.after = after  # optional async (row), once committed
+
+
+_JOB_KINDS: Dict[str, _JobKind] = {}
+
+
+def _row_to_job(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"]) if job.get("payload") else {}
+    job["result"] = json.loads(job["result"]) if job.get("result") else None
+    return job
+
+
+def _insert_job(job: dict):
+    with _sqlite_write_connection() as conn:
+        conn.execute(
+            "INSERT INTO background_jobs (id, user_id, kind, status, payload, attempts, created_at) VALUES (?, ?, ?, 'queued', ?, 0, ?)",
+            (job["id"], job["user_id"], job["kind"], json.dumps(job["payload"]), job["created_at"]),
+        )
+
+
+def _claim_job(lease_seconds: float, max_attempts: int) -> Optional[dict]:
+    """Lease the oldest queued job, else one whose worker's lease ran out."""
+    now = time.time()
+    now_iso = datetime.now(timezone.utc).isoformat()
+    with _sqlite_write_connection() as conn:
+        row = conn.execute("SELECT id FROM background_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+        if row is None:
+            expired = conn.execute(
+                "SELECT id, attempts FROM background_jobs WHERE status = 'running' AND lease_until < ? ORDER BY created_at",
+                (now,),
+            ).fetchall()
+            for candidate in expired:
+                if candidate["attempts"] < max_attempts:
+                    row = candidate
+                    break
+                conn.execute(
+                    "UPDATE background_jobs SET status = 'failed', error = ?, error_status = 500, lease_until = NULL, finished_at = ? WHERE id = ?",
+                    ("The evaluation was interrupted. Please try again.", now_iso, candidate["id"]),
+                )
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE background_jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, started_at = ? WHERE id = ?",
+            (now + lease_seconds, now_iso, row["id"]),
+        )
+        return _row_to_job(conn.execute(f"SELECT {_JOB_COLUMNS} FROM background_jobs WHERE id = ?", (row["id"],)).fetchone())
+
+
+def _finish_job(job_id: str, attempt: int, insert, doc: dict) -> bool:
+    """Mark the job succeeded and store its row; False if the lease was lost."""
+    with _sqlite_write_connection() as conn:
+        cursor = conn.execute(
+            "UPDATE background_jobs SET status = 'succeeded', result = ?, lease_until = NULL, finished_at = ? WHERE id = ? AND status = 'running' AND attempts = ?",
+            (json.dumps(doc), datetime.now(timezone.utc).isoformat(), job_id, attempt),
+        )
+        if cursor.rowcount != 1:
+            return False
+        insert(doc)
+        return True
+
+
+def _fail_job(job_id: str, attempt: int, error: str, error_status: int):
+    with _sqlite_write_connection() as conn:
+        conn.execute(
+            "UPDATE background_jobs SET status = 'failed', error = ?, error_status = ?, lease_until = NULL, finished_at = ? WHERE id = ? AND status = 'running' AND attempts = ?",
+            (error, error_status, datetime.now(timezone.utc).isoformat(), job_id, attempt),
+        )
+
+
+def _requeue_job(job_id: str, attempt: int):
+    """Hand a job back (worker shutting down) without using up an attempt."""
+    with _sqlite_write_connection() as conn:
+        conn.execute(
+            "UPDATE background_jobs SET status = 'queued', attempts = attempts - 1, lease_until = NULL, started_at = NULL WHERE id = ? AND status = 'running' AND attempts = ?",
+            (job_id, attempt),
+        )
+
+
+def _prune_jobs(before: str) -> int:
+    with _sqlite_write_connection() as conn:
+        cursor = conn.execute(
+            "DELETE FROM background_jobs WHERE status IN ('succeeded', 'failed') AND created_at < ?",
+            (before,),
+        )
+        return cursor.rowcount
+
+
+def _fetch_job(job_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+    with _sqlite_connection() as conn:
+        row = conn.execute(f"SELECT {_JOB_COLUMNS} FROM background_jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None or (user_id is not None and row["user_id"] != user_id):
+        return None
+    return _row_to_job(row)
+
+
+def _fetch_jobs(user_id: str, limit: int) -> List[dict]:
+    with _sqlite_connection() as conn:
+        rows = conn.execute(
+            f"SELECT {_JOB_COLUMNS} FROM background_jobs WHERE user_id = ? ORDER BY created_at DESC LIMIT ?",
+            (user_id, limit),
+        ).fetchall()
+    return [_row_to_job(row) for row in rows]
+
+
+async def fetch_job(job_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+    return await asyncio.to_thread(_fetch_job, job_id, user_id)
+
+
+async def fetch_jobs(user_id: str, limit: int = 20) -> List[dict]:
+    return await asyncio.to_thread(_fetch_jobs, user_id, limit)
+
+
+class _JobQueue:
+    """Dispatches persisted jobs to at most `workers` concurrent runs.
+
+    Started lazily on the running loop (and at startup, to pick up jobs left
+    over from a previous run). enqueue() wakes the dispatcher; jobs enqueued
+    by other processes are found by polling every `poll_seconds`.
+    """
+
+    def __init__(self, workers: int, lease_seconds: float, max_attempts: int, poll_seconds: float):
+        self.workers = max(1, int(workers))
+        self.lease_seconds = max(1.0, float(lease_seconds))
+        self.max_attempts = max(1, int(max_attempts))
+        self.poll_seconds = max(0.05, float(poll_seconds))
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._running: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self._last_prune = 0.0
+        self._stats = {"enqueued": 0, "succeeded": 0, "failed": 0, "requeued": 0}
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.workers)
+        self._running = {}
+        self._waiters = {}
+        self._task = loop.create_task(self._dispatch(), name="job-dispatcher")
+
+    def start(self) -> None:
+        self._ensure_started()
+
+    async def enqueue(self, user_id: str, kind: str, payload: dict) -> dict:
+        if kind not in _JOB_KINDS:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        self._ensure_started()
+        job = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "kind": kind,
+            "status": "queued",
+            "payload": payload,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        await run_sqlite_write(_insert_job, job)
+        self._stats["enqueued"] += 1
+        self._wakeup.set()
+        return job
+
+    async def _dispatch(self) -> None:
+        while True:
+            await self._slots.acquire()
+            self._wakeup.clear()
+            try:
+                job = await run_sqlite_write(_claim_job, self.lease_seconds, self.max_attempts)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to claim a job: {e}")
+                job = None
+            if job is None:
+                self._slots.release()
+                await self._maybe_prune()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            task = self._loop.create_task(self._run(job), name=f"job-{job['id']}")
+            self._running[job["id"]] = task
+            task.add_done_callback(lambda _task, job_id=job["id"]: self._on_done(job_id))
+
+    def _on_done(self, job_id: str) -> None:
+        self._running.pop(job_id, None)
+        self._slots.release()
+        for future in self._waiters.get(job_id, []):
+            if not future.done():
+                future.set_result(None)
+
+    async def _run(self, job: dict) -> None:
+        kind = _JOB_KINDS.get(job["kind"])
+        try:
+            if kind is None:
+                raise HTTPException(status_code=500, detail=f"Unknown job kind '{job['kind']}'")
+            doc = await kind.run(job["user_id"], job["payload"])
+            stored = await run_sqlite_write(_finish_job, job["id"], job["attempts"], kind.insert, doc)
+        except asyncio.CancelledError:
+            await asyncio.shield(run_sqlite_write(_requeue_job, job["id"], job["attempts"]))
+            self._stats["requeued"] += 1
+            raise
+        except HTTPException as e:
+            await run_sqlite_write(_fail_job, job["id"], job["attempts"], str(e.detail), e.status_code)
+            self._stats["failed"] += 1
+            return
+        except Exception as e:
+            logger.exception(f"Job {job['id']} ({job['kind']}) failed: {e}")
+            await run_sqlite_write(_fail_job, job["id"], job["attempts"], "The evaluation failed. Please try again.", 500)
+            self._stats["failed"] += 1
+            return
+
+        if not stored:
+            logger.warning(f"Job {job['id']} finished after its lease was taken over; result discarded")
+            return
+        self._stats["succeeded"] += 1
+        if kind.after is not None:
+            await kind.after(doc)
+
+    async def _maybe_prune(self) -> None:
+        # Hourly housekeeping while idle: old jobs, then the upload cache.
+        if time.monotonic() - self._last_prune < 3600:
+            return
+        self._last_prune = time.monotonic()
+        now = datetime.now(timezone.utc)
+        if JOB_RETENTION_DAYS > 0:
+            cutoff = (now - timedelta(days=JOB_RETENTION_DAYS)).isoformat()
+            try:
+                removed = await run_sqlite_write(_prune_jobs, cutoff)
+            except Exception as e:
+                logger.error(f"Failed to prune finished jobs: {e}")
+            else:
+                if removed:
+                    logger.info(f"Pruned {removed} finished jobs older than {JOB_RETENTION_DAYS} days")
+        cache_before = (now - timedelta(days=UPLOAD_CACHE_DAYS)).isoformat() if UPLOAD_CACHE_DAYS > 0 else None
+        orphans_before = (now - timedelta(hours=UPLOAD_ORPHAN_HOURS)).isoformat() if UPLOAD_ORPHAN_HOURS > 0 else None
+        if cache_before or orphans_before:
+            try:
+                removed = await run_sqlite_write(_prune_upload_cache, cache_before, orphans_before)
+            except Exception as e:
+                logger.error(f"Failed to prune the upload cache: {e}")
+            else:
+                if removed["extractions"] or removed["blobs"]:
+                    logger.info(f"Pruned {removed['extractions']} cached extractions and {removed['blobs']} unreferenced uploads")
+
+    async def wait(self, job_id: str, user_id: Optional[str] = None, timeout: Optional[float] = None) -> Optional[dict]:
+        """The job once finished, or as it stands when `timeout` runs out (None if unknown)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, []).append(future)
+        try:
+            while True:
+                job = await fetch_job(job_id, user_id)
+                if job is None or job["status"] in _JOB_FINISHED:
+                    return job
+                delay = self.poll_seconds
+                if deadline is not None:
+                    delay = min(delay, deadline - time.monotonic())
+                    if delay <= 0:
+                        return job
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            waiters = self._waiters.get(job_id, [])
+            if future in waiters:
+                waiters.remove(future)
+            if not waiters:
+                self._waiters.pop(job_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "running": len(self._running),
+            "dispatcher_running": bool(self._task is not None and not self._task.done()),
+            **self._stats,
+        }
+
+    async def stop(self) -> None:
+        if self._task is not None and self._loop is asyncio.get_running_loop():
+            # In-flight jobs are handed back to the queue for the next start.
+            self._task.cancel()
+            running = list(self._running.values())
+            for task in running:
+                task.cancel()
+            await asyncio.gather(self._task, *running, return_exceptions=True)
+        self._task = None
+
+
+_job_queue = _JobQueue(JOB_WORKERS, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_POLL_SECONDS)
+
+
+def _public_job(job: dict) -> dict:
+    return {
+        "id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job.get("attempts", 0),
+        "created_at": job["created_at"],
+        "started_at": job.get("started_at"),
+        "finished_at": job.get("finished_at"),
+        "error": job.get("error"),
+        "result": job.get("result"),
+    }
+
+
+def job_accepted(job: dict) -> JSONResponse:
+    """202 for a job submitted with wait=false."""
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job["id"],
+            "kind": job["kind"],
+            "status": job["status"],
+            "status_url": f"/api/jobs/{job['id']}",
+            "events_url": f"/api/jobs/{job['id']}/events",
+        },
+        headers={"Location": f"/api/jobs/{job['id']}"},
+    )
+
+
+async def job_result(job: dict) -> dict:
+    """Wait for the job and return its row; a failed job raises its HTTP error."""
+    finished = await _job_queue.wait(job["id"])
+    if finished is None:
+        raise HTTPException(status_code=500, detail="The evaluation was lost. Please try again.")
+    if finished["status"] == "failed":
+        raise HTTPException(status_code=finished.get("error_status") or 500, detail=finished.get("error") or "The evaluation failed.")
+    return finished["result"]
+
+
+# ==================== SEARCH ====================
+# Full-text search over a user's learning history, tutor materials and
+# resume analyses. One FTS5 table (search_fts) indexes every searchable row;
+# search_docs maps its rowids (an INTEGER PRIMARY KEY, so VACUUM keeps them)
+# to the source row. search_fts is external-content over the search_content
+# view of those rows, so the text is stored once, in the source tables.
+# Triggers on the source tables keep both in sync, and
+# python tools/search_index.py rebuild|check backfills and verifies them.
+# The owner's id is an indexed column, so a query only walks that user's
+# postings.
+
+# kind -> (source table, title expression, body expression); "{row}" is
+# new/old in triggers and the table alias in rebuilds.
+_SEARCH_SOURCES = {
+    "learning": (
+        "learning_history",
+        "COALESCE({row}.topic, '')",
+        "COALESCE({row}.question, '') || char(10) || COALESCE({row}.response, '')",
+    ),
+    "context": (
+        "tutor_contexts",
+        "COALESCE({row}.source_name, {row}.source_url, '')",
+        "{row}.text_content",
+    ),
+    "resume": (
+        "resume_analyses",
+        "COALESCE({row}.filename, '')",
+        "COALESCE({row}.text_content, '') || char(10) || COALESCE({row}.analysis, '')",
+    ),
+}
+
+
+def _search_user_key(user_id: str) -> str:
+    # Same as replace(user_id, '-', '') in the triggers: a UUID as one token.
+    return str(user_id).replace("-", "")
+
+
+def _create_search_index(conn: sqlite3.Connection) -> None:
+    if not _sqlite_fts5_available(conn):
+        logger.warning("SQLite has no FTS5; /api/search is disabled")
+        return
+    conn.execute(
+        "CREATE VIEW IF NOT EXISTS search_content AS "
+        + " UNION ALL ".join(
+            f"SELECT d.rowid AS doc_rowid, replace(d.user_id, '-', '') AS user_key, "
+            f"{title.format(row='t')} AS title, {body.format(row='t')} AS body "
+            f"FROM search_docs d JOIN {table} t ON t.id = d.doc_id WHERE d.kind = '{kind}'"
+            for kind, (table, title, body) in _SEARCH_SOURCES.items()
+        )
+    )
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(user_key, title, body, "
+        "content='search_content', content_rowid='doc_rowid', tokenize='porter unicode61')"
+    )
+    for kind, (table, title, body) in _SEARCH_SOURCES.items():
+        doc_rowid = f"(SELECT rowid FROM search_docs WHERE kind = '{kind}' AND doc_id = {{row}}.id)"
+        # An external-content index is told the old text to remove it.
+        delete = (
+            f"INSERT INTO search_fts (search_fts, rowid, user_key, title, body) VALUES ('delete', {doc_rowid.format(row='old')}, "
+            f"replace(old.user_id, '-', ''), {title.format(row='old')}, {body.format(row='old')}); "
+        )
+        insert = (
+            f"INSERT INTO search_fts (rowid, user_key, title, body) VALUES ({doc_rowid.format(row='new')}, "
+            f"replace(new.user_id, '-', ''), {title.format(row='new')}, {body.format(row='new')}); "
+        )
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO search_docs (kind, doc_id, user_id, created_at) VALUES ('{kind}', new.id, new.user_id, new.created_at); "
+            f"{insert}END"
+        )
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN "
+            f"{delete}DELETE FROM search_docs WHERE kind = '{kind}' AND doc_id = old.id; END"
+        )
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE ON {table} BEGIN {delete}{insert}END")
+    _rebuild_search_index(conn)
+
+
+def _recreate_search_index(conn: sqlite3.Connection) -> None:
+    """Replace a search_fts that stored its own copy of the text."""
+    if not _sqlite_fts5_available(conn):
+        return
+    for table, _, _ in _SEARCH_SOURCES.values():
+        for suffix in ("ai", "ad", "au"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {table}_search_{suffix}")
+    conn.execute("DROP TABLE IF EXISTS search_fts")
+    conn.execute("DROP VIEW IF EXISTS search_content")
+    _create_search_index(conn)
+
+
+def _rebuild_search_index(conn: sqlite3.Connection) -> dict:
+    """Re-index every source row; returns {kind: rows}."""
+    conn.execute("DELETE FROM search_docs")
+    counts = {}
+    for kind, (table, _, _) in _SEARCH_SOURCES.items():
+        cursor = conn.execute(
+            f"INSERT INTO search_docs (kind, doc_id, user_id, created_at) SELECT '{kind}', id, user_id, created_at FROM {table}"
+        )
+        counts[kind] = cursor.rowcount
+    conn.execute("INSERT INTO search_fts (search_fts) VALUES ('rebuild')")
+    return counts
+
+
+def rebuild_search_index() -> dict:
+    with _sqlite_write_connection() as conn:
+        return _rebuild_search_index(conn)
+
+
+def check_search_index() -> dict:
+    """Source rows vs indexed rows per kind, plus the FTS5 integrity check."""
+    result = {}
+    with _sqlite_connection() as conn:
+        for kind, (table, _, _) in _SEARCH_SOURCES.items():
+            source = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            indexed = conn.execute("SELECT COUNT(*) FROM search_docs WHERE kind = ?", (kind,)).fetchone()[0]
+            result[kind] = {"rows": source, "indexed": indexed}
+    with _sqlite_write_connection() as conn:
+        try:
+            conn.execute("INSERT INTO search_fts(search_fts, rank) VALUES ('integrity-check', 1)")
+            result["fts_integrity"] = "ok"
+        except sqlite3.DatabaseError as e:
+            result["fts_integrity"] = str(e)
+    return result
+
+
+def _search_documents(user_id: str, query: str, kinds: List[str], limit: int, offset: int) -> dict:
+    match = f'user_key:"{_search_user_key(user_id)}" AND {{title body}}:({query})'
+    placeholders = ",".join(["?"] * len(kinds))
+    with _sqlite_connection() as conn:
+        total = conn.execute(
+            f"SELECT COUNT(*) FROM search_fts JOIN search_docs d ON d.rowid = search_fts.rowid "
+            f"WHERE search_fts MATCH ? AND d.kind IN ({placeholders})",
+            (match, *kinds),
+        ).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT d.kind, d.doc_id, d.created_at, search_fts.title AS title, "
+            f"snippet(search_fts, 2, '**', '**', '…', 16) AS snippet, bm25(search_fts, 0.0, 3.0, 1.0) AS score "
+            f"FROM search_fts JOIN search_docs d ON d.rowid = search_fts.rowid "
+            f"WHERE search_fts MATCH ? AND d.kind IN ({placeholders}) "
+            f"ORDER BY score LIMIT ? OFFSET ?",
+            (match, *kinds, limit, offset),
+        ).fetchall()
+    return {
+        "total": total,
+        "results": [
+            {
+                "type": row["kind"],
+                "id": row["doc_id"],
+                "title": row["title"],
+                "snippet": row["snippet"],
+                # bm25() is lower-is-better; flip it so higher ranks first.
+                "score": round(-row["score"], 4),
+                "created_at": row["created_at"],
+            }
+            for row in rows
+        ],
+    }
+
+
+async def search_documents(user_id: str, query: str, kinds: List[str], limit: int = 20, offset: int = 0) -> dict:
+    return await asyncio.to_thread(_search_documents, user_id, query, kinds, limit, offset)
+
 
 # ==================== ROUTES ====================
 
@@ -3530,6 +8022,10 @@ async def health_check():
         provider = "OpenAI"
         configured = bool(OPENAI_API_KEY)
         model = OPENAI_MODEL if configured else "demo-responses"
+    elif AI_MODE == 'fake':
+        provider = "Fake AI"
+        configured = True
+        model = "fake-model"
 
     return {
         "status": "healthy",
@@ -3538,6 +8034,7 @@ async def health_check():
         "ai_provider": provider,
         "ai_configured": configured,
         "ai_endpoint": endpoint,
+        "ai_healthy": _ai_router.any_healthy() if _ai_router.backends() else None,
         "model": model,
         "database": "sqlite",
         "version": "1.0.0"
@@ -3576,6 +8073,30 @@ async def get_status():
             "model": OPENAI_MODEL if configured else "demo-responses",
             "note": "OpenAI is active" if configured else "OpenAI mode selected but not configured; using demo responses.",
         }
+    elif AI_MODE == 'fake':
+        ai_service = {
+            "mode": "Fake AI",
+            "configured": True,
+            "endpoint": None,
+            "deployment": None,
+            "model": "fake-model",
+            "note": "Simulated provider for load testing; responses are placeholders.",
+        }
+    ai_service["clients"] = ai_provider_stats()
+    ai_service["health"] = _ai_health.snapshot(AI_MODE) if _ai_provider_kind(AI_MODE) else None
+    ai_service["router"] = _ai_router.stats()
+    ai_service["response_cache"] = _ai_response_cache.stats()
+    ai_service["retry_budget"] = _ai_retry_budget.stats()
+    ai_service["prompt_budgets"] = ai_budget_stats()
+    ai_service["fault_injection"] = _ai_faults.stats() if _ai_faults.active else None
+
+    def _read_storage_settings():
+        with _sqlite_connection() as conn:
+            settings = _sqlite_storage_settings(conn)
+            settings["schema_version"] = _sqlite_schema_version(conn)
+            return settings
+
+    storage = await asyncio.to_thread(_read_storage_settings)
 
     return {
         "server": "running",
@@ -3593,11 +8114,36 @@ async def get_status():
         "database": {
             "type": "SQLite",
             "path": str(SQLITE_DB_PATH),
+            "storage": storage,
+            "pool": _sqlite_pool.stats(),
+            "write_queue": _sqlite_write_queue.stats(),
+            "leaderboard_cache": _leaderboard.stats(),
         },
+        "quotas": _quota_engine.stats(),
+        "jobs": _job_queue.stats(),
+        "single_flight": _single_flight.stats(),
+        "upload_cache": upload_cache_stats(),
+        "extraction": _extraction_service.stats(),
         "email": _email_status(),
     }
 
 
+@api_router.get("/quota")
+async def get_quota(current_user: dict = Depends(get_current_user)):
+    """The current user's remaining daily quota per limited action."""
+    return {"enabled": QUOTA_ENABLED, "actions": await _quota_engine.usage(current_user["id"])}
+
+
+@api_router.get("/ai/usage")
+async def get_ai_usage(days: int = Query(30, ge=1, le=366), current_user: dict = Depends(get_current_user)):
+    """The current user's AI token usage per endpoint over the last `days` days."""
+    endpoints = await fetch_ai_usage(current_user["id"], days)
+    totals = {
+        key: sum(row[key] or 0 for row in endpoints) for key in ("requests", "prompt_tokens", "completion_tokens")
+    }
+    return {"days": days, "endpoints": endpoints, "totals": totals}
+
+
 @api_router.get("/ai/test")
 async def ai_test():
     """Probe the configured AI provider once.
@@ -3638,6 +8184,8 @@ async def ai_test():
             "hint": "Check server logs for details.",
         }
 
+    _probe_messages = [{"role": "user", "content": "Reply with exactly: OK"}]
+
     async def _probe_openai():
         if not OPENAI_API_KEY:
             return {
@@ -3652,19 +8200,8 @@ async def ai_test():
                 },
             }
 
-        def _call_once():
-            client = OpenAI(api_key=OPENAI_API_KEY)
-            resp = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[{"role": "user", "content": "Reply with exactly: OK"}],
-                max_tokens=5,
-                temperature=0,
-            )
-            text = (resp.choices[0].message.content or "").strip()
-            return text
-
         try:
-            text = await asyncio.to_thread(_call_once)
+            text = (await get_ai_provider("openai").complete(_probe_messages, max_tokens=5, temperature=0)).strip()
             return {
                 "provider": "OpenAI",
                 "mode": "openai",
@@ -3699,23 +8236,8 @@ async def ai_test():
                 },
             }
 
-        def _call_once():
-            client = AzureOpenAI(
-                api_key=AZURE_OPENAI_API_KEY,
-                api_version="2024-02-01",
-                azure_endpoint=AZURE_OPENAI_ENDPOINT,
-            )
-            resp = client.chat.completions.create(
-                model=AZURE_OPENAI_DEPLOYMENT,
-                messages=[{"role": "user", "content": "Reply with exactly: OK"}],
-                max_tokens=5,
-                temperature=0,
-            )
-            text = (resp.choices[0].message.content or "").strip()
-            return text
-
         try:
-            text = await asyncio.to_thread(_call_once)
+            text = (await get_ai_provider("azure").complete(_probe_messages, max_tokens=5, temperature=0)).strip()
             return {
                 "provider": "Azure OpenAI",
                 "mode": "azure",
@@ -3741,6 +8263,9 @@ async def ai_test():
         result = await _probe_openai()
     elif AI_MODE == "azure":
         result = await _probe_azure()
+    elif AI_MODE == "fake":
+        text = (await get_ai_provider("fake").complete(_probe_messages, max_tokens=5, temperature=0)).strip()
+        result = {"provider": "Fake AI", "mode": "fake", "configured": True, "ok": True, "sample": text[:50]}
     else:
         result = {
             "provider": "Demo",
@@ -3815,7 +8340,7 @@ async def login(credentials: UserLogin):
 
     # Record login activity + update login streak (server-side, cross-device)
     try:
-        await asyncio.to_thread(
+        await run_sqlite_write(
             _insert_activity_event,
             sqlite_user["id"],
             ActivityEvent(event_type="login", path="/auth/login"),
@@ -3825,7 +8350,7 @@ async def login(credentials: UserLogin):
         pass
 
     try:
-        await asyncio.to_thread(_update_login_streak_on_login, sqlite_user["id"])
+        await run_sqlite_write(_update_login_streak_on_login, sqlite_user["id"])
     except Exception:
         # Don't block auth on streak update
         pass
@@ -3857,7 +8382,7 @@ async def forgot_password(payload: ForgotPasswordRequest):
         if RETURN_DEBUG_OTP and DEBUG and ENVIRONMENT != "production":
             ttl_minutes = int(os.environ.get("RESET_OTP_TTL_MINUTES") or 10)
             ttl_minutes = max(5, min(10, ttl_minutes))
-            otp = await asyncio.to_thread(_create_reset_otp, payload.email, ttl_minutes)
+            otp = await run_sqlite_write(_create_reset_otp, payload.email, ttl_minutes)
             return ForgotPasswordResponse(
                 message="Email service is not configured. Using debug OTP (non-production only).",
                 debug_otp=otp,
@@ -3889,7 +8414,7 @@ async def forgot_password(payload: ForgotPasswordRequest):
     ttl_minutes = int(os.environ.get("RESET_OTP_TTL_MINUTES") or 10)
     ttl_minutes = max(5, min(10, ttl_minutes))
 
-    otp = await asyncio.to_thread(_create_reset_otp, payload.email, ttl_minutes)
+    otp = await run_sqlite_write(_create_reset_otp, payload.email, ttl_minutes)
 
     try:
         await send_password_reset_otp_email(payload.email, otp, ttl_minutes)
@@ -3935,7 +8460,7 @@ async def verify_otp(payload: VerifyOtpRequest):
         raise HTTPException(status_code=400, detail="OTP expired")
 
     if not _verify_otp(otp, row["otp_hash"]):
-        await asyncio.to_thread(_increment_reset_otp_attempts, row["id"])
+        await run_sqlite_write(_increment_reset_otp_attempts, row["id"])
         raise HTTPException(status_code=400, detail="Invalid OTP")
 
     return VerifyOtpResponse(verified=True)
@@ -3971,14 +8496,14 @@ async def reset_password(payload: ResetPasswordRequest):
         raise HTTPException(status_code=400, detail="OTP expired")
 
     if not _verify_otp(otp, row["otp_hash"]):
-        await asyncio.to_thread(_increment_reset_otp_attempts, row["id"])
+        await run_sqlite_write(_increment_reset_otp_attempts, row["id"])
         raise HTTPException(status_code=400, detail="Invalid OTP")
 
     _validate_password_strength(payload.new_password)
 
     new_hash = hash_password(payload.new_password)
-    await asyncio.to_thread(_update_user_password, payload.email, new_hash)
-    await asyncio.to_thread(_mark_reset_otp_used, payload.email)
+    await run_sqlite_write(_update_user_password, payload.email, new_hash)
+    await run_sqlite_write(_mark_reset_otp_used, payload.email)
 
     return {"message": "Password updated successfully"}
 
@@ -4041,10 +8566,6 @@ async def update_profile(update: UserProfileUpdate, current_user: dict = Depends
 
 @api_router.post("/profile/avatar", response_model=AvatarUploadResponse)
 async def upload_avatar(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
-    content = await file.read()
-    if len(content) > MAX_FILE_SIZE_MB * 1024 * 1024:
-        raise HTTPException(status_code=413, detail=f"File too large. Max {MAX_FILE_SIZE_MB}MB")
-
     # Basic content-type allowlist
     if file.content_type and not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Only image uploads are allowed")
@@ -4059,9 +8580,8 @@ async def upload_avatar(file: UploadFile = File(...), current_user: dict = Depen
         ext = ".png"
 
     stored_name = f"{uuid.uuid4()}{ext}"
-    stored_path = avatars_dir / stored_name
-    with open(stored_path, "wb") as f:
-        f.write(content)
+    async with await receive_upload(file, MAX_FILE_SIZE_MB) as upload:
+        await upload.save_to(avatars_dir / stored_name)
 
     avatar_url = f"/uploads/avatars/{stored_name}"
     await update_sqlite_user_avatar(current_user["id"], avatar_url)
@@ -4711,13 +9231,54 @@ async def download_ats_resume(
     return StreamingResponse(io.BytesIO(pdf_bytes), media_type="application/pdf", headers=headers)
 
 # AI Tutor Routes
-@api_router.post("/assistant/chat", response_model=AssistantChatResponse)
-async def assistant_chat(payload: AssistantChatRequest, current_user: dict = Depends(get_current_user)):
-    """In-app support assistant (Azure OpenAI when configured).
+def _sse_event(data: dict, event: Optional[str] = None) -> str:
+    """One server-sent event with a JSON payload."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+async def _ai_event_stream(
+    prompt: str,
+    session_id: str,
+    system_instruction: str = None,
+    response_type: str = "tutor",
+    on_complete=None,
+    **ai_args,
+):
+    """Relay stream_ai_response as SSE: "start", one "delta" per chunk, then "done" (or "error").
 
-    Intended for short, product/help questions about LearnovateX.
+    on_complete(response) runs only after the full response arrived; if the
+    client disconnects first, the request task is cancelled, which closes the
+    upstream provider stream and skips it.
     """
+    yield _sse_event({"session_id": session_id}, "start")
+    parts: List[str] = []
+    try:
+        async for delta in stream_ai_response(prompt, session_id, system_instruction=system_instruction, response_type=response_type, **ai_args):
+            parts.append(delta)
+            yield _sse_event({"delta": delta}, "delta")
+    except AIProviderError as e:
+        logger.error(f"AI stream failed for session {session_id}: {e}")
+        yield _sse_event({"detail": "The AI response was interrupted. Please try again."}, "error")
+        return
+
+    response = "".join(parts)
+    if on_complete is not None:
+        await on_complete(response)
+    yield _sse_event({"session_id": session_id, "response": response}, "done")
+
+
+def _sse_response(events) -> StreamingResponse:
+    # no-transform / X-Accel-Buffering keep proxies from buffering the stream.
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"},
+    )
 
+
+def _build_assistant_prompt(payload: AssistantChatRequest, current_user: dict) -> tuple:
+    """Return (prompt, system_instruction) for the support assistant."""
     user_text = (payload.message or "").strip()
     if not user_text:
         raise HTTPException(status_code=400, detail="Message is required")
@@ -4747,28 +9308,67 @@ async def assistant_chat(payload: AssistantChatRequest, current_user: dict = Dep
         + f"Question: {user_text}\n\n"
         "Answer as app help."
     )
+    return prompt, system_instruction
+
+
+def _assistant_cache_args(payload: AssistantChatRequest, current_user: dict) -> dict:
+    """Response-cache arguments for an assistant question.
+
+    The prompt names the user, so answers are only reused for the same user
+    and page; follow-ups that carry conversation history are not cached.
+    """
+    if payload.history:
+        _ai_response_cache.note_bypass()
+        return {}
+    scope = f"assistant|{current_user['id']}|{(payload.context_path or '').strip()}"
+    return {"cache_scope": scope, "cache_question": payload.message}
+
+
+@api_router.post("/assistant/chat", response_model=AssistantChatResponse)
+async def assistant_chat(payload: AssistantChatRequest, current_user: dict = Depends(get_current_user)):
+    """In-app support assistant (Azure OpenAI when configured).
 
+    Intended for short, product/help questions about LearnovateX.
+    """
+    await enforce_quota(current_user["id"], "ai")
+    prompt, system_instruction = _build_assistant_prompt(payload, current_user)
     session_id = f"{current_user['id']}_assistant_{datetime.now().timestamp()}"
-    response = await get_ai_response(prompt, session_id, system_instruction=system_instruction, response_type="tutor")
+    response = await get_ai_response(
+        prompt,
+        session_id,
+        system_instruction=system_instruction,
+        response_type="tutor",
+        endpoint="assistant",
+        user_id=current_user["id"],
+        **_assistant_cache_args(payload, current_user),
+    )
     return AssistantChatResponse(response=response)
 
 
+@api_router.post("/assistant/chat/stream")
+async def assistant_chat_stream(payload: AssistantChatRequest, current_user: dict = Depends(get_current_user)):
+    """Streaming /assistant/chat: server-sent events (start, delta..., done)."""
+    await enforce_quota(current_user["id"], "ai")
+    prompt, system_instruction = _build_assistant_prompt(payload, current_user)
+    session_id = f"{current_user['id']}_assistant_{datetime.now().timestamp()}"
+    return _sse_response(
+        _ai_event_stream(
+            prompt,
+            session_id,
+            system_instruction=system_instruction,
+            response_type="tutor",
+            endpoint="assistant",
+            user_id=current_user["id"],
+            **_assistant_cache_args(payload, current_user),
+        )
+    )
+
+
 @api_router.post("/tutor/context/upload", response_model=TutorContextUploadResponse)
 async def tutor_context_upload(
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user),
 ):
-    contents = await file.read()
-    if not contents:
-        raise HTTPException(status_code=400, detail="Empty file")
-
-    max_bytes = int(TUTOR_CONTEXT_MAX_FILE_SIZE_MB) * 1024 * 1024
-    if len(contents) > max_bytes:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large. Max {TUTOR_CONTEXT_MAX_FILE_SIZE_MB}MB",
-        )
-
     filename = (file.filename or "file").strip() or "file"
     ext = os.path.splitext(filename)[1].lower()
     content_type = (file.content_type or "").lower()
@@ -4796,30 +9396,32 @@ async def tutor_context_upload(
 
     if not (is_pdf or is_docx or is_doc or is_image):
         raise HTTPException(status_code=400, detail="Unsupported file type. Upload image, PDF, or DOCX")
+    if is_doc and not (is_pdf or is_docx):
+        # .doc is a legacy binary format and requires extra system tools.
+        raise HTTPException(status_code=400, detail=".doc is not supported. Please upload .docx")
 
     extracted_text = ""
     kind = "file"
     warning: Optional[str] = None
     text_extracted: Optional[bool] = None
 
+    upload = await receive_upload(file, TUTOR_CONTEXT_MAX_FILE_SIZE_MB)
     try:
-        if is_pdf:
-            extracted_text = await asyncio.to_thread(_extract_text_from_pdf_bytes, contents)
-            kind = "pdf"
-        elif is_docx:
-            extracted_text = await asyncio.to_thread(_extract_text_from_docx_bytes, contents)
-            kind = "docx"
-        elif is_doc:
-            # .doc is a legacy binary format and requires extra system tools.
-            raise HTTPException(status_code=400, detail=".doc is not supported. Please upload .docx")
-        elif is_image:
-            kind = "image"
-            try:
-                extracted_text = await asyncio.to_thread(_extract_text_from_image_bytes, contents)
-            except RuntimeError as e:
-                # OCR is not configured; still allow attaching the image.
-                warning = str(e) or "OCR is not configured"
-                extracted_text = ""
+        async with upload:
+            if is_pdf:
+                kind = "pdf"
+                extracted_text = await extract_upload_text(upload, "pdf")
+            elif is_docx:
+                kind = "docx"
+                extracted_text = await extract_upload_text(upload, "docx")
+            elif is_image:
+                kind = "image"
+                try:
+                    extracted_text = await extract_upload_text(upload, "ocr")
+                except RuntimeError as e:
+                    # OCR is not configured; still allow attaching the image.
+                    warning = str(e) or "OCR is not configured"
+                    extracted_text = ""
     except HTTPException:
         raise
     except RuntimeError as e:
@@ -4872,6 +9474,7 @@ async def tutor_context_upload(
         "text_content": _truncate_text(extracted_text, 200_000),
         "created_at": datetime.now(timezone.utc).isoformat(),
     }
+    context_doc["chunks"] = await asyncio.to_thread(_tutor_context_chunks, context_doc["text_content"])
     await store_tutor_context(context_doc)
 
     return TutorContextUploadResponse(
@@ -4937,45 +9540,43 @@ async def tutor_context_youtube(
         "text_content": _truncate_text(text, 200_000),
         "created_at": datetime.now(timezone.utc).isoformat(),
     }
+    context_doc["chunks"] = await asyncio.to_thread(_tutor_context_chunks, context_doc["text_content"])
     await store_tutor_context(context_doc)
 
     return TutorYouTubeContextResponse(context_id=context_id, kind="youtube", video_id=video_id)
 
 
-@api_router.post("/tutor/chat", response_model=TutorResponse)
-async def tutor_chat(message: TutorMessage, current_user: dict = Depends(get_current_user)):
-    session_id = f"{current_user['id']}_tutor_{datetime.now().timestamp()}"
-
+async def _build_tutor_prompt(message: TutorMessage, user_id: str) -> str:
     context_ids = message.context_ids or []
     context_block = ""
     if context_ids:
+        # Whatever the tutor prompt budget leaves after the question, the
+        # instructions and the system prompt goes to the best-matching chunks.
+        budget = _ai_budget("tutor")[0] - _tokenizer.count(message.message) - _tokenizer.count(_AI_SYSTEM_INSTRUCTIONS["tutor"]) - 150
+        budget -= 10 * min(len(context_ids), 10)  # ~10 tokens per header
         try:
-            ctx_docs = await fetch_tutor_contexts_by_ids(current_user["id"], context_ids)
+            ctx_docs = await fetch_tutor_context_excerpts(user_id, context_ids, message.message, budget)
         except Exception:
             ctx_docs = []
 
-        if ctx_docs:
-            parts: List[str] = []
-            budget = 12_000
-            used = 0
-            for c in ctx_docs:
-                header = None
-                if c.get("kind") == "youtube":
-                    header = f"YouTube: {c.get('source_url') or ''}".strip()
-                else:
-                    header = f"File: {c.get('source_name') or 'attachment'}".strip()
-
-                body = (c.get("text_content") or "").strip()
-                if not body:
-                    continue
-                remaining = budget - used
-                if remaining <= 0:
-                    break
-                clipped = body[:remaining]
-                used += len(clipped)
-                parts.append(f"[{header}]\n{clipped}")
-            if parts:
-                context_block = "\n\n".join(parts)
+        parts: List[str] = []
+        for c in ctx_docs:
+            if c.get("kind") == "youtube":
+                header = f"YouTube: {c.get('source_url') or ''}".strip()
+            else:
+                header = f"File: {c.get('source_name') or 'attachment'}".strip()
+
+            pieces: List[str] = []
+            previous = None
+            for position, content in c["chunks"]:
+                if previous is not None and position != previous + 1:
+                    pieces.append("...")
+                pieces.append(content)
+                previous = position
+            if pieces:
+                parts.append(f"[{header}]\n" + "\n".join(pieces))
+        if parts:
+            context_block = "\n\n".join(parts)
     
     prompt = f"""
 Topic: {message.topic if message.topic else 'General'}
@@ -4996,13 +9597,22 @@ Instructions:
 """
     else:
         prompt += "\nProvide a detailed, step-by-step explanation. Use examples and analogies to make the concept clear.\n"
-    
-    response = await get_gemini_response(prompt, session_id)
-    
-    # Save to learning history
+    return prompt
+
+
+def _tutor_cache_args(message: TutorMessage) -> dict:
+    """Response-cache arguments for a tutor question; none when it carries private contexts."""
+    if message.context_ids:
+        _ai_response_cache.note_bypass()
+        return {}
+    scope = f"tutor|{_normalize_ai_text(message.topic or '')}|{_normalize_ai_text(message.difficulty or '')}"
+    return {"cache_scope": scope, "cache_question": message.message}
+
+
+async def _save_tutor_history(message: TutorMessage, user_id: str, response: str):
     history_doc = {
         "id": str(uuid.uuid4()),
-        "user_id": current_user['id'],
+        "user_id": user_id,
         "topic": message.topic,
         "difficulty": message.difficulty,
         "question": message.message,
@@ -5010,13 +9620,60 @@ Instructions:
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await store_learning_history(history_doc)
+
+
+@api_router.post("/tutor/chat", response_model=TutorResponse)
+async def tutor_chat(message: TutorMessage, current_user: dict = Depends(get_current_user)):
+    await enforce_quota(current_user['id'], "ai")
+    session_id = f"{current_user['id']}_tutor_{datetime.now().timestamp()}"
+    prompt = await _build_tutor_prompt(message, current_user['id'])
+    
+    response = await get_ai_response(prompt, session_id, endpoint="tutor", user_id=current_user['id'], **_tutor_cache_args(message))
+    
+    # Save to learning history
+    await _save_tutor_history(message, current_user['id'], response)
     
     return TutorResponse(response=response, session_id=session_id)
 
+
+@api_router.post("/tutor/chat/stream")
+async def tutor_chat_stream(message: TutorMessage, current_user: dict = Depends(get_current_user)):
+    """Streaming /tutor/chat: server-sent events (start, delta..., done).
+
+    The finished response is saved to learning history just before "done";
+    nothing is saved if the client disconnects or the stream fails.
+    """
+    await enforce_quota(current_user['id'], "ai")
+    session_id = f"{current_user['id']}_tutor_{datetime.now().timestamp()}"
+    prompt = await _build_tutor_prompt(message, current_user['id'])
+
+    async def _on_complete(response: str):
+        await _save_tutor_history(message, current_user['id'], response)
+
+    return _sse_response(
+        _ai_event_stream(prompt, session_id, on_complete=_on_complete, endpoint="tutor", user_id=current_user['id'], **_tutor_cache_args(message))
+    )
+
 # Code Evaluation Routes
 @api_router.post("/code/evaluate", response_model=CodeEvaluation)
-async def evaluate_code(submission: CodeSubmission, current_user: dict = Depends(get_current_user)):
-    session_id = f"{current_user['id']}_code_{datetime.now().timestamp()}"
+async def evaluate_code(
+    submission: CodeSubmission,
+    wait: bool = Query(True, description="false: return 202 with a job id instead of waiting"),
+    current_user: dict = Depends(get_current_user),
+):
+    await enforce_quota(current_user['id'], "code")
+    job = await _job_queue.enqueue(current_user['id'], "code", submission.model_dump())
+    if not wait:
+        return job_accepted(job)
+    return CodeEvaluation(**await job_result(job))
+
+
+async def _run_code_evaluation(user_id: str, payload: dict) -> dict:
+    return await _evaluate_code_submission(user_id, CodeSubmission(**payload))
+
+
+async def _evaluate_code_submission(user_id: str, submission: CodeSubmission) -> dict:
+    session_id = f"{user_id}_code_{datetime.now().timestamp()}"
     
     prompt = f"""
 Evaluate this {submission.language} code submission:
@@ -5043,9 +9700,12 @@ SCORE: [0-100]
 SUGGESTIONS: [detailed suggestions]
 """
     
-    response = await get_gemini_response(prompt, session_id)
-    
-    # Parse response
+    response = await get_ai_response(prompt, session_id, response_type="code", endpoint="code", user_id=user_id)
+    return _code_evaluation_doc(user_id, submission, response)
+
+
+def _code_evaluation_doc(user_id: str, submission: CodeSubmission, response: str) -> dict:
+    """Parse an evaluation reply into a code_evaluations row."""
     lines = response.split('\n')
     passed = "CORRECT: Yes" in response or "CORRECT:Yes" in response
     score = 0
@@ -5060,11 +9720,9 @@ SUGGESTIONS: [detailed suggestions]
         if "SUGGESTIONS:" in line:
             suggestions = line.split("SUGGESTIONS:")[1].strip()
     
-    # Save evaluation
-    eval_id = str(uuid.uuid4())
-    eval_doc = {
-        "id": eval_id,
-        "user_id": current_user['id'],
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
         "problem_id": submission.problem_id,
         "topic": submission.topic,
         "difficulty": submission.difficulty,
@@ -5077,9 +9735,158 @@ SUGGESTIONS: [detailed suggestions]
         "score": score,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await store_code_evaluation(eval_doc)
-    
-    return CodeEvaluation(**eval_doc)
+
+
+async def _after_code_evaluation(eval_doc: dict):
+    await refresh_leaderboard_user(eval_doc['user_id'])
+
+
+_JOB_KINDS["code"] = _JobKind(_run_code_evaluation, _insert_code_evaluation, _after_code_evaluation)
+
+
+@api_router.post("/code/evaluate/batch")
+async def evaluate_code_batch(payload: CodeBatchRequest, current_user: dict = Depends(get_current_user)):
+    """Evaluate many submissions, streamed as server-sent events.
+
+    "start", then one "item" per submission as it is evaluated ("index" is
+    its position in the request; "error" instead if it could not be), then
+    "done" once the evaluations are stored, all in one transaction. Each
+    submission counts against the daily code quota.
+    """
+    submissions = payload.submissions
+    if not submissions:
+        raise HTTPException(status_code=400, detail="At least one submission is required")
+    if len(submissions) > CODE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {CODE_BATCH_MAX_ITEMS} submissions per batch")
+    await enforce_quota(current_user['id'], "code", len(submissions))
+    return _sse_response(_code_batch_events(current_user['id'], submissions))
+
+
+# Approximate reply tokens one packed evaluation needs.
+_CODE_BATCH_REPLY_TOKENS = 450
+# "### SUBMISSION 2", optionally echoing the prompt's "(language)" suffix.
+_CODE_BATCH_HEADER_RE = re.compile(r"^\W*SUBMISSION\s+(\d+)\W*(?:\([^)\n]*\)\W*)?$", re.MULTILINE | re.IGNORECASE)
+
+
+def _pack_code_submissions(submissions: List[CodeSubmission]) -> List[List[int]]:
+    """Group submission indexes into AI requests.
+
+    Up to CODE_BATCH_PACK_SIZE per request, as long as the packed prompt
+    fits the code_batch budget and its reply cap leaves room for every
+    evaluation. Without a provider (demo answers) each is evaluated alone.
+    """
+    if CODE_BATCH_PACK_SIZE <= 1 or not _ai_provider_available():
+        return [[index] for index in range(len(submissions))]
+    prompt_budget, reply_cap = _ai_budget("code_batch")
+    per_request = max(1, min(CODE_BATCH_PACK_SIZE, reply_cap // _CODE_BATCH_REPLY_TOKENS))
+    # Leave room for the instructions and system prompt.
+    room = prompt_budget - 400
+    groups, current, used = [], [], 0
+    for index, submission in enumerate(submissions):
+        tokens = _tokenizer.count(submission.code) + 20
+        if current and (len(current) >= per_request or used + tokens > room):
+            groups.append(current)
+            current, used = [], 0
+        current.append(index)
+        used += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def _code_batch_prompt(submissions: List[CodeSubmission]) -> str:
+    parts = [f"Evaluate each of these {len(submissions)} code submissions independently.\n"]
+    for number, submission in enumerate(submissions, 1):
+        parts.append(f"### SUBMISSION {number} ({submission.language})\n```{submission.language}\n{submission.code}\n```\n")
+    parts.append(
+        """For every submission provide: correctness (Yes/No), time complexity, space complexity,
+code quality and readability (1-10), suggestions for optimization and an overall score (0-100).
+
+Answer for each submission in order, starting with its header line, in this format:
+### SUBMISSION [number]
+CORRECT: [Yes/No]
+TIME_COMPLEXITY: [answer]
+SPACE_COMPLEXITY: [answer]
+QUALITY: [1-10]
+SCORE: [0-100]
+SUGGESTIONS: [detailed suggestions]
+"""
+    )
+    return "\n".join(parts)
+
+
+def _split_code_batch_response(response: str) -> Dict[int, str]:
+    """Reply sections by submission number."""
+    headers = list(_CODE_BATCH_HEADER_RE.finditer(response))
+    sections = {}
+    for position, header in enumerate(headers):
+        end = headers[position + 1].start() if position + 1 < len(headers) else len(response)
+        sections.setdefault(int(header.group(1)), response[header.end():end].strip())
+    return sections
+
+
+async def _evaluate_code_group(user_id: str, submissions: List[CodeSubmission], group: List[int]) -> List[tuple]:
+    """[(index, row)] for one AI request's worth of submissions."""
+    if len(group) == 1:
+        return [(group[0], await _evaluate_code_submission(user_id, submissions[group[0]]))]
+
+    session_id = f"{user_id}_code_batch_{datetime.now().timestamp()}"
+    prompt = _code_batch_prompt([submissions[index] for index in group])
+    response = await get_ai_response(prompt, session_id, response_type="code", endpoint="code_batch", user_id=user_id)
+    sections = _split_code_batch_response(response)
+    results = []
+    for number, index in enumerate(group, 1):
+        section = sections.get(number)
+        if section and "SCORE:" in section:
+            results.append((index, _code_evaluation_doc(user_id, submissions[index], section)))
+        else:
+            # The reply skipped or mangled this one; evaluate it on its own.
+            results.append((index, await _evaluate_code_submission(user_id, submissions[index])))
+    return results
+
+
+async def _code_batch_events(user_id: str, submissions: List[CodeSubmission]):
+    groups = _pack_code_submissions(submissions)
+    yield _sse_event({"items": len(submissions), "requests": len(groups)}, "start")
+
+    semaphore = asyncio.Semaphore(max(1, CODE_BATCH_CONCURRENCY))
+    stored = []
+
+    async def _evaluate(group: List[int]) -> List[tuple]:
+        async with semaphore:
+            try:
+                results = await _evaluate_code_group(user_id, submissions, group)
+            except Exception as e:
+                logger.error(f"Batch code evaluation failed for items {group}: {e}")
+                return [(index, None) for index in group]
+        # Saved per group (and shielded) so finished evaluations, already
+        # counted against the quota, survive a client disconnect.
+        docs = [doc for _, doc in results if doc is not None]
+        if docs:
+            try:
+                await asyncio.shield(run_sqlite_write(_insert_code_evaluations, docs))
+            except Exception as e:
+                logger.error(f"Failed to store batch code evaluations for items {group}: {e}")
+                return [(index, None) for index in group]
+            stored.extend(docs)
+        return results
+
+    tasks = [asyncio.ensure_future(_evaluate(group)) for group in groups]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            for index, doc in await finished:
+                if doc is None:
+                    yield _sse_event({"index": index, "detail": "The evaluation failed. Please try again."}, "error")
+                    continue
+                yield _sse_event({"index": index, "evaluation": CodeEvaluation(**doc).model_dump()}, "item")
+    finally:
+        # Client gone: stop the remaining AI requests.
+        for task in tasks:
+            task.cancel()
+        if stored:
+            await asyncio.shield(refresh_leaderboard_user(user_id))
+
+    yield _sse_event({"items": len(submissions), "stored": len(stored)}, "done")
 
 @api_router.get("/code/submissions")
 async def get_submissions(
@@ -5092,23 +9899,19 @@ async def get_submissions(
 
 @api_router.delete("/code/submissions/{submission_id}")
 async def delete_submission(submission_id: str, current_user: dict = Depends(get_current_user)):
-    ok = await asyncio.to_thread(_delete_code_submission, current_user["id"], submission_id)
+    ok = await run_sqlite_write(_delete_code_submission, current_user["id"], submission_id)
     if not ok:
         raise HTTPException(status_code=404, detail="Submission not found")
+    await refresh_leaderboard_user(current_user["id"])
     return {"ok": True}
 
 # Resume Analysis Routes
 @api_router.post("/resume/analyze", response_model=ResumeAnalysis)
-async def analyze_resume(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
-    # Read PDF
-    contents = await file.read()
-    if not contents:
-        raise HTTPException(status_code=400, detail="Empty file")
-
-    max_bytes = int(MAX_FILE_SIZE_MB) * 1024 * 1024
-    if len(contents) > max_bytes:
-        raise HTTPException(status_code=413, detail=f"File too large. Max {MAX_FILE_SIZE_MB}MB")
-
+async def analyze_resume(
+    file: UploadFile = File(...),
+    wait: bool = Query(True, description="false: return 202 with a job id instead of waiting"),
+    current_user: dict = Depends(get_current_user),
+):
     original_name = (file.filename or "resume.pdf").strip()
     ext = os.path.splitext(original_name)[1].lstrip(".").lower() or "pdf"
     allowed_exts = [e.strip().lower() for e in (ALLOWED_RESUME_FORMATS or []) if e and e.strip()]
@@ -5117,7 +9920,7 @@ async def analyze_resume(file: UploadFile = File(...), current_user: dict = Depe
 
     analysis_id = str(uuid.uuid4())
 
-    # Persist uploaded file for later download/view
+    # Persist uploaded file for later download/view (one copy per content hash)
     try:
         resume_dir_path = (ROOT_DIR / RESUME_UPLOAD_DIR).resolve()
         uploads_root_path = UPLOADS_ROOT.resolve()
@@ -5129,9 +9932,9 @@ async def analyze_resume(file: UploadFile = File(...), current_user: dict = Depe
         resume_dir_path = (UPLOADS_ROOT / "resumes")
         resume_dir_path.mkdir(parents=True, exist_ok=True)
 
-    stored_name = f"{current_user['id']}_{analysis_id}.{ext}"
-    stored_path = resume_dir_path / stored_name
-    await asyncio.to_thread(stored_path.write_bytes, contents)
+    async with await receive_upload(file, MAX_FILE_SIZE_MB) as upload:
+        digest = upload.sha256
+        stored_path = Path(await store_upload_blob(upload, resume_dir_path, ext))
 
     # Compute served URL under /uploads
     try:
@@ -5140,17 +9943,37 @@ async def analyze_resume(file: UploadFile = File(...), current_user: dict = Depe
     except Exception:
         file_url = None
 
-    pdf_file = io.BytesIO(contents)
-    
+    job = await _job_queue.enqueue(
+        current_user['id'],
+        "resume",
+        {
+            "analysis_id": analysis_id,
+            "filename": file.filename,
+            "file_url": file_url,
+            "stored_path": str(stored_path),
+            "sha256": digest,
+        },
+    )
+    if not wait:
+        return job_accepted(job)
+    return ResumeAnalysis(**await job_result(job))
+
+
+async def _extract_resume_file_text(path: str) -> str:
+    # A background job: wait for an extraction slot rather than failing.
+    return await extract_document_text("pdf", path, wait=True)
+
+
+async def _run_resume_analysis(user_id: str, payload: dict) -> dict:
     try:
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text_content = ""
-        for page in pdf_reader.pages:
-            text_content += page.extract_text()
+        text_content = await cached_extraction(payload.get("sha256"), "pdf", _extract_resume_file_text, payload["stored_path"])
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(e)}")
     
-    session_id = f"{current_user['id']}_resume_{datetime.now().timestamp()}"
+    session_id = f"{user_id}_resume_{datetime.now().timestamp()}"
+    resume_text = await asyncio.to_thread(_tokenizer.truncate, text_content, _ai_budget("resume")[0] - 250)
     
     prompt = f"""
 Analyze this resume and detect:
@@ -5160,7 +9983,7 @@ Analyze this resume and detect:
 4. Suggestions for improvement
 
 Resume Content:
-{text_content[:3000]}  
+{resume_text}
 
 Provide response in format:
 CREDIBILITY_SCORE: [0-100]
@@ -5169,7 +9992,7 @@ SUGGESTIONS: [bullet points]
 ANALYSIS: [detailed analysis]
 """
     
-    response = await get_gemini_response(prompt, session_id)
+    response = await get_ai_response(prompt, session_id, response_type="resume", endpoint="resume", user_id=user_id)
     
     # Parse response
     credibility_score = 70  # default
@@ -5195,12 +10018,12 @@ ANALYSIS: [detailed analysis]
 
     section_scores = _infer_resume_section_scores(text_content)
     
-    # Save analysis
-    analysis_doc = {
-        "id": analysis_id,
-        "user_id": current_user['id'],
-        "filename": file.filename,
-        "file_url": file_url,
+    return {
+        "id": payload["analysis_id"],
+        "user_id": user_id,
+        "filename": payload.get("filename"),
+        "file_url": payload.get("file_url"),
+        "file_sha256": payload.get("sha256"),
         "text_content": text_content[:1000],  # Store first 1000 chars
         "credibility_score": credibility_score,
         "projects_score": section_scores.get("projects"),
@@ -5212,9 +10035,9 @@ ANALYSIS: [detailed analysis]
         "analysis": response,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await store_resume_analysis(analysis_doc)
-    
-    return ResumeAnalysis(**analysis_doc)
+
+
+_JOB_KINDS["resume"] = _JobKind(_run_resume_analysis, _insert_resume_analysis)
 
 @api_router.get("/resume/history")
 async def get_resume_history(current_user: dict = Depends(get_current_user)):
@@ -5247,8 +10070,8 @@ async def get_activity_heatmap(days: int = 180, current_user: dict = Depends(get
 
 # Mock Interview Routes
 @api_router.post("/interview/start")
-@api_router.post("/interview/start")
 async def start_interview(interview_type: str, current_user: dict = Depends(get_current_user)):
+    await enforce_quota(current_user['id'], "interview")
     session_id = f"{current_user['id']}_interview_{datetime.now().timestamp()}"
     
     # Check if in demo mode
@@ -5383,7 +10206,7 @@ Q4: [question]
 Q5: [question]
 """
     
-    response = await get_gemini_response(prompt, session_id)
+    response = await get_ai_response(prompt, session_id, response_type="interview", endpoint="interview_questions", user_id=current_user['id'])
     
     # Parse questions
     questions = []
@@ -5401,8 +10224,29 @@ Q5: [question]
     return {"session_id": session_id, "questions": questions}
 
 @api_router.post("/interview/evaluate", response_model=InterviewEvaluation)
-async def evaluate_interview(interview_type: str, questions: List[Dict], answers: List[Dict], current_user: dict = Depends(get_current_user)):
-    session_id = f"{current_user['id']}_eval_{datetime.now().timestamp()}"
+async def evaluate_interview(
+    interview_type: str,
+    questions: List[Dict],
+    answers: List[Dict],
+    wait: bool = Query(True, description="false: return 202 with a job id instead of waiting"),
+    current_user: dict = Depends(get_current_user),
+):
+    await enforce_quota(current_user['id'], "interview_evaluation")
+    job = await _job_queue.enqueue(
+        current_user['id'],
+        "interview",
+        {"interview_type": interview_type, "questions": questions, "answers": answers},
+    )
+    if not wait:
+        return job_accepted(job)
+    return InterviewEvaluation(**await job_result(job))
+
+
+async def _run_interview_evaluation(user_id: str, payload: dict) -> dict:
+    interview_type = payload["interview_type"]
+    questions = payload["questions"]
+    answers = payload["answers"]
+    session_id = f"{user_id}_eval_{datetime.now().timestamp()}"
     
     qa_text = ""
     for i, (q, a) in enumerate(zip(questions, answers)):
@@ -5426,7 +10270,7 @@ WEAKNESSES: [weakness1, weakness2, weakness3]
 FEEDBACK: [detailed feedback]
 """
     
-    response = await get_gemini_response(prompt, session_id)
+    response = await get_ai_response(prompt, session_id, response_type="interview", endpoint="interview", user_id=user_id)
     
     # Parse response
     readiness_score = 70
@@ -5447,11 +10291,9 @@ FEEDBACK: [detailed feedback]
             weak_text = line.split("WEAKNESSES:")[1].strip()
             weaknesses = [w.strip() for w in weak_text.split(',')]
     
-    # Save evaluation
-    eval_id = str(uuid.uuid4())
-    eval_doc = {
-        "id": eval_id,
-        "user_id": current_user['id'],
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
         "interview_type": interview_type,
         "questions": questions,
         "answers": answers,
@@ -5461,9 +10303,9 @@ FEEDBACK: [detailed feedback]
         "weaknesses": weaknesses if weaknesses else ["Need more technical depth"],
         "created_at": datetime.now(timezone.utc).isoformat()
     }
-    await store_interview_evaluation(eval_doc)
-    
-    return InterviewEvaluation(**eval_doc)
+
+
+_JOB_KINDS["interview"] = _JobKind(_run_interview_evaluation, _insert_interview_evaluation)
 
 
 @api_router.get("/interview/history")
@@ -5471,30 +10313,86 @@ async def get_interview_history(limit: int = 50, current_user: dict = Depends(ge
     limit = max(1, min(int(limit), 200))
     return await fetch_interview_history(current_user["id"], limit)
 
+# Background Job Routes
+@api_router.get("/jobs")
+async def list_jobs(limit: int = Query(20, ge=1, le=100), current_user: dict = Depends(get_current_user)):
+    return [_public_job(job) for job in await fetch_jobs(current_user["id"], limit)]
+
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await fetch_job(job_id, current_user["id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _public_job(job)
+
+
+@api_router.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str, current_user: dict = Depends(get_current_user)):
+    """Server-sent events: "status" now, then "done" or "failed" when the job finishes."""
+    job = await fetch_job(job_id, current_user["id"])
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def _events(job: dict):
+        yield _sse_event(_public_job(job), "status")
+        while job["status"] not in _JOB_FINISHED:
+            job = await _job_queue.wait(job_id, current_user["id"], timeout=15)
+            if job is None:
+                return
+            if job["status"] not in _JOB_FINISHED:
+                # Comment line; keeps idle proxies from closing the stream.
+                yield ": keepalive\n\n"
+        yield _sse_event(_public_job(job), "done" if job["status"] == "succeeded" else "failed")
+
+    return _sse_response(_events(job))
+
+# Search Routes
+_SEARCH_TYPES = tuple(_SEARCH_SOURCES)
+
+
+@api_router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    types: Optional[str] = Query(None, description="comma separated: learning, context, resume (default: all)"),
+    limit: int = Query(20, ge=1, le=50),
+    offset: int = Query(0, ge=0, le=1000),
+    current_user: dict = Depends(get_current_user),
+):
+    """Search the current user's learning history, tutor materials and resume
+    analyses; best matches first, with "**"-highlighted snippets."""
+    kinds = [t.strip() for t in (types or "").split(",") if t.strip()] or list(_SEARCH_TYPES)
+    unknown = [kind for kind in kinds if kind not in _SEARCH_TYPES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown search type(s): {', '.join(unknown)}")
+    response = {"query": q, "types": kinds, "limit": limit, "offset": offset, "total": 0, "results": []}
+    query = _fts_query(q, operator="AND", prefix_last=True)
+    if not query:
+        return response
+    try:
+        response.update(await search_documents(current_user["id"], query, kinds, limit, offset))
+    except sqlite3.OperationalError as e:
+        logger.error(f"Search failed: {e}")
+        raise HTTPException(status_code=503, detail="Search is not available on this server")
+    return response
+
 # Dashboard Routes
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
-    # Get user statistics
-    code_submissions = await count_code_submissions(current_user['id'])
-    avg_code_score = await get_avg_code_score(current_user['id'])
-    resume_analyses = await count_resume_analyses(current_user['id'])
-    interviews_taken = await count_interview_evaluations(current_user['id'])
-    learning_sessions = await count_learning_sessions(current_user['id'])
-    crs = await calculate_career_readiness_score(current_user['id'])
-    streak = await get_learning_streak_stats(current_user['id'])
-    learning_consistency = await calculate_learning_consistency(current_user['id'])
+    # Get user statistics (single aggregate read)
+    stats = await get_user_stats(current_user['id'])
+    streak = stats["learning_streak"]
+    login_streak = stats["login_streak"]
+    coding_streak = stats["coding_streak"]
 
-    login_streak = await asyncio.to_thread(_get_login_streak_for_ui, current_user["id"])
-    coding_streak = await asyncio.to_thread(_get_coding_streak_for_ui, current_user["id"])
-    
     return {
-        "code_submissions": code_submissions,
-        "avg_code_score": round(avg_code_score, 2),
-        "resume_analyses": resume_analyses,
-        "interviews_taken": interviews_taken,
-        "learning_sessions": learning_sessions,
-        "career_readiness_score": crs,
-        "learning_consistency_score": round(learning_consistency, 2),
+        "code_submissions": stats["code_submissions"],
+        "avg_code_score": round(stats["avg_code_score"], 2),
+        "resume_analyses": stats["resume_analyses"],
+        "interviews_taken": stats["interviews_taken"],
+        "learning_sessions": stats["learning_sessions"],
+        "career_readiness_score": stats["career_readiness_score"],
+        "learning_consistency_score": round(stats["learning_consistency"], 2),
         "current_streak": streak.get("current_streak", 0),
         "longest_streak": streak.get("longest_streak", 0),
         "active_days_30": streak.get("active_days_30", 0),
@@ -5529,20 +10427,21 @@ async def get_career_readiness_dashboard(current_user: dict = Depends(get_curren
     user_id = current_user["id"]
 
     # Base metrics
-    code_submissions = await count_code_submissions(user_id)
-    avg_code_score = await get_avg_code_score(user_id)
-    learning_sessions = await count_learning_sessions(user_id)
-    learning_consistency = await calculate_learning_consistency(user_id)
-    interviews_taken = await count_interview_evaluations(user_id)
-    avg_interview = await get_avg_interview_readiness(user_id)
-    resume_analyses = await count_resume_analyses(user_id)
-    avg_resume = await get_avg_resume_credibility(user_id)
+    stats = await get_user_stats(user_id)
+    code_submissions = stats["code_submissions"]
+    avg_code_score = stats["avg_code_score"]
+    learning_sessions = stats["learning_sessions"]
+    learning_consistency = stats["learning_consistency"]
+    interviews_taken = stats["interviews_taken"]
+    avg_interview = stats["avg_interview_score"]
+    resume_analyses = stats["resume_analyses"]
+    avg_resume = stats["avg_resume_score"]
 
     # Prefer latest resume for section scores + recency
     latest_resume = await fetch_latest_resume(user_id)
     resume_score = float(latest_resume.get("credibility_score")) if latest_resume and latest_resume.get("credibility_score") is not None else float(avg_resume)
 
-    streak = await get_learning_streak_stats(user_id)
+    streak = stats["learning_streak"]
 
     breakdown = _compute_crs_breakdown(avg_code_score, resume_score, avg_interview, learning_consistency)
     readiness_score = round(
@@ -5667,13 +10566,14 @@ async def get_career_readiness_dashboard(current_user: dict = Depends(get_curren
     action_date = _today_iso_date()
     locked = await asyncio.to_thread(_select_daily_action_lock, user_id, action_date)
     if not locked:
-        locked = await asyncio.to_thread(_insert_daily_action_lock, user_id, action_date, prediction["best_action"])
+        locked = await run_sqlite_write(_insert_daily_action_lock, user_id, action_date, prediction["best_action"])
     weekly_plan = _weekly_plan_from_blocker(prediction.get("biggest_blocker") or "")
     week_start = _week_start_monday_iso_date()
     weekly_done_map = await asyncio.to_thread(_select_weekly_checklist_state, user_id, week_start)
 
     # Timeline snapshots (1/day)
-    await asyncio.to_thread(_insert_snapshot_if_missing, user_id, action_date, readiness_score, breakdown)
+    await run_sqlite_write(_insert_snapshot_if_missing, user_id, action_date, readiness_score, breakdown)
+    # Not fetch_snapshots: a coalesced read may predate the insert above.
     history = await asyncio.to_thread(_fetch_snapshots, user_id, 30)
 
     # Confidence indicator
@@ -5801,7 +10701,7 @@ async def patch_weekly_checklist(payload: WeeklyChecklistPatch, current_user: di
     if not item_id:
         raise HTTPException(status_code=400, detail="item_id is required")
 
-    done_map = await asyncio.to_thread(_patch_weekly_checklist_item, user_id, week_start, item_id, bool(payload.done))
+    done_map = await run_sqlite_write(_patch_weekly_checklist_item, user_id, week_start, item_id, bool(payload.done))
     return {"ok": True, "week_start": week_start, "done_map": done_map}
 
 
@@ -5811,7 +10711,7 @@ async def post_activity_event(event: ActivityEvent, current_user: dict = Depends
     """Record lightweight activity events (page_view, time_spent, etc)."""
     user_id = current_user["id"]
     try:
-        await asyncio.to_thread(_insert_activity_event, user_id, event)
+        await run_sqlite_write(_insert_activity_event, user_id, event)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception:
@@ -5830,7 +10730,7 @@ async def get_apply_tracker(limit: int = Query(100, ge=1, le=300), current_user:
 async def add_apply_tracker_item(payload: ApplyTrackerCreate, current_user: dict = Depends(get_current_user)):
     user_id = current_user["id"]
     try:
-        item = await asyncio.to_thread(_upsert_apply_tracker_item, user_id, payload)
+        item = await run_sqlite_write(_upsert_apply_tracker_item, user_id, payload)
         return ApplyTrackerItem(**item)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -5842,7 +10742,7 @@ async def add_apply_tracker_item(payload: ApplyTrackerCreate, current_user: dict
 async def update_apply_tracker_item(item_id: str, payload: ApplyTrackerUpdate, current_user: dict = Depends(get_current_user)):
     user_id = current_user["id"]
     try:
-        item = await asyncio.to_thread(_update_apply_tracker_item, user_id, item_id, payload)
+        item = await run_sqlite_write(_update_apply_tracker_item, user_id, item_id, payload)
         return ApplyTrackerItem(**item)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -5854,7 +10754,7 @@ async def update_apply_tracker_item(item_id: str, payload: ApplyTrackerUpdate, c
 async def delete_apply_tracker_item(item_id: str, current_user: dict = Depends(get_current_user)):
     user_id = current_user["id"]
     try:
-        await asyncio.to_thread(_delete_apply_tracker_item, user_id, item_id)
+        await run_sqlite_write(_delete_apply_tracker_item, user_id, item_id)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception:
@@ -5888,16 +10788,15 @@ def _list_personal_goals(user_id: str) -> list:
 def _create_personal_goal(user_id: str, payload: PersonalGoalCreate) -> dict:
     gid = str(uuid.uuid4())
     now = datetime.now(timezone.utc).isoformat()
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "INSERT INTO personal_goals (id, user_id, title, category, target, deadline, created_at, updated_at) VALUES (?,?,?,?,?,?,?,?)",
             (gid, user_id, payload.title, payload.category, float(payload.target), payload.deadline, now, now),
         )
-        conn.commit()
     return {"id": gid, "user_id": user_id, "title": payload.title, "category": payload.category, "target": float(payload.target), "deadline": payload.deadline, "created_at": now, "updated_at": now}
 
 def _update_personal_goal(user_id: str, goal_id: str, payload: PersonalGoalUpdate) -> dict:
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         existing = conn.execute("SELECT * FROM personal_goals WHERE id = ? AND user_id = ?", (goal_id, user_id)).fetchone()
         if not existing:
             raise ValueError("Goal not found")
@@ -5917,17 +10816,15 @@ def _update_personal_goal(user_id: str, goal_id: str, payload: PersonalGoalUpdat
         params.append(now)
         params.extend([goal_id, user_id])
         conn.execute(f"UPDATE personal_goals SET {', '.join(updates)} WHERE id = ? AND user_id = ?", params)
-        conn.commit()
         row = conn.execute("SELECT * FROM personal_goals WHERE id = ?", (goal_id,)).fetchone()
     return dict(row)
 
 def _delete_personal_goal(user_id: str, goal_id: str) -> None:
-    with _sqlite_connection() as conn:
+    with _sqlite_write_connection() as conn:
         existing = conn.execute("SELECT 1 FROM personal_goals WHERE id = ? AND user_id = ?", (goal_id, user_id)).fetchone()
         if not existing:
             raise ValueError("Goal not found")
         conn.execute("DELETE FROM personal_goals WHERE id = ? AND user_id = ?", (goal_id, user_id))
-        conn.commit()
 
 def _compute_goal_progress(goal: dict, stats: dict) -> dict:
     """Compute real-time progress for a personal goal based on actual student data."""
@@ -5999,7 +10896,7 @@ async def get_personal_goals(current_user: dict = Depends(get_current_user)):
 @api_router.post("/career/personal-goals")
 async def create_personal_goal(payload: PersonalGoalCreate, current_user: dict = Depends(get_current_user)):
     user_id = current_user["id"]
-    goal = await asyncio.to_thread(_create_personal_goal, user_id, payload)
+    goal = await run_sqlite_write(_create_personal_goal, user_id, payload)
     return goal
 
 
@@ -6007,7 +10904,7 @@ async def create_personal_goal(payload: PersonalGoalCreate, current_user: dict =
 async def update_personal_goal(goal_id: str, payload: PersonalGoalUpdate, current_user: dict = Depends(get_current_user)):
     user_id = current_user["id"]
     try:
-        goal = await asyncio.to_thread(_update_personal_goal, user_id, goal_id, payload)
+        goal = await run_sqlite_write(_update_personal_goal, user_id, goal_id, payload)
         return goal
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -6017,7 +10914,7 @@ async def update_personal_goal(goal_id: str, payload: PersonalGoalUpdate, curren
 async def delete_personal_goal_endpoint(goal_id: str, current_user: dict = Depends(get_current_user)):
     user_id = current_user["id"]
     try:
-        await asyncio.to_thread(_delete_personal_goal, user_id, goal_id)
+        await run_sqlite_write(_delete_personal_goal, user_id, goal_id)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     return {"ok": True}
@@ -6027,7 +10924,7 @@ async def delete_personal_goal_endpoint(goal_id: str, current_user: dict = Depen
 async def get_progress_delta(current_user: dict = Depends(get_current_user)):
     """Compute real week-over-week and day-over-day progress deltas from snapshots."""
     user_id = current_user["id"]
-    history = await asyncio.to_thread(_fetch_snapshots, user_id, 30)
+    history = await fetch_snapshots(user_id, 30)
 
     today_str = _today_iso_date()
     seven_days_ago = (datetime.now(timezone.utc) - timedelta(days=7)).strftime("%Y-%m-%d")
@@ -6086,19 +10983,7 @@ async def get_achievements(current_user: dict = Depends(get_current_user)):
     resume_analyses = await count_resume_analyses(current_user['id'])
     interviews_taken = await count_interview_evaluations(current_user['id'])
     # Leaderboard: check if user is in top 10
-    students = await fetch_users_by_role("student", 200)
-    leaderboard = []
-    for student in students:
-        avg_score = await get_avg_code_score(student['id'])
-        submissions = await count_code_submissions(student['id'])
-        leaderboard.append({
-            "id": student['id'],
-            "name": student['name'],
-            "avg_code_score": round(avg_score, 2),
-            "code_submissions": submissions
-        })
-    leaderboard.sort(key=lambda x: (x['avg_code_score'], x['code_submissions']), reverse=True)
-    user_rank = next((i+1 for i, u in enumerate(leaderboard) if u['id'] == current_user['id']), None)
+    user_rank, _, _ = await asyncio.to_thread(_leaderboard.rank_of, current_user['id'])
 
     # Define achievements (can be expanded)
     achievements = [
@@ -6135,33 +11020,28 @@ async def get_achievements(current_user: dict = Depends(get_current_user)):
     ]
     return achievements
 
-@api_router.get("/leaderboard")
-async def get_leaderboard(limit: int = Query(10, ge=1, le=100), current_user: dict = Depends(get_current_user)):
-    """Get leaderboard of top students by code performance."""
+@api_router.get("/leaderboard", response_model=List[LeaderboardEntry])
+async def get_leaderboard(
+    response: Response,
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_user: dict = Depends(get_current_user),
+):
+    """Get leaderboard of top students by code performance (total points, then avg score)."""
     try:
-        students = await fetch_users_by_role("student", limit * 2)  # Get more to sort
-        
-        leaderboard = []
-        for student in students:
-            avg_score = await get_avg_code_score(student['id'])
-            submissions = await count_code_submissions(student['id'])
-            if submissions > 0:  # Only include students with submissions
-                leaderboard.append({
-                    "id": student['id'],
-                    "name": student['name'],
-                    "email": student['email'],
-                    "avg_code_score": round(avg_score, 2),
-                    "code_submissions": submissions,
-                    "total_points": round(avg_score * submissions, 2)  # Simple scoring
-                })
-        
-        # Sort by total points (avg_score * submissions), then by avg_score
-        leaderboard.sort(key=lambda x: (x['total_points'], x['avg_code_score']), reverse=True)
-        
-        return leaderboard[:limit]
+        page, total = await asyncio.to_thread(_leaderboard.page, limit, offset)
     except Exception as e:
         logger.error(f"Error fetching leaderboard: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    response.headers["X-Total-Count"] = str(total)
+    return page
+
+
+@api_router.get("/leaderboard/me", response_model=LeaderboardRank)
+async def get_my_leaderboard_rank(current_user: dict = Depends(get_current_user)):
+    """Current user's rank; rank/entry are null until they have a code submission."""
+    rank, entry, total = await asyncio.to_thread(_leaderboard.rank_of, current_user['id'])
+    return {"rank": rank, "total": total, "entry": entry}
 
 # Company Portal Routes
 @api_router.post("/company/tests", response_model=Test)
@@ -6192,49 +11072,40 @@ async def get_company_tests(current_user: dict = Depends(get_current_user)):
     return tests
 
 @api_router.get("/company/candidates")
-async def get_candidates(current_user: dict = Depends(get_current_user)):
-    if current_user['role'] != 'company':
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    job_seekers = await fetch_users_by_role("job_seeker", 100)
-    
-    candidates_with_stats = []
-    for seeker in job_seekers:
-        latest_resume = await fetch_latest_resume(seeker['id'])
-        avg_code = await get_avg_code_score(seeker['id'])
-        
-        candidates_with_stats.append({
-            **seeker,
-            "resume_score": latest_resume.get('credibility_score', 0) if latest_resume else 0,
-            "avg_code_score": round(avg_code, 2)
-        })
-    
-    return candidates_with_stats
-
-@api_router.get("/company/analytics")
-async def get_company_analytics(current_user: dict = Depends(get_current_user)):
+async def get_candidates(
+    response: Response,
+    status: Optional[str] = Query(None, description="Comma-separated latest actions, e.g. new,shortlist"),
+    min_resume_score: Optional[float] = Query(None, ge=0, le=100),
+    min_code_score: Optional[float] = Query(None, ge=0, le=100),
+    sort: str = Query("created_at", pattern="^(" + "|".join(_CANDIDATE_SORT_COLUMNS) + ")$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    current_user: dict = Depends(get_current_user),
+):
+    """Job seekers with resume/code scores and this company's latest action as `status`."""
     if current_user['role'] != 'company':
         raise HTTPException(status_code=403, detail="Access denied")
     
+    statuses = [s.strip() for s in status.split(",") if s.strip()] if status else None
     try:
-        # Get company tests and candidates
-        tests = await get_company_tests(current_user['id'])
-        candidates = await fetch_users_by_role("job_seeker", 1000)
-        
-        # Calculate analytics
-        total_tests = len(tests)
-        active_candidates = len([c for c in candidates if c.get('status') == 'active'])
-        completed_tests = sum(len(test.get('submissions', [])) for test in tests)
-        
-        return {
-            "total_tests": total_tests,
-            "active_candidates": active_candidates,
-            "completed_tests": completed_tests,
-            "avg_candidates_per_test": round(completed_tests / max(total_tests, 1), 2)
-        }
-    except Exception as e:
-        logger.error(f"Error fetching company analytics: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        candidates, next_cursor = await asyncio.to_thread(
+            _select_candidates_page,
+            current_user['id'],
+            statuses,
+            min_resume_score,
+            min_code_score,
+            sort,
+            order,
+            limit,
+            cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return candidates
 
 @api_router.get("/company/candidates/status")
 async def get_candidates_status(current_user: dict = Depends(get_current_user)):
@@ -6319,99 +11190,32 @@ async def delete_assessment(assessment_id: str, current_user: dict = Depends(get
         logger.error(f"Error deleting assessment: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/company/jobs")
-async def get_company_jobs(current_user: dict = Depends(get_current_user)):
-    if current_user['role'] != 'company':
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    try:
-        jobs = await get_company_jobs(current_user['id'])
-        return jobs
-    except Exception as e:
-        logger.error(f"Error fetching jobs: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@api_router.post("/company/jobs")
-async def create_job(job_data: dict, current_user: dict = Depends(get_current_user)):
-    if current_user['role'] != 'company':
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    try:
-        job_id = str(uuid.uuid4())
-        job_doc = {
-            "id": job_id,
-            "company_id": current_user['id'],
-            "title": job_data.get('title'),
-            "description": job_data.get('description'),
-            "requirements": job_data.get('requirements', []),
-            "location": job_data.get('location'),
-            "salary_range": job_data.get('salary_range'),
-            "created_at": datetime.now(timezone.utc).isoformat(),
-            "status": "active"
-        }
-        
-        await store_job(job_doc)
-        return job_doc
-    except Exception as e:
-        logger.error(f"Error creating job: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@api_router.delete("/company/jobs/{job_id}")
-async def delete_job(job_id: str, current_user: dict = Depends(get_current_user)):
-    if current_user['role'] != 'company':
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    try:
-        # Check if job belongs to company
-        jobs = await get_company_jobs(current_user['id'])
-        job = next((j for j in jobs if j['id'] == job_id), None)
-        
-        if not job:
-            raise HTTPException(status_code=404, detail="Job not found")
-        
-        # Delete job (implement this function)
-        await delete_job_record(job_id)
-        return {"success": True}
-    except Exception as e:
-        logger.error(f"Error deleting job: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@api_router.post("/company/candidates/{candidate_id}/action")
-async def candidate_action(candidate_id: str, action_data: dict, current_user: dict = Depends(get_current_user)):
-    if current_user['role'] != 'company':
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    try:
-        action = action_data.get('action')
-        if action not in ['shortlist', 'reject', 'interview', 'offer', 'hire']:
-            raise HTTPException(status_code=400, detail="Invalid action")
-        
-        # Update candidate status
-        await update_candidate_status(candidate_id, action)
-        return {"success": True, "action": action}
-    except Exception as e:
-        logger.error(f"Error performing candidate action: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
 # College Admin Routes
 @api_router.get("/college/students")
-async def get_students(current_user: dict = Depends(get_current_user)):
+async def get_students(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    sort: str = Query("created_at", pattern="^(" + "|".join(_STUDENT_SORT_COLUMNS) + ")$"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    current_user: dict = Depends(get_current_user),
+):
     if current_user['role'] != 'college_admin':
         raise HTTPException(status_code=403, detail="Access denied")
     
-    students = await fetch_users_by_role("student", 100)
+    students, total = await asyncio.to_thread(_select_students_page, sort, order, limit, offset)
+    metrics = await fetch_student_metrics([student['id'] for student in students])
+    response.headers["X-Total-Count"] = str(total)
     
     students_with_stats = []
     for student in students:
-        learning_count = await count_learning_sessions(student['id'])
-        code_count = await count_code_submissions(student['id'])
-
-        login_streak = await asyncio.to_thread(_get_login_streak_for_ui, student["id"])
+        student_metrics = metrics[student['id']]
+        login_streak = student_metrics["login_streak"]
         
         students_with_stats.append({
             **student,
-            "learning_sessions": learning_count,
-            "code_submissions": code_count,
+            "learning_sessions": student_metrics["learning_sessions"],
+            "code_submissions": student_metrics["code_submissions"],
 
             # Streaks (accurate, server-side)
             "login_current_streak": login_streak.get("current_streak", 0),
@@ -6435,16 +11239,11 @@ class LearningProgressUpdate(BaseModel):
 async def get_learning_progress(current_user: dict = Depends(get_current_user)):
     """Get user's learning progress from database"""
     try:
-        conn = sqlite3.connect(SQLITE_DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "SELECT progress_data FROM learning_progress WHERE user_id = ?",
-            (current_user['id'],)
-        )
-        row = cursor.fetchone()
-        conn.close()
+        with _sqlite_connection() as conn:
+            row = conn.execute(
+                "SELECT progress_data FROM learning_progress WHERE user_id = ?",
+                (current_user['id'],)
+            ).fetchone()
         
         if row:
             return {"progress": json.loads(row['progress_data']), "paths": None}
@@ -6453,21 +11252,14 @@ async def get_learning_progress(current_user: dict = Depends(get_current_user)):
         logger.error(f"Error fetching learning progress: {e}")
         return {"progress": {}, "paths": None}
 
-@api_router.post("/learning/progress")
-async def update_learning_progress(
-    progress: LearningProgressUpdate,
-    current_user: dict = Depends(get_current_user)
-):
-    """Update user's learning progress"""
-    try:
-        conn = sqlite3.connect(SQLITE_DB_PATH)
-        conn.row_factory = sqlite3.Row
+def _save_learning_progress(user_id: str, progress: LearningProgressUpdate) -> dict:
+    with _sqlite_write_connection() as conn:
         cursor = conn.cursor()
         
         # Get existing progress
         cursor.execute(
             "SELECT progress_data FROM learning_progress WHERE user_id = ?",
-            (current_user['id'],)
+            (user_id,)
         )
         row = cursor.fetchone()
         
@@ -6492,18 +11284,24 @@ async def update_learning_progress(
         if row:
             cursor.execute(
                 "UPDATE learning_progress SET progress_data = ?, updated_at = ? WHERE user_id = ?",
-                (json.dumps(existing_progress), datetime.now(timezone.utc).isoformat(), current_user['id'])
+                (json.dumps(existing_progress), datetime.now(timezone.utc).isoformat(), user_id)
             )
         else:
             cursor.execute(
                 "INSERT INTO learning_progress (user_id, progress_data, created_at, updated_at) VALUES (?, ?, ?, ?)",
-                (current_user['id'], json.dumps(existing_progress), 
+                (user_id, json.dumps(existing_progress), 
                  datetime.now(timezone.utc).isoformat(), datetime.now(timezone.utc).isoformat())
             )
-        
-        conn.commit()
-        conn.close()
-        
+    return existing_progress
+
+@api_router.post("/learning/progress")
+async def update_learning_progress(
+    progress: LearningProgressUpdate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Update user's learning progress"""
+    try:
+        existing_progress = await run_sqlite_write(_save_learning_progress, current_user['id'], progress)
         return {"success": True, "progress": existing_progress}
     except Exception as e:
         logger.error(f"Error updating learning progress: {e}")
@@ -6523,36 +11321,43 @@ class StudentMessageCreate(BaseModel):
     message: str
 
 @api_router.get("/college/analytics")
-async def get_college_analytics(current_user: dict = Depends(get_current_user)):
+async def get_college_analytics(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: str = Query("day", pattern="^(" + "|".join(ANALYTICS_GRANULARITIES) + ")$"),
+    current_user: dict = Depends(get_current_user),
+):
     """Get analytics data for college admin dashboard"""
     if current_user['role'] != 'college_admin':
         raise HTTPException(status_code=403, detail="Access denied")
     
-    students = await fetch_users_by_role("student", 1000)
-    total_students = len(students)
-    
-    # Calculate statistics
-    total_learning_sessions = 0
-    total_code_submissions = 0
-    active_students = 0
-    
-    for student in students:
-        learning_count = await count_learning_sessions(student['id'])
-        code_count = await count_code_submissions(student['id'])
-        total_learning_sessions += learning_count
-        total_code_submissions += code_count
-        if learning_count > 0 or code_count > 0:
-            active_students += 1
+    # Calculate statistics (one aggregate over the user_stats rollup)
+    totals = await asyncio.to_thread(_student_totals)
+    total_students = totals["total_students"]
+    total_learning_sessions = totals["total_learning_sessions"]
+    total_code_submissions = totals["total_code_submissions"]
+    active_students = totals["active_students"]
     
-    # Get weekly trend data (simulated based on actual data)
-    weekly_data = []
-    days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-    for i, day in enumerate(days):
-        weekly_data.append({
-            "day": day,
-            "sessions": max(0, total_learning_sessions // 7 + (i % 3) * 5),
-            "submissions": max(0, total_code_submissions // 7 + (i % 4) * 3)
-        })
+    # Trend data from the activity_daily rollup (hourly buckets read history)
+    start, end = _resolve_analytics_range(start, end, granularity)
+    series = await asyncio.to_thread(
+        _fetch_activity_series,
+        "role:student",
+        ["learning_sessions", "code_submissions", "signups"],
+        start,
+        end,
+        granularity,
+    )
+    weekly_data = [
+        {
+            "bucket": point["bucket"],
+            "day": _bucket_label(point["bucket"], granularity),
+            "sessions": point["learning_sessions"],
+            "submissions": point["code_submissions"],
+            "signups": point["signups"],
+        }
+        for point in series
+    ]
     
     return {
         "total_students": total_students,
@@ -6562,27 +11367,18 @@ async def get_college_analytics(current_user: dict = Depends(get_current_user)):
         "avg_sessions_per_student": round(total_learning_sessions / max(1, total_students), 2),
         "avg_submissions_per_student": round(total_code_submissions / max(1, total_students), 2),
         "engagement_rate": round((active_students / max(1, total_students)) * 100, 1),
-        "weekly_data": weekly_data
+        "weekly_data": weekly_data,
+        "range": {"start": start.isoformat(), "end": end.isoformat(), "granularity": granularity},
     }
 
-@api_router.post("/college/announcements")
-async def create_announcement(
-    announcement: AnnouncementCreate, 
-    current_user: dict = Depends(get_current_user)
-):
-    """Create a new announcement"""
-    if current_user['role'] != 'college_admin':
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    announcement_id = str(uuid.uuid4())
-    
-    with _sqlite_connection() as conn:
+def _insert_college_announcement(announcement_id: str, admin_id: str, announcement: AnnouncementCreate):
+    with _sqlite_write_connection() as conn:
         conn.execute(
             """INSERT INTO announcements (id, college_admin_id, title, message, type, target_students, created_at) 
                VALUES (?, ?, ?, ?, ?, ?, ?)""",
             (
                 announcement_id,
-                current_user['id'],
+                admin_id,
                 announcement.title,
                 announcement.message,
                 announcement.type,
@@ -6590,7 +11386,19 @@ async def create_announcement(
                 datetime.now(timezone.utc).isoformat()
             )
         )
-        conn.commit()
+
+@api_router.post("/college/announcements")
+async def create_announcement(
+    announcement: AnnouncementCreate, 
+    current_user: dict = Depends(get_current_user)
+):
+    """Create a new announcement"""
+    if current_user['role'] != 'college_admin':
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    announcement_id = str(uuid.uuid4())
+    
+    await run_sqlite_write(_insert_college_announcement, announcement_id, current_user['id'], announcement)
     
     return {
         "id": announcement_id,
@@ -6746,21 +11554,38 @@ async def get_student_notifications(current_user: dict = Depends(get_current_use
 
     return notifications
 
+def _delete_college_announcement(admin_id: str, announcement_id: str):
+    with _sqlite_write_connection() as conn:
+        conn.execute(
+            "DELETE FROM announcements WHERE id = ? AND college_admin_id = ?",
+            (announcement_id, admin_id)
+        )
+
 @api_router.delete("/college/announcements/{announcement_id}")
 async def delete_announcement(announcement_id: str, current_user: dict = Depends(get_current_user)):
     """Delete an announcement"""
     if current_user['role'] != 'college_admin':
         raise HTTPException(status_code=403, detail="Access denied")
     
-    with _sqlite_connection() as conn:
-        conn.execute(
-            "DELETE FROM announcements WHERE id = ? AND college_admin_id = ?",
-            (announcement_id, current_user['id'])
-        )
-        conn.commit()
+    await run_sqlite_write(_delete_college_announcement, current_user['id'], announcement_id)
     
     return {"success": True}
 
+def _insert_student_message(message_id: str, admin_id: str, student_id: str, message_data: StudentMessageCreate):
+    with _sqlite_write_connection() as conn:
+        conn.execute(
+            """INSERT INTO student_messages (id, from_id, to_id, subject, message, created_at) 
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (
+                message_id,
+                admin_id,
+                student_id,
+                message_data.subject,
+                message_data.message,
+                datetime.now(timezone.utc).isoformat()
+            )
+        )
+
 @api_router.post("/college/students/{student_id}/message")
 async def send_student_message(
     student_id: str, 
@@ -6773,20 +11598,7 @@ async def send_student_message(
     
     message_id = str(uuid.uuid4())
     
-    with _sqlite_connection() as conn:
-        conn.execute(
-            """INSERT INTO student_messages (id, from_id, to_id, subject, message, created_at) 
-               VALUES (?, ?, ?, ?, ?, ?)""",
-            (
-                message_id,
-                current_user['id'],
-                student_id,
-                message_data.subject,
-                message_data.message,
-                datetime.now(timezone.utc).isoformat()
-            )
-        )
-        conn.commit()
+    await run_sqlite_write(_insert_student_message, message_id, current_user['id'], student_id, message_data)
     
     return {"success": True, "message_id": message_id}
 
@@ -6857,7 +11669,12 @@ class CandidateActionCreate(BaseModel):
     interview_type: Optional[str] = None
 
 @api_router.get("/company/analytics")
-async def get_company_analytics(current_user: dict = Depends(get_current_user)):
+async def get_company_analytics(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    granularity: str = Query("day", pattern="^(" + "|".join(ANALYTICS_GRANULARITIES) + ")$"),
+    current_user: dict = Depends(get_current_user),
+):
     """Get analytics data for company dashboard"""
     if current_user['role'] != 'company':
         raise HTTPException(status_code=403, detail="Access denied")
@@ -6894,15 +11711,32 @@ async def get_company_analytics(current_user: dict = Depends(get_current_user)):
     # Get total candidates
     job_seekers = await fetch_users_by_role("job_seeker", 1000)
     
-    # Weekly trend data
-    weekly_data = []
-    days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-    for i, day in enumerate(days):
-        weekly_data.append({
-            "day": day,
-            "applications": max(0, len(job_seekers) // 7 + (i % 5) * 2),
-            "interviews": max(0, action_stats.get('schedule_interview', 0) // 7 + (i % 3))
-        })
+    # Trend data: new job seekers joining the candidate pool plus this
+    # company's own pipeline actions and postings, from activity_daily.
+    start, end = _resolve_analytics_range(start, end, granularity)
+    company_series, seeker_series = await asyncio.gather(
+        asyncio.to_thread(
+            _fetch_activity_series,
+            f"company:{current_user['id']}",
+            ["action:shortlist", "action:schedule_interview", "action:hire", "job_postings"],
+            start,
+            end,
+            granularity,
+        ),
+        asyncio.to_thread(_fetch_activity_series, "role:job_seeker", ["signups"], start, end, granularity),
+    )
+    weekly_data = [
+        {
+            "bucket": point["bucket"],
+            "day": _bucket_label(point["bucket"], granularity),
+            "applications": seekers["signups"],
+            "shortlisted": point["action:shortlist"],
+            "interviews": point["action:schedule_interview"],
+            "hired": point["action:hire"],
+            "job_postings": point["job_postings"],
+        }
+        for point, seekers in zip(company_series, seeker_series)
+    ]
     
     return {
         "total_jobs": job_count,
@@ -6913,25 +11747,19 @@ async def get_company_analytics(current_user: dict = Depends(get_current_user)):
         "interviews_scheduled": action_stats.get('schedule_interview', 0),
         "hired": action_stats.get('hire', 0),
         "total_assessments": assessment_count,
-        "weekly_data": weekly_data
+        "weekly_data": weekly_data,
+        "range": {"start": start.isoformat(), "end": end.isoformat(), "granularity": granularity},
     }
 
-@api_router.post("/company/jobs")
-async def create_job_posting(job: JobPostingCreate, current_user: dict = Depends(get_current_user)):
-    """Create a new job posting"""
-    if current_user['role'] != 'company':
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    job_id = str(uuid.uuid4())
-    
-    with _sqlite_connection() as conn:
+def _insert_job_posting(job_id: str, company_id: str, job: JobPostingCreate, created_at: str):
+    with _sqlite_write_connection() as conn:
         conn.execute(
             """INSERT INTO job_postings 
                (id, company_id, title, department, location, type, salary_min, salary_max, description, requirements, status, created_at)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'active', ?)""",
             (
                 job_id,
-                current_user['id'],
+                company_id,
                 job.title,
                 job.department,
                 job.location,
@@ -6940,10 +11768,21 @@ async def create_job_posting(job: JobPostingCreate, current_user: dict = Depends
                 job.salary_max,
                 job.description,
                 json.dumps(job.requirements),
-                datetime.now(timezone.utc).isoformat()
+                created_at
             )
         )
-        conn.commit()
+        _bump_activity_daily(conn, f"company:{company_id}", "job_postings", created_at)
+
+@api_router.post("/company/jobs")
+async def create_job_posting(job: JobPostingCreate, current_user: dict = Depends(get_current_user)):
+    """Create a new job posting"""
+    if current_user['role'] != 'company':
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    job_id = str(uuid.uuid4())
+    created_at = datetime.now(timezone.utc).isoformat()
+    
+    await run_sqlite_write(_insert_job_posting, job_id, current_user['id'], job, created_at)
     
     return {
         "id": job_id,
@@ -6976,13 +11815,8 @@ async def get_job_postings(current_user: dict = Depends(get_current_user)):
     
     return jobs
 
-@api_router.put("/company/jobs/{job_id}")
-async def update_job_posting(job_id: str, job: JobPostingCreate, current_user: dict = Depends(get_current_user)):
-    """Update a job posting"""
-    if current_user['role'] != 'company':
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    with _sqlite_connection() as conn:
+def _update_job_posting(company_id: str, job_id: str, job: JobPostingCreate):
+    with _sqlite_write_connection() as conn:
         conn.execute(
             """UPDATE job_postings 
                SET title = ?, department = ?, location = ?, type = ?, salary_min = ?, salary_max = ?, description = ?, requirements = ?
@@ -6997,59 +11831,69 @@ async def update_job_posting(job_id: str, job: JobPostingCreate, current_user: d
                 job.description,
                 json.dumps(job.requirements),
                 job_id,
-                current_user['id']
+                company_id
             )
         )
-        conn.commit()
+
+@api_router.put("/company/jobs/{job_id}")
+async def update_job_posting(job_id: str, job: JobPostingCreate, current_user: dict = Depends(get_current_user)):
+    """Update a job posting"""
+    if current_user['role'] != 'company':
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    await run_sqlite_write(_update_job_posting, current_user['id'], job_id, job)
     
     return {"success": True}
 
+def _update_job_posting_status(company_id: str, job_id: str, status: str):
+    with _sqlite_write_connection() as conn:
+        conn.execute(
+            "UPDATE job_postings SET status = ? WHERE id = ? AND company_id = ?",
+            (status, job_id, company_id)
+        )
+
 @api_router.patch("/company/jobs/{job_id}/status")
 async def update_job_status(job_id: str, status: str, current_user: dict = Depends(get_current_user)):
     """Update job posting status"""
     if current_user['role'] != 'company':
         raise HTTPException(status_code=403, detail="Access denied")
     
-    with _sqlite_connection() as conn:
-        conn.execute(
-            "UPDATE job_postings SET status = ? WHERE id = ? AND company_id = ?",
-            (status, job_id, current_user['id'])
-        )
-        conn.commit()
+    await run_sqlite_write(_update_job_posting_status, current_user['id'], job_id, status)
     
     return {"success": True}
 
+def _delete_job_posting(company_id: str, job_id: str):
+    with _sqlite_write_connection() as conn:
+        existing = conn.execute(
+            "SELECT created_at FROM job_postings WHERE id = ? AND company_id = ?",
+            (job_id, company_id)
+        ).fetchone()
+        conn.execute(
+            "DELETE FROM job_postings WHERE id = ? AND company_id = ?",
+            (job_id, company_id)
+        )
+        if existing:
+            _bump_activity_daily(conn, f"company:{company_id}", "job_postings", existing["created_at"], -1)
+
 @api_router.delete("/company/jobs/{job_id}")
 async def delete_job_posting(job_id: str, current_user: dict = Depends(get_current_user)):
     """Delete a job posting"""
     if current_user['role'] != 'company':
         raise HTTPException(status_code=403, detail="Access denied")
     
-    with _sqlite_connection() as conn:
-        conn.execute(
-            "DELETE FROM job_postings WHERE id = ? AND company_id = ?",
-            (job_id, current_user['id'])
-        )
-        conn.commit()
+    await run_sqlite_write(_delete_job_posting, current_user['id'], job_id)
     
     return {"success": True}
 
-@api_router.post("/company/assessments")
-async def create_assessment(assessment: AssessmentCreate, current_user: dict = Depends(get_current_user)):
-    """Create a new assessment"""
-    if current_user['role'] != 'company':
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    assessment_id = str(uuid.uuid4())
-    
-    with _sqlite_connection() as conn:
+def _insert_assessment(assessment_id: str, company_id: str, assessment: AssessmentCreate):
+    with _sqlite_write_connection() as conn:
         conn.execute(
             """INSERT INTO assessments 
                (id, company_id, title, type, questions, duration, passing_score, status, created_at)
                VALUES (?, ?, ?, ?, ?, ?, ?, 'active', ?)""",
             (
                 assessment_id,
-                current_user['id'],
+                company_id,
                 assessment.title,
                 assessment.type,
                 json.dumps(assessment.questions),
@@ -7058,7 +11902,16 @@ async def create_assessment(assessment: AssessmentCreate, current_user: dict = D
                 datetime.now(timezone.utc).isoformat()
             )
         )
-        conn.commit()
+
+@api_router.post("/company/assessments")
+async def create_assessment(assessment: AssessmentCreate, current_user: dict = Depends(get_current_user)):
+    """Create a new assessment"""
+    if current_user['role'] != 'company':
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    assessment_id = str(uuid.uuid4())
+    
+    await run_sqlite_write(_insert_assessment, assessment_id, current_user['id'], assessment)
     
     return {
         "id": assessment_id,
@@ -7091,13 +11944,8 @@ async def get_assessments(current_user: dict = Depends(get_current_user)):
     
     return assessments
 
-@api_router.put("/company/assessments/{assessment_id}")
-async def update_assessment(assessment_id: str, assessment: AssessmentCreate, current_user: dict = Depends(get_current_user)):
-    """Update an assessment"""
-    if current_user['role'] != 'company':
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    with _sqlite_connection() as conn:
+def _update_assessment(company_id: str, assessment_id: str, assessment: AssessmentCreate):
+    with _sqlite_write_connection() as conn:
         conn.execute(
             """UPDATE assessments 
                SET title = ?, type = ?, questions = ?, duration = ?, passing_score = ?
@@ -7109,57 +11957,70 @@ async def update_assessment(assessment_id: str, assessment: AssessmentCreate, cu
                 assessment.duration,
                 assessment.passing_score,
                 assessment_id,
-                current_user['id']
+                company_id
             )
         )
-        conn.commit()
-    
-    return {"success": True}
 
-@api_router.delete("/company/assessments/{assessment_id}")
-async def delete_assessment(assessment_id: str, current_user: dict = Depends(get_current_user)):
-    """Delete an assessment"""
+@api_router.put("/company/assessments/{assessment_id}")
+async def update_assessment(assessment_id: str, assessment: AssessmentCreate, current_user: dict = Depends(get_current_user)):
+    """Update an assessment"""
     if current_user['role'] != 'company':
         raise HTTPException(status_code=403, detail="Access denied")
     
-    with _sqlite_connection() as conn:
+    await run_sqlite_write(_update_assessment, current_user['id'], assessment_id, assessment)
+    
+    return {"success": True}
+
+def _delete_assessment(company_id: str, assessment_id: str):
+    with _sqlite_write_connection() as conn:
         conn.execute(
             "DELETE FROM assessments WHERE id = ? AND company_id = ?",
-            (assessment_id, current_user['id'])
+            (assessment_id, company_id)
         )
-        conn.commit()
-    
-    return {"success": True}
 
-@api_router.post("/company/candidates/{candidate_id}/action")
-async def perform_candidate_action(
-    candidate_id: str,
-    action_data: CandidateActionCreate,
-    current_user: dict = Depends(get_current_user)
-):
-    """Perform an action on a candidate (shortlist, reject, schedule interview, hire)"""
+@api_router.delete("/company/assessments/{assessment_id}")
+async def delete_assessment(assessment_id: str, current_user: dict = Depends(get_current_user)):
+    """Delete an assessment"""
     if current_user['role'] != 'company':
         raise HTTPException(status_code=403, detail="Access denied")
     
-    action_id = str(uuid.uuid4())
+    await run_sqlite_write(_delete_assessment, current_user['id'], assessment_id)
     
-    with _sqlite_connection() as conn:
+    return {"success": True}
+
+def _insert_candidate_action(action_id: str, company_id: str, candidate_id: str, action_data: CandidateActionCreate, created_at: str):
+    with _sqlite_write_connection() as conn:
         conn.execute(
             """INSERT INTO candidate_actions 
                (id, company_id, candidate_id, action, notes, interview_date, interview_type, created_at)
                VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
             (
                 action_id,
-                current_user['id'],
+                company_id,
                 candidate_id,
                 action_data.action,
                 action_data.notes,
                 action_data.interview_date,
                 action_data.interview_type,
-                datetime.now(timezone.utc).isoformat()
+                created_at
             )
         )
-        conn.commit()
+        _bump_activity_daily(conn, f"company:{company_id}", f"action:{action_data.action}", created_at)
+
+@api_router.post("/company/candidates/{candidate_id}/action")
+async def perform_candidate_action(
+    candidate_id: str,
+    action_data: CandidateActionCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    """Perform an action on a candidate (shortlist, reject, schedule interview, hire)"""
+    if current_user['role'] != 'company':
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    action_id = str(uuid.uuid4())
+    created_at = datetime.now(timezone.utc).isoformat()
+    
+    await run_sqlite_write(_insert_candidate_action, action_id, current_user['id'], candidate_id, action_data, created_at)
     
     return {"success": True, "action_id": action_id}
 
@@ -7180,50 +12041,6 @@ async def get_candidate_actions(candidate_id: str, current_user: dict = Depends(
     
     return [dict(row) for row in rows]
 
-@api_router.get("/company/candidates/status")
-async def get_candidates_with_status(current_user: dict = Depends(get_current_user)):
-    """Get candidates with their current status (shortlisted, rejected, etc.)"""
-    if current_user['role'] != 'company':
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    job_seekers = await fetch_users_by_role("job_seeker", 100)
-    
-    # Get latest action for each candidate
-    with _sqlite_connection() as conn:
-        cursor = conn.execute(
-            """SELECT candidate_id, action, interview_date, interview_type, created_at
-               FROM candidate_actions 
-               WHERE company_id = ?
-               ORDER BY created_at DESC""",
-            (current_user['id'],)
-        )
-        actions = cursor.fetchall()
-    
-    # Create a map of latest action per candidate
-    candidate_status = {}
-    for action in actions:
-        cid = action['candidate_id']
-        if cid not in candidate_status:
-            candidate_status[cid] = dict(action)
-    
-    candidates_with_status = []
-    for seeker in job_seekers:
-        latest_resume = await fetch_latest_resume(seeker['id'])
-        avg_code = await get_avg_code_score(seeker['id'])
-        
-        status_info = candidate_status.get(seeker['id'], {})
-        
-        candidates_with_status.append({
-            **seeker,
-            "resume_score": latest_resume.get('credibility_score', 0) if latest_resume else 0,
-            "avg_code_score": round(avg_code, 2),
-            "status": status_info.get('action', 'new'),
-            "interview_date": status_info.get('interview_date'),
-            "interview_type": status_info.get('interview_type')
-        })
-    
-    return candidates_with_status
-
 
 # ==================== PREMIUM ENROLLMENT ROUTES ====================
 @api_router.post("/premium/enroll-course")
@@ -7242,17 +12059,12 @@ async def enroll_course(
     try:
         screenshot_url = None
         if screenshot:
-            content = await screenshot.read()
-            if len(content) > MAX_FILE_SIZE_MB * 1024 * 1024:
-                raise HTTPException(status_code=413, detail=f"File too large. Max {MAX_FILE_SIZE_MB}MB")
-
             premium_dir = UPLOADS_ROOT / "premium"
             premium_dir.mkdir(parents=True, exist_ok=True)
             safe_name = os.path.basename(screenshot.filename or "payment.png")
             stored_name = f"{uuid.uuid4()}_{safe_name}"
-            stored_path = premium_dir / stored_name
-            with open(stored_path, "wb") as f:
-                f.write(content)
+            async with await receive_upload(screenshot, MAX_FILE_SIZE_MB, allow_empty=True) as upload:
+                await upload.save_to(premium_dir / stored_name)
             screenshot_url = f"/uploads/premium/{stored_name}"
 
         enrollment_doc = {
@@ -7295,17 +12107,12 @@ async def apply_internship(
     try:
         screenshot_url = None
         if screenshot:
-            content = await screenshot.read()
-            if len(content) > MAX_FILE_SIZE_MB * 1024 * 1024:
-                raise HTTPException(status_code=413, detail=f"File too large. Max {MAX_FILE_SIZE_MB}MB")
-
             premium_dir = UPLOADS_ROOT / "premium"
             premium_dir.mkdir(parents=True, exist_ok=True)
             safe_name = os.path.basename(screenshot.filename or "payment.png")
             stored_name = f"{uuid.uuid4()}_{safe_name}"
-            stored_path = premium_dir / stored_name
-            with open(stored_path, "wb") as f:
-                f.write(content)
+            async with await receive_upload(screenshot, MAX_FILE_SIZE_MB, allow_empty=True) as upload:
+                await upload.save_to(premium_dir / stored_name)
             screenshot_url = f"/uploads/premium/{stored_name}"
 
         application_doc = {
@@ -7357,7 +12164,7 @@ async def update_enrollment_status(
     try:
         if status not in ['approved', 'rejected']:
             raise HTTPException(status_code=400, detail="Invalid status")
-        await asyncio.to_thread(_update_enrollment_status, enrollment_id, status)
+        await run_sqlite_write(_update_enrollment_status, enrollment_id, status)
         return {"message": f"Enrollment {status}"}
     except Exception as e:
         logger.error(f"Error updating enrollment status: {e}")
@@ -7381,7 +12188,7 @@ async def update_application_status(
     try:
         if status not in ['approved', 'rejected']:
             raise HTTPException(status_code=400, detail="Invalid status")
-        await asyncio.to_thread(_update_application_status, application_id, status)
+        await run_sqlite_write(_update_application_status, application_id, status)
         return {"message": f"Application {status}"}
     except Exception as e:
         logger.error(f"Error updating application status: {e}")
@@ -7408,41 +12215,6 @@ async def get_my_applications(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail="Failed to fetch applications")
 
 
-# ==================== LEADERBOARD ROUTE ====================
-from fastapi import Query
-
-class LeaderboardEntry(BaseModel):
-    id: str
-    name: str
-    email: str
-    avg_code_score: float
-    code_submissions: int
-    role: str
-    created_at: str
-
-@api_router.get("/leaderboard", response_model=List[LeaderboardEntry])
-async def get_leaderboard(
-    limit: int = Query(10, ge=1, le=100, description="Number of top users to return")
-):
-    """Get top users for the leaderboard, ranked by average code score and submissions."""
-    students = await fetch_users_by_role("student", 200)
-    leaderboard = []
-    for student in students:
-        avg_score = await get_avg_code_score(student['id'])
-        submissions = await count_code_submissions(student['id'])
-        leaderboard.append({
-            "id": student['id'],
-            "name": student['name'],
-            "email": student['email'],
-            "avg_code_score": round(avg_score, 2),
-            "code_submissions": submissions,
-            "role": student['role'],
-            "created_at": student['created_at']
-        })
-    # Sort by avg_code_score desc, then code_submissions desc
-    leaderboard.sort(key=lambda x: (x['avg_code_score'], x['code_submissions']), reverse=True)
-    return leaderboard[:limit]
-
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -7476,6 +12248,47 @@ async def _catch_options(request: Request, call_next):
     return await call_next(request)
 _init_sqlite_db()
 
+
+@app.on_event("startup")
+async def _start_job_queue():
+    # Picks up jobs queued or interrupted before a restart.
+    _job_queue.start()
+
+
+@app.on_event("shutdown")
+async def _stop_job_queue():
+    # Before the write queue stops: interrupted jobs are requeued through it.
+    await _job_queue.stop()
+
+
+@app.on_event("shutdown")
+async def _stop_extraction_service():
+    _extraction_service.shutdown()
+
+
+@app.on_event("shutdown")
+async def _close_sqlite_pool():
+    await _sqlite_write_queue.stop()
+    _sqlite_pool.close_all()
+
+
+@app.on_event("startup")
+async def _load_tokenizer():
+    # tiktoken may download or parse its BPE file on first use; not on the loop.
+    await asyncio.to_thread(_tokenizer._load)
+
+
+@app.on_event("startup")
+async def _start_ai_health_monitor():
+    if _ai_router.backends():
+        _ai_health.start(_ai_router.backends())
+
+
+@app.on_event("shutdown")
+async def _close_ai_clients():
+    await _ai_health.stop()
+    await close_ai_providers()
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -7483,7 +12296,14 @@ logging.basicConfig(
 )
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
+
+    # Spawned extraction workers import the parent's __main__ module before
+    # anything else. Make that extraction.py rather than this whole server
+    # (banner, app, database setup); `import server` still finds this module.
+    sys.modules["server"] = sys.modules["__main__"]
+    sys.modules["__main__"] = extraction
     uvicorn.run(
         app,
         host="0.0.0.0",
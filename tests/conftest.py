@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# server.py opens its database and upload directories at import time, so
+# point them at a scratch directory before the first import.
+_DATA_DIR = tempfile.mkdtemp(prefix="learnovatex-tests-")
+os.environ["SQLITE_DB_PATH"] = os.path.join(_DATA_DIR, "test.db")
+os.environ.setdefault("AI_MODE", "demo")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+
+@pytest.fixture(scope="session")
+def server():
+    import server as module
+
+    return module
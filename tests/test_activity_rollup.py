@@ -0,0 +1,54 @@
+import uuid
+from datetime import date
+
+
+def _user(server, role, created_at):
+    user_id = str(uuid.uuid4())
+    server._insert_sqlite_user(
+        {"id": user_id, "email": f"{user_id}@example.com", "password": "x", "name": "n", "role": role, "created_at": created_at}
+    )
+    return user_id
+
+
+def _learning(server, user_id, created_at):
+    server._insert_learning_history({"id": str(uuid.uuid4()), "user_id": user_id, "topic": "t", "created_at": created_at})
+
+
+def _day(server, scope, metric, day="2026-03-02"):
+    series = server._fetch_activity_series(scope, [metric], date.fromisoformat(day), date.fromisoformat(day))
+    return series[0][metric]
+
+
+def test_role_rollup_follows_a_role_change(server):
+    user_id = _user(server, "rollup_a", "2026-03-02T08:00:00+00:00")
+    _learning(server, user_id, "2026-03-02T09:15:00+00:00")
+    _learning(server, user_id, "2026-03-02T10:30:00+00:00")
+
+    with server._sqlite_write_connection() as conn:
+        conn.execute("UPDATE users SET role = 'rollup_b' WHERE id = ?", (user_id,))
+
+    assert _day(server, "role:rollup_a", "learning_sessions") == 0
+    assert _day(server, "role:rollup_a", "signups") == 0
+    assert _day(server, "role:rollup_b", "learning_sessions") == 2
+    assert _day(server, "role:rollup_b", "signups") == 1
+    with server._sqlite_connection() as conn:
+        rows = conn.execute("SELECT scope, metric, day, count FROM activity_daily WHERE count != 0 ORDER BY 1, 2, 3").fetchall()
+        live = [tuple(row) for row in rows]
+        server._rebuild_activity_daily(conn)
+        rebuilt = [tuple(row) for row in conn.execute("SELECT scope, metric, day, count FROM activity_daily ORDER BY 1, 2, 3")]
+        conn.rollback()
+    assert live == rebuilt
+
+
+def test_hourly_series_reads_the_current_role(server):
+    user_id = _user(server, "rollup_c", "2026-03-02T08:00:00+00:00")
+    _learning(server, user_id, "2026-03-02T09:15:00+00:00")
+
+    series = server._fetch_activity_series(
+        "role:rollup_c", ["learning_sessions", "signups"], date(2026, 3, 2), date(2026, 3, 2), "hour"
+    )
+
+    counts = {row["bucket"][11:]: (row["learning_sessions"], row["signups"]) for row in series}
+    assert counts["08:00"] == (0, 1)
+    assert counts["09:00"] == (1, 0)
+    assert len(series) == 24
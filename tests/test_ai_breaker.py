@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+
+def _half_open(provider):
+    provider.breaker.state = "open"
+    provider.breaker._opened_at = -provider.breaker.reset_seconds
+
+
+def test_trial_is_released_when_the_slot_wait_is_cancelled(server):
+    provider = server._FakeAIProvider()
+    provider.max_concurrency = 1
+
+    async def main():
+        async with provider._slot():
+            _half_open(provider)
+            waiter = asyncio.create_task(provider._slot().__aenter__())
+            await asyncio.sleep(0.01)
+            assert provider.breaker.state == "half_open"
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            return provider.breaker.is_open()
+
+    assert not asyncio.run(main())
+
+
+def test_trial_is_released_when_no_slot_frees_up(server):
+    provider = server._FakeAIProvider()
+    provider.max_concurrency = 1
+    provider.queue_timeout = 0.01
+
+    async def main():
+        async with provider._slot():
+            _half_open(provider)
+            with pytest.raises(server.AIProviderBusy):
+                async with provider._slot():
+                    pass
+            return provider.breaker.is_open()
+
+    assert not asyncio.run(main())
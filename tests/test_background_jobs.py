@@ -0,0 +1,136 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def jobs(server):
+    with server._sqlite_write_connection() as conn:
+        conn.execute("DELETE FROM background_jobs")
+    return server
+
+
+def _queue(server, created_at="2026-01-01T00:00:00+00:00", kind="echo"):
+    job = {"id": str(uuid.uuid4()), "user_id": "u1", "kind": kind, "payload": {"n": 1}, "created_at": created_at}
+    server._insert_job(job)
+    return job["id"]
+
+
+def test_claim_leases_oldest_queued_job(jobs):
+    newer = _queue(jobs, "2026-01-02T00:00:00+00:00")
+    older = _queue(jobs, "2026-01-01T00:00:00+00:00")
+
+    job = jobs._claim_job(60, 3)
+
+    assert job["id"] == older
+    assert job["status"] == "running"
+    assert job["attempts"] == 1
+    assert job["lease_until"] > time.time()
+    assert jobs._claim_job(60, 3)["id"] == newer
+    assert jobs._claim_job(60, 3) is None
+
+
+def test_expired_lease_is_claimed_again(jobs):
+    job_id = _queue(jobs)
+    jobs._claim_job(-1, 3)  # lease already expired: its worker died
+
+    job = jobs._claim_job(60, 3)
+
+    assert job["id"] == job_id
+    assert job["attempts"] == 2
+
+
+def test_expired_lease_fails_once_attempts_are_used_up(jobs):
+    job_id = _queue(jobs)
+    jobs._claim_job(-1, 1)
+
+    assert jobs._claim_job(60, 1) is None
+    job = jobs._fetch_job(job_id)
+    assert job["status"] == "failed"
+    assert job["error_status"] == 500
+
+
+def test_finish_is_ignored_after_the_lease_was_taken_over(jobs):
+    job_id = _queue(jobs)
+    jobs._claim_job(-1, 3)
+    jobs._claim_job(60, 3)
+    inserted = []
+
+    assert jobs._finish_job(job_id, 1, inserted.append, {"score": 1}) is False
+    assert inserted == []
+    assert jobs._finish_job(job_id, 2, inserted.append, {"score": 2}) is True
+    assert inserted == [{"score": 2}]
+    job = jobs._fetch_job(job_id)
+    assert job["status"] == "succeeded"
+    assert job["result"] == {"score": 2}
+
+
+def test_requeue_gives_the_attempt_back(jobs):
+    job_id = _queue(jobs)
+    jobs._claim_job(60, 3)
+
+    jobs._requeue_job(job_id, 1)
+
+    job = jobs._fetch_job(job_id)
+    assert job["status"] == "queued"
+    assert job["attempts"] == 0
+    assert job["lease_until"] is None
+
+
+def test_queue_recovers_a_job_left_running(jobs, monkeypatch):
+    runs = []
+
+    async def run(user_id, payload):
+        runs.append(payload)
+        return {"user_id": user_id, "n": payload["n"]}
+
+    stored = []
+    monkeypatch.setitem(jobs._JOB_KINDS, "echo", jobs._JobKind(run, stored.append))
+    job_id = _queue(jobs)
+    jobs._claim_job(-1, 3)  # a previous process leased it and died
+
+    async def main():
+        queue = jobs._JobQueue(workers=1, lease_seconds=60, max_attempts=3, poll_seconds=0.05)
+        queue.start()
+        try:
+            return await queue.wait(job_id, timeout=5)
+        finally:
+            await queue.stop()
+
+    job = asyncio.run(main())
+
+    assert job["status"] == "succeeded"
+    assert job["attempts"] == 2
+    assert runs == [{"n": 1}]
+    assert stored == [{"user_id": "u1", "n": 1}]
+
+
+def test_queue_stores_http_errors_and_requeues_on_stop(jobs, monkeypatch):
+    async def reject(user_id, payload):
+        raise jobs.HTTPException(status_code=400, detail="bad submission")
+
+    async def hang(user_id, payload):
+        await asyncio.sleep(60)
+
+    monkeypatch.setitem(jobs._JOB_KINDS, "reject", jobs._JobKind(reject, lambda doc: None))
+    monkeypatch.setitem(jobs._JOB_KINDS, "hang", jobs._JobKind(hang, lambda doc: None))
+
+    async def main():
+        queue = jobs._JobQueue(workers=2, lease_seconds=60, max_attempts=3, poll_seconds=0.05)
+        rejected = await queue.enqueue("u1", "reject", {})
+        hanging = await queue.enqueue("u1", "hang", {})
+        failed = await queue.wait(rejected["id"], timeout=5)
+        while jobs._fetch_job(hanging["id"])["status"] != "running":
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return failed, jobs._fetch_job(hanging["id"])
+
+    failed, requeued = asyncio.run(main())
+
+    assert failed["status"] == "failed"
+    assert failed["error_status"] == 400
+    assert failed["error"] == "bad submission"
+    assert requeued["status"] == "queued"
+    assert requeued["attempts"] == 0
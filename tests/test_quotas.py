@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def quotas(server, monkeypatch):
+    monkeypatch.setattr(server, "QUOTA_ENABLED", True)
+    monkeypatch.setitem(server._QUOTA_POLICIES, "code", server._QuotaPolicy(5))
+    monkeypatch.setattr(server, "_quota_engine", server._QuotaEngine(server._MemoryQuotaBackend(), server._BurstLimiter(0, 0)))
+    return server
+
+
+def _enforce(server, count, user_id="u1"):
+    with pytest.raises(server.HTTPException) as rejected:
+        asyncio.run(server.enforce_quota(user_id, "code", count))
+    return rejected.value
+
+
+def test_batch_larger_than_the_daily_limit_is_a_bad_request(quotas):
+    error = _enforce(quotas, 6)
+
+    assert error.status_code == 400
+    assert error.headers["X-RateLimit-Limit"] == "5"
+
+
+def test_batch_larger_than_what_remains_is_rate_limited(quotas):
+    asyncio.run(quotas.enforce_quota("u1", "code", 3))
+
+    error = _enforce(quotas, 3)
+
+    assert error.status_code == 429
+    assert int(error.headers["Retry-After"]) > 0
+    asyncio.run(quotas.enforce_quota("u1", "code", 2))
+
+
+def test_events_leave_the_window_bucket_by_bucket(server, monkeypatch):
+    policy = server._QuotaPolicy(3, window_seconds=60, buckets=6)
+    monkeypatch.setitem(server._QUOTA_POLICIES, "code", policy)
+    engine = server._QuotaEngine(server._MemoryQuotaBackend(), server._BurstLimiter(0, 0))
+    clock = [1000.0]
+    monkeypatch.setattr(server.time, "time", lambda: clock[0])
+
+    async def main():
+        await engine.check("u1", "code")  # bucket 100, 1000-1009
+        clock[0] = 1025.0
+        await engine.check("u1", "code", 2)  # bucket 102
+        with pytest.raises(server.QuotaExceeded) as full:
+            await engine.check("u1", "code")
+        clock[0] = 1070.0  # bucket 100 has left the window, 102 has not
+        await engine.check("u1", "code")
+        with pytest.raises(server.QuotaExceeded) as still_full:
+            await engine.check("u1", "code")
+        return full.value, still_full.value
+
+    full, still_full = asyncio.run(main())
+
+    # The oldest event leaves once its bucket is a whole window old.
+    assert full.retry_after == 1010.0 + 60 - 1025.0
+    assert still_full.retry_after == 1030.0 + 60 - 1070.0
+
+
+def test_retry_after_header_rounds_up(quotas, monkeypatch):
+    monkeypatch.setitem(quotas._QUOTA_POLICIES, "code", quotas._QuotaPolicy(1, window_seconds=60, buckets=6))
+    monkeypatch.setattr(quotas.time, "time", lambda: 1000.5)
+    asyncio.run(quotas.enforce_quota("u1", "code"))
+
+    error = _enforce(quotas, 1)
+
+    assert error.status_code == 429
+    assert error.headers["Retry-After"] == "70"  # 69.5 s until bucket 100 expires
+
+
+def test_daily_rejection_keeps_the_burst_token(server, monkeypatch):
+    monkeypatch.setitem(server._QUOTA_POLICIES, "code", server._QuotaPolicy(1))
+    burst = server._BurstLimiter(2, 1)
+    engine = server._QuotaEngine(server._MemoryQuotaBackend(), burst)
+
+    async def main():
+        await engine.check("u1", "code")
+        for _ in range(3):
+            with pytest.raises(server.QuotaExceeded) as daily:
+                await engine.check("u1", "code")
+            assert daily.value.reason == "daily limit reached"
+        await engine.check("u1", "ai")
+        return burst.wait("u1")
+
+    assert asyncio.run(main()) > 0  # both tokens went to admitted requests
+
+
+def test_idle_keys_are_pruned(server, monkeypatch):
+    backend = server._MemoryQuotaBackend()
+    engine = server._QuotaEngine(backend, server._BurstLimiter(0, 0))
+    clock = [1000.0]
+    monkeypatch.setattr(server.time, "time", lambda: clock[0])
+
+    async def main():
+        await engine.check("idle", "code")
+        clock[0] += 86400 * 2
+        await engine.check("active", "code")
+        engine._pruned_at -= engine.PRUNE_INTERVAL_SECONDS
+        await engine.check("active", "code")
+
+    asyncio.run(main())
+
+    assert backend.stats() == {"keys": 1}
+    assert engine.stats()["pruned_keys"] == 1
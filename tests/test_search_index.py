@@ -0,0 +1,27 @@
+import uuid
+
+
+def _search(server, user_id, query):
+    return [row["id"] for row in server._search_documents(user_id, f'"{query}"', ["learning", "context"], 10, 0)["results"]]
+
+
+def test_index_keeps_no_copy_of_the_text_and_follows_edits(server):
+    user_id = str(uuid.uuid4())
+    server._insert_learning_history(
+        {"id": "search-1", "user_id": user_id, "topic": "graphs", "question": "shortest paths", "response": "use dijkstra", "created_at": "2026-01-01"}
+    )
+
+    assert _search(server, user_id, "dijkstra") == ["search-1"]
+    with server._sqlite_write_connection() as conn:
+        conn.execute("UPDATE learning_history SET response = 'use bellman ford' WHERE id = 'search-1'")
+    assert _search(server, user_id, "dijkstra") == []
+    assert _search(server, user_id, "bellman") == ["search-1"]
+    with server._sqlite_write_connection() as conn:
+        conn.execute("DELETE FROM learning_history WHERE id = 'search-1'")
+    assert _search(server, user_id, "bellman") == []
+
+    with server._sqlite_connection() as conn:
+        # Only the index b-tree and its bookkeeping; no %_content table.
+        shadow = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'search_fts_%'")}
+    assert "search_fts_content" not in shadow
+    assert server.check_search_index()["fts_integrity"] == "ok"
@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+import io
+
+import pytest
+
+
+def _upload(server, data: bytes):
+    return server._ReceivedUpload(io.BytesIO(data), len(data), hashlib.sha256(data).hexdigest())
+
+
+def test_shared_extraction_outlives_the_request_that_started_it(server, monkeypatch):
+    data = b"lecture notes " + bytes(range(16))
+    reads = []
+
+    async def slow_extract(fmt, path, wait=False):
+        await asyncio.sleep(0.2)
+        with open(path, "rb") as fh:
+            reads.append(fh.read())
+        return "extracted text"
+
+    monkeypatch.setattr(server, "extract_document_text", slow_extract)
+
+    async def main():
+        leader_upload, follower_upload = _upload(server, data), _upload(server, data)
+
+        async def request(upload):
+            async with upload:
+                return await server.extract_upload_text(upload, "pdf")
+
+        leader = asyncio.create_task(request(leader_upload))
+        await asyncio.sleep(0.05)
+        follower = asyncio.create_task(request(follower_upload))
+        await asyncio.sleep(0.05)
+        leader.cancel()  # its client went away mid-extraction
+        text = await follower
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return text
+
+    assert asyncio.run(main()) == "extracted text"
+    assert reads == [data]
+
+
+def test_receive_upload_hashes_in_place_and_enforces_the_limit(server):
+    class _File:
+        def __init__(self, data):
+            self.file = io.BytesIO(data)
+            self.size = None
+
+    async def main():
+        upload = await server.receive_upload(_File(b"x" * 10), 1)
+        with pytest.raises(server.HTTPException) as too_large:
+            await server.receive_upload(_File(b"x" * (1024 * 1024 + 1)), 1)
+        with pytest.raises(server.HTTPException) as empty:
+            await server.receive_upload(_File(b""), 1)
+        return upload, too_large.value, empty.value
+
+    upload, too_large, empty = asyncio.run(main())
+
+    assert (upload.size, upload.sha256) == (10, hashlib.sha256(b"x" * 10).hexdigest())
+    assert upload.file.tell() == 0
+    assert too_large.status_code == 413
+    assert empty.status_code == 400
+
+
+def test_concurrent_identical_uploads_store_one_file(server, tmp_path):
+    data = b"resume " + bytes(range(64))
+
+    async def main():
+        return await asyncio.gather(*(server.store_upload_blob(_upload(server, data), tmp_path, "pdf") for _ in range(3)))
+
+    paths = asyncio.run(main())
+
+    assert len(set(paths)) == 1
+    assert [p.name for p in tmp_path.iterdir()] == [f"{hashlib.sha256(data).hexdigest()}.pdf"]
+
+
+def test_blob_pruned_after_the_check_is_written_again(server, tmp_path, monkeypatch):
+    data = b"pruned " + bytes(range(32))
+    monkeypatch.setattr(server, "_stored_upload_blob", lambda sha256: "/gone/elsewhere.pdf")
+
+    path = asyncio.run(server.store_upload_blob(_upload(server, data), tmp_path, "pdf"))
+
+    with open(path, "rb") as fh:
+        assert fh.read() == data
+    assert len(list(tmp_path.iterdir())) == 1
@@ -0,0 +1,98 @@
+"""Load-test get_ai_response offline against the fake AI provider.
+
+Runs the backend with AI_MODE=fake, so every request goes through the shared
+async client, concurrency limit and timeouts without touching the network,
+then prints throughput, latency percentiles and the provider's client stats.
+With --backends, requests are routed over several fake backends (the second
+one --slow-factor times slower) to watch the router's traffic split.
+Uses a throwaway SQLite database.
+
+Requires the backend dependencies (it imports backend/server.py).
+
+Usage:
+    python tools/bench_ai_clients.py
+    python tools/bench_ai_clients.py --requests 2000 --concurrency 200 --latency-ms 500 --limit 32
+    python tools/bench_ai_clients.py --backends 2 --slow-factor 3
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_server(db_path: Path, args):
+    os.environ["SQLITE_DB_PATH"] = str(db_path)
+    os.environ["AI_MODE"] = "fake"
+    os.environ["AI_FAKE_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["AI_FAKE_JITTER_MS"] = str(args.jitter_ms)
+    os.environ["AI_FAKE_ERROR_RATE"] = str(args.error_rate)
+    os.environ["AI_FAKE_MAX_CONCURRENCY"] = str(args.limit)
+    names = ["fake"] + [f"fake_{i}" for i in range(2, args.backends + 1)]
+    os.environ["AI_PROVIDERS"] = ",".join(names)
+    for i, name in enumerate(names[1:]):
+        os.environ[f"AI_{name.upper()}_MAX_CONCURRENCY"] = str(args.limit)
+        os.environ[f"AI_{name.upper()}_FAKE_LATENCY_MS"] = str(args.latency_ms * (args.slow_factor if i == 0 else 1))
+    sys.path.insert(0, str(ROOT / "backend"))
+    import server  # noqa: E402  (needs the environment set first)
+
+    return server
+
+
+def _percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def _run(server, requests: int, concurrency: int) -> None:
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await server.get_ai_response(f"Explain topic {i} step by step", f"bench-{i}")
+            samples.append((time.perf_counter() - started) * 1000.0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+
+    print(f"{requests} requests in {elapsed:.2f}s ({requests / elapsed:.1f} req/s)")
+    print(f"latency ms: p50 {_percentile(samples, 50):.1f}  p99 {_percentile(samples, 99):.1f}  mean {statistics.mean(samples):.1f}")
+    for name, stats in server.ai_provider_stats().items():
+        print(f"{name}: " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+    if len(server._ai_router.names) > 1:
+        for name, stats in server._ai_router.stats()["backends"].items():
+            print(f"router {name}: " + ", ".join(f"{key}={value}" for key, value in stats.items()))
+    await server.close_ai_providers()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="total requests (default: 500)")
+    parser.add_argument("--concurrency", type=int, default=100, help="requests in flight from the caller (default: 100)")
+    parser.add_argument("--limit", type=int, default=16, help="provider concurrency limit (default: 16)")
+    parser.add_argument("--latency-ms", type=float, default=300, help="simulated provider latency (default: 300)")
+    parser.add_argument("--jitter-ms", type=float, default=100, help="latency jitter, +/- (default: 100)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 500 (default: 0)")
+    parser.add_argument("--backends", type=int, default=1, help="fake backends behind the router (default: 1)")
+    parser.add_argument("--slow-factor", type=float, default=3.0, help="latency multiplier of the second backend (default: 3)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = _load_server(Path(tmp) / "bench.db", args)
+        asyncio.run(_run(server, args.requests, args.concurrency))
+        server._sqlite_pool.close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
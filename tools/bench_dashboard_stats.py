@@ -0,0 +1,147 @@
+"""Benchmark /dashboard/stats aggregation: legacy per-metric path vs get_user_stats.
+
+Seeds a throwaway SQLite database (never the real one), then times both paths
+for the same user and prints p50/p99 latency. The legacy path is the sequence
+of awaits get_dashboard_stats used to make, one thread hop and query each.
+
+Requires the backend dependencies (it imports backend/server.py).
+
+Usage:
+    python tools/bench_dashboard_stats.py
+    python tools/bench_dashboard_stats.py --rows 5000 --iterations 300 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _load_server(db_path: Path):
+    os.environ["SQLITE_DB_PATH"] = str(db_path)
+    sys.path.insert(0, str(ROOT / "backend"))
+    import server  # noqa: E402  (needs SQLITE_DB_PATH set first)
+
+    return server
+
+
+def _seed(server, users: int, rows: int) -> str:
+    """Insert `rows` history rows per table for each of `users` users; return one user id."""
+    now = datetime.now(timezone.utc)
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    with server._sqlite_write_connection() as conn:
+        for user_id in user_ids:
+            conn.execute(
+                "INSERT INTO users (id, email, password, name, role, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, f"{user_id}@bench.local", "x", "bench", "student", now.isoformat()),
+            )
+            for i in range(rows):
+                ts = (now - timedelta(minutes=37 * i)).isoformat()
+                conn.execute(
+                    "INSERT INTO code_evaluations (id, user_id, code, language, evaluation, passed, score, created_at) VALUES (?, ?, '', 'python', '', ?, ?, ?)",
+                    (str(uuid.uuid4()), user_id, random.random() < 0.6, random.randint(0, 100), ts),
+                )
+                conn.execute(
+                    "INSERT INTO learning_history (id, user_id, topic, question, response, created_at) VALUES (?, ?, 'arrays', 'q', 'r', ?)",
+                    (str(uuid.uuid4()), user_id, ts),
+                )
+                if i % 10 == 0:
+                    conn.execute(
+                        "INSERT INTO resume_analyses (id, user_id, filename, credibility_score, created_at) VALUES (?, ?, 'cv.pdf', ?, ?)",
+                        (str(uuid.uuid4()), user_id, random.randint(0, 100), ts),
+                    )
+                    conn.execute(
+                        "INSERT INTO interview_evaluations (id, user_id, interview_type, readiness_score, created_at) VALUES (?, ?, 'technical', ?, ?)",
+                        (str(uuid.uuid4()), user_id, random.randint(0, 100), ts),
+                    )
+        # Rows were inserted directly, so backfill the user_stats rollup.
+        server._rebuild_user_stats(conn)
+        conn.execute("ANALYZE")
+    return user_ids[0]
+
+
+async def _legacy(server, user_id: str) -> dict:
+    return {
+        "code_submissions": await server.count_code_submissions(user_id),
+        "avg_code_score": await server.get_avg_code_score(user_id),
+        "resume_analyses": await server.count_resume_analyses(user_id),
+        "interviews_taken": await server.count_interview_evaluations(user_id),
+        "learning_sessions": await server.count_learning_sessions(user_id),
+        "career_readiness_score": await server.calculate_career_readiness_score(user_id),
+        "learning_streak": await server.get_learning_streak_stats(user_id),
+        "learning_consistency": await server.calculate_learning_consistency(user_id),
+        "login_streak": await asyncio.to_thread(server._get_login_streak_for_ui, user_id),
+        "coding_streak": await asyncio.to_thread(server._get_coding_streak_for_ui, user_id),
+    }
+
+
+async def _aggregated(server, user_id: str) -> dict:
+    return await server.get_user_stats(user_id)
+
+
+async def _time(fn, iterations: int, concurrency: int) -> list:
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await fn()
+            samples.append((time.perf_counter() - started) * 1000.0)
+
+    await asyncio.gather(*(one() for _ in range(iterations)))
+    return samples
+
+
+def _percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def _run(server, user_id: str, iterations: int, concurrency: int) -> None:
+    legacy = await _legacy(server, user_id)
+    aggregated = await _aggregated(server, user_id)
+    mismatched = [key for key, value in legacy.items() if aggregated.get(key) != value]
+    print(f"results match legacy path: {'yes' if not mismatched else 'NO ' + ', '.join(mismatched)}")
+
+    # Warm the connection pool and page cache before measuring.
+    await _time(lambda: _legacy(server, user_id), 10, concurrency)
+    await _time(lambda: _aggregated(server, user_id), 10, concurrency)
+
+    print(f"{'path':<12} {'p50 ms':>10} {'p99 ms':>10} {'mean ms':>10}")
+    for name, fn in (("legacy", _legacy), ("aggregated", _aggregated)):
+        samples = await _time(lambda fn=fn: fn(server, user_id), iterations, concurrency)
+        print(
+            f"{name:<12} {_percentile(samples, 50):>10.2f} {_percentile(samples, 99):>10.2f} {statistics.mean(samples):>10.2f}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="users to seed (default: 50)")
+    parser.add_argument("--rows", type=int, default=1000, help="history rows per user and table (default: 1000)")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per path (default: 200)")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent calls in flight (default: 4)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = _load_server(Path(tmp) / "bench.db")
+        print(f"seeding {args.users} users x {args.rows} rows ...")
+        user_id = _seed(server, args.users, args.rows)
+        asyncio.run(_run(server, user_id, args.iterations, args.concurrency))
+        server._sqlite_pool.close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""Run EXPLAIN QUERY PLAN on every SQL statement in backend/server.py.
+
+The schema is rebuilt in an in-memory database from the CREATE/ALTER
+statements found in server.py (tables, then migrations in source order), so
+the tool needs no backend dependencies and never touches a real database.
+
+Usage:
+    python tools/explain_queries.py            # report every statement
+    python tools/explain_queries.py --scans    # only statements with full scans
+    python tools/explain_queries.py --strict   # exit 1 when a full scan is found
+"""
+
+import argparse
+import ast
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SERVER_PY = ROOT / "backend" / "server.py"
+
+QUERY_RE = re.compile(r"^\s*(SELECT|WITH|UPDATE|DELETE|INSERT|REPLACE)\b", re.I)
+SCHEMA_RE = re.compile(r"^\s*(CREATE\s+(TABLE|INDEX|UNIQUE\s+INDEX|VIRTUAL\s+TABLE|TRIGGER)|ALTER\s+TABLE)\b", re.I)
+# "SCAN users" is a full table scan; "SCAN users USING INDEX ..." walks an index
+# and "SCAN docs_fts VIRTUAL TABLE INDEX 0:M..." is an FTS5 MATCH lookup.
+FULL_SCAN_RE = re.compile(r"^SCAN (\w+)(?! USING)(?!.*COVERING INDEX)(?!.*VIRTUAL TABLE INDEX \d+:\S*M)")
+
+
+def _literal_sql(node: ast.AST):
+    """Return the SQL text of a string constant or f-string, else None.
+
+    f-string fields are replaced with "?" so IN (...) lists still explain; a
+    field used as an identifier (e.g. a table name) makes the statement fail
+    to prepare and it is reported as dynamic.
+    """
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value, False
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(str(value.value))
+            else:
+                parts.append("?")
+        return "".join(parts), True
+    return None
+
+
+def collect_statements(source: str):
+    """Schema statements are any CREATE/ALTER string (migrations keep them in
+    lists); queries are the first argument of conn.execute()/executemany()."""
+    schema, queries = [], []
+    tree = ast.parse(source)
+    for node in ast.walk(tree):
+        found = _literal_sql(node)
+        if found is not None and not found[1] and SCHEMA_RE.match(found[0]):
+            schema.append((node.lineno, found[0]))
+
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)):
+            continue
+        if node.func.attr not in ("execute", "executemany") or not node.args:
+            continue
+        found = _literal_sql(node.args[0])
+        if found is None:
+            continue
+        sql, dynamic = found
+        if QUERY_RE.match(sql):
+            queries.append((node.args[0].lineno, sql.strip(), dynamic))
+    schema.sort()
+    queries.sort()
+    return schema, queries
+
+
+def build_schema(schema) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    # Tables first so indexes and ALTERs declared earlier in the file resolve.
+    ordered = sorted(schema, key=lambda item: (0 if re.match(r"\s*CREATE\s+TABLE", item[1], re.I) else 1, item[0]))
+    for _, sql in ordered:
+        try:
+            conn.executescript(sql)
+        except sqlite3.Error:
+            # Duplicate columns from "safe" ALTERs and the like.
+            pass
+    conn.execute("ANALYZE")
+    return conn
+
+
+def explain(conn: sqlite3.Connection, sql: str):
+    named = set(re.findall(r"(?<![:\w]):([A-Za-z_]\w*)", sql))
+    params = {name: None for name in named} if named else [None] * sql.count("?")
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return [row[3] for row in rows]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scans", action="store_true", help="only print statements with full table scans")
+    parser.add_argument("--strict", action="store_true", help="exit with status 1 if any full scan is found")
+    args = parser.parse_args()
+
+    schema, queries = collect_statements(SERVER_PY.read_text(encoding="utf-8"))
+    conn = build_schema(schema)
+
+    # Only real tables count; subqueries and CONSTANT ROW also show up as "SCAN x".
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    scans, skipped = [], []
+    for lineno, sql, dynamic in queries:
+        try:
+            plan = explain(conn, sql)
+        except sqlite3.Error as e:
+            skipped.append((lineno, "dynamic SQL" if dynamic else str(e)))
+            continue
+
+        flagged = sorted({m.group(1) for detail in plan if (m := FULL_SCAN_RE.match(detail)) and m.group(1) in tables})
+        if flagged:
+            scans.append((lineno, flagged))
+        if args.scans and not flagged:
+            continue
+
+        marker = "FULL SCAN " + ", ".join(flagged) if flagged else "ok"
+        print(f"server.py:{lineno}: {marker}")
+        print("    " + " ".join(sql.split())[:160])
+        for detail in plan:
+            print(f"      {detail}")
+
+    print()
+    print(f"{len(queries)} statements, {len(scans)} with full scans, {len(skipped)} skipped")
+    for lineno, reason in skipped:
+        print(f"  skipped server.py:{lineno}: {reason}")
+
+    return 1 if args.strict and scans else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
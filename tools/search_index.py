@@ -0,0 +1,59 @@
+"""Rebuild or verify the full-text search index and the tutor context chunks.
+
+search_fts/search_docs (behind /api/search) and tutor_context_chunks are
+maintained by triggers and the backend's write helpers; use this after bulk
+imports or manual SQL edits, or after changing the tokenizer or chunk size.
+
+Requires the backend dependencies (it imports backend/server.py) and uses the
+same database as the server (SQLITE_DB_PATH / backend/.env).
+
+Usage:
+    python tools/search_index.py check             # exit 1 on drift or corruption
+    python tools/search_index.py rebuild           # re-index every searchable row
+    python tools/search_index.py rebuild-chunks    # re-chunk every tutor context
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["check", "rebuild", "rebuild-chunks"])
+    args = parser.parse_args()
+
+    import server  # noqa: E402
+
+    try:
+        if args.command == "rebuild-chunks":
+            contexts = server.rebuild_tutor_context_chunks()
+            print(f"re-chunked {contexts} tutor context(s) in {server.SQLITE_DB_PATH}")
+            return 0
+
+        if args.command == "rebuild":
+            counts = server.rebuild_search_index()
+            print(f"re-indexed {', '.join(f'{rows} {kind}' for kind, rows in counts.items())} row(s) in {server.SQLITE_DB_PATH}")
+            return 0
+
+        result = server.check_search_index()
+        integrity = result.pop("fts_integrity")
+        drift = 0
+        for kind, counts in result.items():
+            ok = counts["rows"] == counts["indexed"]
+            drift += 0 if ok else 1
+            print(f"{kind}: {counts['rows']} row(s), {counts['indexed']} indexed{'' if ok else '  MISMATCH'}")
+        print(f"fts integrity: {integrity}")
+        return 1 if drift or integrity != "ok" else 0
+    except server.sqlite3.OperationalError as e:
+        print(f"search index unavailable: {e}")
+        return 1
+    finally:
+        server._sqlite_pool.close_all()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
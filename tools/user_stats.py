@@ -0,0 +1,58 @@
+"""Rebuild or verify the user_stats and activity_daily rollup tables.
+
+Both are maintained incrementally by the backend's write helpers; use this
+after bulk imports or manual SQL edits, or to audit drift.
+
+Requires the backend dependencies (it imports backend/server.py) and uses the
+same database as the server (SQLITE_DB_PATH / backend/.env).
+
+Usage:
+    python tools/user_stats.py check                 # exit 1 on any mismatch
+    python tools/user_stats.py check --user USER_ID
+    python tools/user_stats.py rebuild               # recompute every user
+    python tools/user_stats.py rebuild --user USER_ID
+    python tools/user_stats.py rebuild-activity      # recompute analytics trends
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "backend"))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["check", "rebuild", "rebuild-activity"])
+    parser.add_argument("--user", help="limit to one user id")
+    parser.add_argument("--limit", type=int, default=50, help="max mismatches to print (default: 50)")
+    args = parser.parse_args()
+
+    import server  # noqa: E402
+
+    try:
+        if args.command == "rebuild-activity":
+            rows = server.rebuild_activity_daily()
+            print(f"rebuilt activity_daily ({rows} day bucket(s)) in {server.SQLITE_DB_PATH}")
+            return 0
+
+        if args.command == "rebuild":
+            rows = server.rebuild_user_stats(args.user)
+            print(f"rebuilt user_stats for {rows} user(s) in {server.SQLITE_DB_PATH}")
+            return 0
+
+        mismatches = server.check_user_stats(args.user)
+        for entry in mismatches[: args.limit]:
+            print(f"{entry['user_id']}: {entry['field']} expected={entry['expected']} actual={entry['actual']}")
+        if len(mismatches) > args.limit:
+            print(f"... {len(mismatches) - args.limit} more")
+        users = len({entry["user_id"] for entry in mismatches})
+        print(f"{len(mismatches)} mismatched field(s) across {users} user(s)")
+        return 1 if mismatches else 0
+    finally:
+        server._sqlite_pool.close_all()
+
+
+if __name__ == "__main__":
+    sys.exit(main())